@@ -1,4 +1,5 @@
 from civilaviation import Airport, Route
 from ctripcrawler import CtripCrawler, CtripSearcher, ItineraryCollector
 from rebuilder import Rebuilder
+from columnstore import ColumnStore
 from civilaviation import airport_throughput, city_class, city_location, tourism, skipped_routes
@@ -0,0 +1,302 @@
+__all__ = ('Partial', 'QuantileSketch')
+
+from json import dumps, loads
+from os import replace
+from typing import Iterable
+from numpy import ndarray, array, asarray, ceil, concatenate, cumsum, exp, float64, floor, full, iinfo, int32, int64, \
+    load, log, nan, savez_compressed, searchsorted, sqrt, unique, where
+from pandas import CategoricalDtype, DataFrame, Index, MultiIndex, Series, concat
+from pathlib import Path
+
+def _plain(index: Index) -> Index:
+    '''Index with categorical levels as `object`, so that groups of chunks in different
+    categories are concatenated and sorted the same as grouped together'''
+    if isinstance(index, MultiIndex):
+        return index.set_levels([level.astype(object) if isinstance(level.dtype, CategoricalDtype) else level \
+            for level in index.levels], verify_integrity = False)
+    return index.astype(object) if isinstance(index.dtype, CategoricalDtype) else index
+
+def _save(path: Path | str, frames: dict[str, DataFrame], meta: dict) -> Path:
+    '''Write `frames` (with their indexes as columns) and `meta` to a compressed `numpy` archive 
+    replaced as a whole, names are stored as codes with categories as `MomentStore`'''
+    columns = {'meta': array(dumps(dict(meta, frames = {name: [list(key) if isinstance(key, tuple) else key \
+        for key in frame.keys()] for name, frame in frames.items()}), ensure_ascii = False))}
+    for name, frame in frames.items():
+        for idx, key in enumerate(frame.keys()):
+            values = frame[key]
+            if values.dtype == object or isinstance(values.dtype, CategoricalDtype):
+                categories, codes = unique(asarray(values, dtype = str), return_inverse = True)
+                columns[f'{name}.{idx}'], columns[f'{name}.{idx}.categories'] = codes.astype(int32), categories
+            else:
+                columns[f'{name}.{idx}'] = values.to_numpy()
+    path = Path(path)
+    with open(path.with_suffix('.tmp'), 'wb') as file:
+        savez_compressed(file, **columns)
+    replace(path.with_suffix('.tmp'), path)
+    return path
+
+def _load(path: Path | str) -> tuple[dict[str, DataFrame], dict]:
+    '''Frames and meta written by `_save`'''
+    with load(Path(path)) as archive:
+        meta = loads(str(archive['meta']))
+        frames = {}
+        for name, keys in meta.pop('frames').items():
+            columns = {}
+            for idx, key in enumerate(keys):
+                values = archive[f'{name}.{idx}']
+                if f'{name}.{idx}.categories' in archive.files:
+                    values = archive[f'{name}.{idx}.categories'].astype(object)[values]
+                columns[tuple(key) if isinstance(key, list) else key] = values
+            frames[name] = DataFrame(columns, columns = [tuple(key) if isinstance(key, list) else key for key in keys])
+    return frames, meta
+
+class QuantileSketch():
+    '''
+    Quantile sketch
+    =====
+    Counts of values by group in buckets of logarithmic width (as `DDSketch`), 
+    so that every quantile of a group is within a relative `accuracy` of the exact one 
+    (interpolated between ranks as `Series.quantile`), whatever the number of values.
+    
+    Sketches of chunks, processes or collect dates are merged by adding up counts (`merge`), 
+    and persisted by `save` and `load`. Values are positive or `0` (e.g. rates), 
+    missing values are skipped.
+    
+    Parameters
+    -----
+    - keys: columns to group by, e.g. `route`
+    - accuracy: `float`, relative error of quantiles, buckets of each group are as many as 
+    `log(max / min) / (2 * accuracy)` at most, e.g. 3,500 for rates from `1%` to `1000%` at `0.1%`.
+    '''
+    zero = int(iinfo(int32).min)
+    
+    def __init__(self, keys: Iterable[str], accuracy: float = 0.001) -> None:
+        if not 0 < accuracy < 1:
+            raise ValueError("ERROR: Accuracy of sketches should be between 0 and 1!")
+        self.keys = list(keys)
+        self.accuracy = accuracy
+        self.__gamma = (1 + accuracy) / (1 - accuracy)
+        self.counts: Series | None = None
+    
+    def add(self, data: DataFrame, column: str) -> 'QuantileSketch':
+        '''Add values of `column` of a chunk of rows.
+        
+        Return the sketch itself.'''
+        values = data[column].to_numpy(float64)
+        valid = values == values
+        if not valid.all():
+            data, values = data[valid], values[valid]
+        if (values < 0).any():
+            raise ValueError(f"ERROR: Negative values of {column} cannot be sketched!")
+        buckets, positive = full(len(values), self.zero, int64), values > 0
+        buckets[positive] = ceil(log(values[positive]) / log(self.__gamma))
+        buckets = Series(buckets, index = data.index, name = 'bucket')
+        counts = buckets.groupby([data[key] for key in self.keys] + [buckets], observed = True).size()
+        counts.index = _plain(counts.index)
+        return self.__combine(counts)
+    
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        '''Add counts of another sketch of the same keys and accuracy.
+        
+        Return the sketch itself.'''
+        if other.keys != self.keys or other.accuracy != self.accuracy:
+            raise ValueError("ERROR: Sketches of different keys or accuracy cannot be merged!")
+        return self if other.counts is None else self.__combine(other.counts)
+    
+    def quantile(self, q: float = 0.5) -> Series:
+        '''Quantile `q` of each group, indexed by sorted groups of `keys`'''
+        if self.counts is None:
+            return Series(dtype = float64, index = MultiIndex.from_arrays([[] for _ in self.keys], names = self.keys) \
+                if len(self.keys) > 1 else Index([], name = self.keys[0]))
+        counts = self.counts.to_numpy(int64)
+        groups = self.counts.index.droplevel('bucket')
+        sizes = Series(counts, index = groups).groupby(level = list(range(groups.nlevels)), sort = False).sum()
+        starts = concatenate([[0], cumsum(sizes.to_numpy())[:-1]])
+        rank = q * (sizes.to_numpy() - 1)
+        totals = cumsum(counts)
+        buckets = self.counts.index.get_level_values('bucket').to_numpy()
+        lower, upper = (self.__value(buckets[searchsorted(totals, starts + bound, side = 'right')]) \
+            for bound in (floor(rank), ceil(rank)))
+        return Series(lower + (upper - lower) * (rank - floor(rank)), index = sizes.index)
+    
+    def save(self, path: Path | str) -> Path:
+        '''Write counts to a `.npz` file, see `load`'''
+        frame = DataFrame(columns = self.keys + ['bucket', 'count']) if self.counts is None else \
+            self.counts.rename('count').reset_index()
+        return _save(path, {'counts': frame}, {'keys': self.keys, 'accuracy': self.accuracy})
+    
+    @classmethod
+    def load(cls, path: Path | str) -> 'QuantileSketch':
+        '''Sketch written by `save`'''
+        frames, meta = _load(path)
+        sketch = cls(meta['keys'], meta['accuracy'])
+        if len(frames['counts']):
+            sketch.counts = frames['counts'].set_index(sketch.keys + ['bucket'])['count']
+        return sketch
+    
+    def __value(self, buckets: ndarray) -> ndarray:
+        '''Value of buckets with the least relative error to all values in them'''
+        return where(buckets == self.zero, 0, 2 * exp(buckets * log(self.__gamma)) / (self.__gamma + 1))
+    
+    def __combine(self, counts: Series) -> 'QuantileSketch':
+        if self.counts is None:
+            self.counts = counts.sort_index()
+        else:
+            self.counts = concat([self.counts, counts]).groupby(level = list(range(counts.index.nlevels)), sort = True).sum()
+        return self
+
+class Partial():
+    '''
+    Partial aggregate
+    =====
+    Grouped statistics accumulated chunk by chunk (`add`) or from other partials (`merge`),
+    without keeping any row: only counts, sums and sums of squared deviations of values by group
+    (added up as parallel variances, so that constant groups are exactly `0`),
+    distinct values of columns counted as unique by group, and quantile sketches of columns.
+
+    `result` is the same as `groupby(keys, observed = True).agg(**aggregations)` of all rows,
+    within rounding errors of the sums, and within the relative `accuracy` for quantiles.
+    Partials are persisted by `save` and `load`, e.g. to add new collect dates later.
+
+    Parameters
+    -----
+    - keys: columns to group by, e.g. `route`
+    - accuracy: `float`, relative error of quantiles, see `QuantileSketch`
+    - aggregations: `(column, function)` of each result column by name,
+    function is one of `size`, `count`, `sum`, `mean`, `var`, `std`, `nunique` and `median`,
+    or a quantile from `0` to `1`, e.g. `mean = ('price_rate', 'mean')`, `p90 = ('price_rate', 0.9)`
+
+    Distinct values are kept for `nunique` (e.g. flight dates of each route),
+    which are as many as groups by days at most, instead of rows.
+    '''
+    functions = ('size', 'count', 'sum', 'mean', 'var', 'std', 'nunique', 'median')
+
+    def __init__(self, keys: Iterable[str], accuracy: float = 0.001, **aggregations: tuple[str, str | float]) -> None:
+        self.keys = list(keys)
+        self.accuracy = accuracy
+        self.aggregations = aggregations
+        for column, function in aggregations.values():
+            if function not in self.functions and not (isinstance(function, (int, float)) and 0 <= function <= 1):
+                raise ValueError(f"ERROR: {function} of {column} cannot be aggregated by parts!")
+        self.columns = sorted(set(column for column, _ in aggregations.values()))
+        self.__sums = sorted(set(column for column, function in aggregations.values() if function in ('count', 'sum', 'mean', 'var', 'std')))
+        self.__distinct = sorted(set(column for column, function in aggregations.values() if function == 'nunique'))
+        self.__quantiles = sorted(set(column for column, function in aggregations.values() \
+            if function == 'median' or not isinstance(function, str)))
+        self.__stats: DataFrame | None = None
+        self.__pairs: dict[str, DataFrame] = {}
+        self.__sketches = {column: QuantileSketch(self.keys, accuracy) for column in self.__quantiles}
+
+    def add(self, data: DataFrame) -> 'Partial':
+        '''Add statistics of a chunk of rows with `columns`,
+        groups of derived columns (e.g. daily density) should be whole in the chunk.
+
+        Return the partial itself.'''
+        keys = [data[key] for key in self.keys]
+        stats = {('', 'size'): data.groupby(keys, observed = True).size()}
+        for column in self.__sums:
+            values = data[column].astype(float64)
+            groups = values.groupby(keys, observed = True)
+            stats[(column, 'count')] = groups.count()
+            stats[(column, 'sum')] = groups.sum()
+            stats[(column, 'deviations')] = (groups.var(ddof = 0) * stats[(column, 'count')]).fillna(0)
+        stats = DataFrame(stats)
+        stats.index = _plain(stats.index)
+        pairs = {}
+        for column in self.__distinct:
+            pairs[column] = data[self.keys + [column]].drop_duplicates()
+            for key in pairs[column].keys():
+                if isinstance(pairs[column][key].dtype, CategoricalDtype):
+                    pairs[column][key] = pairs[column][key].astype(object)
+        for column in self.__quantiles:
+            self.__sketches[column].add(data, column)
+        return self.__combine(stats, pairs)
+
+    def merge(self, other: 'Partial') -> 'Partial':
+        '''Add statistics of another partial of the same keys and aggregations,
+        e.g. of other chunks in another process.
+
+        Return the partial itself.'''
+        if other.keys != self.keys or other.aggregations != self.aggregations or other.accuracy != self.accuracy:
+            raise ValueError("ERROR: Partials of different aggregations cannot be merged!")
+        if other.__stats is None:
+            return self
+        for column, sketch in other.__sketches.items():
+            self.__sketches[column].merge(sketch)
+        return self.__combine(other.__stats, other.__pairs)
+
+    def result(self) -> DataFrame:
+        '''Aggregations of all rows added, indexed by sorted groups of `keys`'''
+        if self.__stats is None:
+            return DataFrame(columns = list(self.aggregations.keys()),
+                             index = MultiIndex.from_arrays([[] for _ in self.keys], names = self.keys) \
+                                if len(self.keys) > 1 else Index([], name = self.keys[0]))
+        stats, columns = self.__stats, {}
+        for name, (column, function) in self.aggregations.items():
+            if function == 'size':
+                columns[name] = stats[('', 'size')]
+                continue
+            if function == 'nunique':
+                pairs = self.__pairs[column]
+                counts = pairs.groupby(self.keys)[column].count()
+                counts.index = counts.index.set_names(stats.index.names)
+                columns[name] = counts.reindex(stats.index, fill_value = 0)
+                continue
+            if function == 'median' or not isinstance(function, str):
+                quantiles = self.__sketches[column].quantile(0.5 if function == 'median' else function)
+                quantiles.index = quantiles.index.set_names(stats.index.names)
+                columns[name] = quantiles.reindex(stats.index)
+                continue
+            n, total, deviations = (stats[(column, stat)] for stat in ('count', 'sum', 'deviations'))
+            if function == 'count':
+                columns[name] = n
+            elif function == 'sum':
+                columns[name] = total
+            elif function == 'mean':
+                columns[name] = (total / n).where(n > 0, nan)
+            else:
+                var = (deviations / (n - 1)).where(n > 1, nan)
+                columns[name] = var if function == 'var' else sqrt(var)
+        return DataFrame(columns, index = stats.index)
+
+    def save(self, path: Path | str) -> Path:
+        '''Write statistics, distinct values and sketches to a `.npz` file, see `load`'''
+        frames = {} if self.__stats is None else {'stats': self.__stats.reset_index()}
+        frames.update((f'pairs.{column}', pairs) for column, pairs in self.__pairs.items())
+        frames.update((f'sketch.{column}', sketch.counts.rename('count').reset_index()) \
+            for column, sketch in self.__sketches.items() if sketch.counts is not None)
+        return _save(path, frames, {'keys': self.keys, 'accuracy': self.accuracy, 
+                                    'aggregations': {name: list(item) for name, item in self.aggregations.items()}})
+
+    @classmethod
+    def load(cls, path: Path | str) -> 'Partial':
+        '''Partial written by `save`'''
+        frames, meta = _load(path)
+        partial = cls(meta['keys'], meta['accuracy'], **{name: tuple(item) for name, item in meta['aggregations'].items()})
+        if 'stats' in frames:
+            stats = frames['stats'].set_index([(key, '') for key in partial.keys])
+            stats.index.names, stats.columns = partial.keys, MultiIndex.from_tuples(stats.columns)
+            partial.__stats = stats
+        for name, frame in frames.items():
+            if name.startswith('pairs.'):
+                partial.__pairs[name[6:]] = frame
+            elif name.startswith('sketch.'):
+                partial.__sketches[name[7:]].counts = frame.set_index(partial.keys + ['bucket'])['count']
+        return partial
+
+    def __combine(self, stats: DataFrame, pairs: dict[str, DataFrame]) -> 'Partial':
+        '''Add up statistics by group, with squared deviations of both parts about their own means 
+        and of the means about the mean of the whole, and union distinct values'''
+        if self.__stats is None:
+            self.__stats, self.__pairs = stats, dict(pairs)
+            return self
+        this, other = self.__stats.align(stats, join = 'outer', fill_value = 0)
+        combined = this + other
+        for column in self.__sums:
+            n, m = this[(column, 'count')], other[(column, 'count')]
+            delta = (other[(column, 'sum')] / m - this[(column, 'sum')] / n).where((n > 0) & (m > 0), 0)
+            combined[(column, 'deviations')] += delta * delta * n * m / combined[(column, 'count')].where(n * m > 0, 1)
+        self.__stats = combined.sort_index()
+        for column, pair in pairs.items():
+            self.__pairs[column] = concat([self.__pairs[column], pair], ignore_index = True).drop_duplicates()
+        return self
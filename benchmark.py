@@ -0,0 +1,342 @@
+__all__ = ('Campaign', 'Benchmark', 'scales', 'operations')
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import date, datetime, time
+from io import StringIO
+from json import dumps, loads
+from os import cpu_count
+from pathlib import Path
+from platform import platform, python_version
+from statistics import median
+import subprocess
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from types import SimpleNamespace
+from warnings import filterwarnings
+from zipfile import ZipFile, ZIP_DEFLATED
+import tracemalloc
+from numpy import random as nprandom, arange, exp, repeat, tile, where
+from pandas import DataFrame, concat
+from civilaviation import Airport, Route
+from ctripcrawler import CtripCrawler
+from rebuilder import Rebuilder
+import numpy
+import openpyxl
+import pandas
+
+'''Cities of one airport each (`Airport` by city name), and airlines by market share'''
+_cities = (
+    '广州', '深圳', '西安', '重庆', '昆明', '杭州', '乌鲁木齐', '海口', '哈尔滨', '郑州',
+    '南京', '厦门', '三亚', '青岛', '大连', '武汉', '福州', '天津', '兰州', '无锡',
+    '拉萨', '泉州', '长沙', '贵阳', '沈阳', '长春', '济南', '合肥', '南宁', '太原')
+_airlines = (
+    '南方航空', '东方航空', '中国国航', '海南航空', '四川航空', '厦门航空', '深圳航空', '吉祥航空',
+    '上海航空', '春秋航空', '山东航空', '首都航', '中国联合航空', '天津航', '祥鹏航空', '成都航空')
+_day_week = {1: '星期一', 2: '星期二', 3: '星期三', 4: '星期四', 5: '星期五', 6: '星期六', 7: '星期日'}
+
+'''Campaign parameters (see `Campaign`) by scale'''
+scales = {
+    'small': {'routes': 6, 'airlines': 4, 'days': 14, 'colls': 5, 'flights': 2},
+    'medium': {'routes': 15, 'airlines': 8, 'days': 30, 'colls': 10, 'flights': 2},
+    'large': {'routes': 30, 'airlines': 12, 'days': 45, 'colls': 20, 'flights': 3}}
+
+'''Benchmarked operations by name: (load merged data before timing, call on `Rebuilder`);
+`merge` and `append_zip` time loading and parsing the excels of the campaign'''
+operations = {
+    'merge': (False, lambda rebuild, context: (rebuild.append_folder(), rebuild.merge(context.workers))),
+    'append_zip': (False, lambda rebuild, context: (rebuild.append_zip(), rebuild.merge(context.workers))),
+    'append_data': (False, lambda rebuild, context: rebuild.append_data(context.data)),
+    'dates': (True, lambda rebuild, context: rebuild.dates(context.path, workers = context.workers)),
+    'routes': (True, lambda rebuild, context: rebuild.routes(context.path, workers = context.workers)),
+    'airlines': (True, lambda rebuild, context: rebuild.airlines(context.path)),
+    'month': (True, lambda rebuild, context: rebuild.month(*context.month, path = context.path, workers = context.workers)),
+    'adv': (True, lambda rebuild, context: rebuild.adv(1, context.days, path = context.path, workers = context.workers)),
+    'week': (True, lambda rebuild, context: rebuild.week(path = context.path, workers = context.workers)),
+    'hour': (True, lambda rebuild, context: rebuild.hour('airline', path = context.path, workers = context.workers))}
+
+class Campaign():
+    '''
+    Synthetic campaign
+    =====
+    Flights of a collection generated at random (by `seed`) for benchmarks,
+    as merged data (see `Rebuilder.append_data`) or as excels of the crawler (see `CtripCrawler.output_excel`).
+
+    - Each city pair is flown both ways by some of the airlines, each with a few flights a day
+    at the same time of departure on all days.
+    - Each collect date collects all flights of the next `days` days.
+    - Rates rise as departure nears, higher on Fridays and Sundays and at peak hours,
+    with noise of each flight and collect date.
+
+    Parameters
+    -----
+    - routes: `int`, number of city pairs, at most 435 (of 30 cities).
+    - airlines: `int`, number of airlines, each pair is flown by 1 ~ `airlines` of them.
+    - days: `int`, days of flight dates collected each collect date.
+    - colls: `int`, number of collect dates, from `starting_date` on.
+    - flights: `int`, flights a day of an airline on a route, 1 ~ `flights`.
+    - starting_date: `date`, the first collect date, default: `2022-02-17`
+    - seed: `int`, seed of the random generator.
+    '''
+    def __init__(self, routes: int = 6, airlines: int = 4, days: int = 14, colls: int = 5,
+                 flights: int = 2, starting_date: date = date(2022, 2, 17), seed: int = 0) -> None:
+        if routes > len(_cities) * (len(_cities) - 1) // 2:
+            raise ValueError(f"ERROR: {routes} routes of {len(_cities)} cities are too many!")
+        if not 0 < airlines <= len(_airlines):
+            raise ValueError(f"ERROR: airlines should be in 1 ~ {len(_airlines)}!")
+        self.routes, self.airlines, self.flights = routes, airlines, flights
+        self.days, self.colls, self.seed = days, colls, seed
+        self.starting_date = starting_date
+        self.__data: DataFrame | None = None
+
+    def __repr__(self) -> str:
+        return "{0}({1})".format(self.__class__.__qualname__, ', '.join(
+            f'{key} = {value!r}' for key, value in self.params.items()))
+
+    @property
+    def params(self) -> dict:
+        return {'routes': self.routes, 'airlines': self.airlines, 'days': self.days,
+                'colls': self.colls, 'flights': self.flights,
+                'starting_date': self.starting_date.isoformat(), 'seed': self.seed}
+
+    @property
+    def last_coll(self) -> date:
+        return date.fromordinal(self.starting_date.toordinal() + self.colls - 1)
+
+    def schedule(self) -> DataFrame:
+        '''Flights of the campaign, one row a day of each'''
+        rng = nprandom.default_rng(self.seed)
+        pairs = [(_cities[i], _cities[j]) for i in range(len(_cities)) for j in range(i + 1, len(_cities))]
+        rows = []
+        for idx in rng.choice(len(pairs), self.routes, replace = False):
+            dep, arr = pairs[idx]
+            fare = Route(dep, arr).airfare or int(rng.integers(80, 300)) * 10
+            duration = int(rng.integers(18, 48)) * 5
+            for airline in rng.choice(self.airlines, rng.integers(1, self.airlines + 1), replace = False):
+                for city, other in ((dep, arr), (arr, dep)):
+                    for minute in rng.choice(range(72, 276), rng.integers(1, self.flights + 1), replace = False):
+                        rows.append((
+                            _airlines[airline], rng.choice(('中', '大', '小'), p = (0.83, 0.16, 0.01)),
+                            city, other, int(minute) * 5, fare, duration, rng.uniform(0.15, 0.5),
+                            Airport(city) + Airport(other)))
+        return DataFrame(rows, columns = (
+            'airline', 'type', 'dep', 'arr', 'minute', 'fare', 'duration', 'base', 'route'))
+
+    def data(self) -> DataFrame:
+        '''Merged data of the campaign, in columns and types of a merged csv'''
+        if self.__data is not None:
+            return self.__data.copy()
+        rng = nprandom.default_rng(self.seed + 1)
+        flights = self.schedule()
+        date_coll = repeat(arange(self.colls) + self.starting_date.toordinal(), self.days)
+        day_adv = tile(arange(1, self.days + 1), self.colls)
+        size = len(flights) * len(day_adv)
+        data = flights.iloc[tile(arange(len(flights)), len(day_adv))].reset_index(drop = True)
+        data['date_coll'] = repeat(date_coll, len(flights))
+        data['day_adv'] = repeat(day_adv, len(flights))
+        data['date_flight'] = data['date_coll'] + data['day_adv']
+        weekday = (data['date_flight'] % 7).replace(0, 7)
+        hour = data['minute'] // 60
+        rate = data['base'] * (1 + 1.2 * exp(-data['day_adv'] / 6)) \
+            * where(weekday.isin((5, 7)), 1.15, where(weekday.isin((2, 3)), 0.9, 1)) \
+            * where(hour.isin((8, 9, 17, 18)), 1.1, where((hour < 7) | (hour > 21), 0.8, 1)) \
+            * exp(rng.normal(0, 0.15, size))
+        data['price_rate'] = rate.clip(0.05, 1).round(2)
+        data['price'] = ((data['fare'] * data['price_rate']) / 10).round().astype('int') * 10
+        data['day_week'] = weekday.map(_day_week)
+        data['time_dep'] = data['minute'].map(lambda x: f'{x // 60:02d}:{x % 60:02d}:00')
+        data['time_arr'] = ((data['minute'] + data['duration']) % 1440).map(lambda x: f'{x // 60:02d}:{x % 60:02d}:00')
+        data['hour_dep'] = hour.replace(0, 24)
+        self.__data = data.sort_values(['date_coll', 'route', 'date_flight', 'minute'], kind = 'stable')[[
+            'date_flight', 'day_week', 'airline', 'type', 'dep', 'arr', 'time_dep', 'time_arr',
+            'price', 'price_rate', 'date_coll', 'day_adv', 'hour_dep', 'route']].reset_index(drop = True)
+        return self.__data.copy()
+
+    def save_data(self, path: Path | str = Path()) -> Path:
+        '''Save merged data as `merged_{starting_date}.csv` in `path`
+
+        Return the path of the csv'''
+        file = Path(path) / f'merged_{self.starting_date.isoformat()}.csv'
+        self.data().to_csv(file, index = False)
+        return file
+
+    def save_excels(self, path: Path | str = Path(), zip: bool = True) -> Path:
+        '''Save the campaign as the crawler does: an excel of each city pair (both ways)
+        in a folder of each collect date, in a folder of `starting_date` in `path`;
+        excels are also archived to `orig.zip` of each folder if `zip`.
+
+        Return the root of the campaign'''
+        root = Path(path) / self.starting_date.isoformat()
+        data = self.data()
+        data['leg'] = data['dep'] > data['arr']
+        data['pair'] = where(data['leg'], data['arr'] + '~' + data['dep'], data['dep'] + '~' + data['arr'])
+        for date_coll, colls in data.groupby('date_coll', sort = True):
+            folder = root / date.fromordinal(date_coll).isoformat()
+            folder.mkdir(parents = True, exist_ok = True)
+            files = []
+            for _, rows in colls.groupby('pair', sort = True):
+                rows = rows.sort_values(['leg', 'date_flight', 'time_dep'], kind = 'stable')
+                datarows = [[
+                    date.fromordinal(row.date_flight), row.day_week, row.airline, row.type, row.dep, row.arr,
+                    time.fromisoformat(row.time_dep), time.fromisoformat(row.time_arr), row.price, row.price_rate]
+                    for row in rows.itertuples(index = False)]
+                files.append(CtripCrawler.output_excel(
+                    datarows, Airport(rows['dep'].iloc[0]).code, Airport(rows['arr'].iloc[0]).code, folder))
+            if zip:
+                with ZipFile(folder / 'orig.zip', 'w', ZIP_DEFLATED) as archive:
+                    for file in files:
+                        archive.write(file, file.name)
+        return root
+
+def _measure(name: str, context: SimpleNamespace, traced: bool) -> tuple[float, int]:
+    '''Run an operation of `operations` once on a new `Rebuilder` in this process,
+    a top-level function for process pools.
+
+    Return seconds and peak bytes allocated by the operation (`0` if not `traced`)'''
+    filterwarnings("ignore")
+    preload, call = operations[name]
+    with redirect_stdout(StringIO()), TemporaryDirectory() as folder:
+        context = SimpleNamespace(**vars(context), path = Path(folder))
+        rebuild = Rebuilder(context.root)
+        if preload:
+            rebuild.append_data(context.data)
+        if traced:
+            tracemalloc.start()
+        start = perf_counter()
+        call(rebuild, context)
+        seconds = perf_counter() - start
+        if traced:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return seconds, peak if traced else 0
+
+class Benchmark():
+    '''
+    Rebuilder benchmark
+    =====
+    Time operations of `Rebuilder` (see `operations`) on synthetic campaigns (see `Campaign`)
+    of several scales, for comparison of versions.
+
+    - Each run of an operation is in a new process on a new `Rebuilder`, so that no data,
+    features or queries are cached from another run; reports are written to a temporary folder.
+    - Peak memory is measured by `tracemalloc` in one more run, as tracing slows operations down:
+    the peak of memory allocated by the operation, not including data loaded before it
+    nor memory of its worker processes.
+
+    Parameters
+    -----
+    - scales: `dict`, keyword arguments of `Campaign` by name of scale, default: `scales`
+    - names: `Iterable[str]`, names of `operations`, default: all
+    - repeat: `int`, timed runs of each operation, the best and the median are reported.
+    - memory: `bool`, measure peak memory.
+    - workers: `int`, processes of operations taking `workers`, default: `0`, serial
+    - seed: `int`, seed of campaigns.
+    '''
+    def __init__(self, scales: dict[str, dict] = scales, names: list[str] = list(operations),
+                 repeat: int = 1, memory: bool = True, workers: int = 0, seed: int = 0) -> None:
+        for name in names:
+            if name not in operations:
+                raise ValueError(f"ERROR: {name} is not an operation of {tuple(operations)}!")
+        self.scales, self.names = scales, list(names)
+        self.repeat, self.memory = max(repeat, 1), memory
+        self.workers, self.seed = workers, seed
+        self.results: list[dict] = []
+
+    @staticmethod
+    def version() -> dict[str, str]:
+        '''Commit of the repository (`git describe`, if any) and versions of the environment'''
+        try:
+            commit = subprocess.run(('git', 'describe', '--always', '--dirty'), cwd = Path(__file__).parent,
+                         capture_output = True, text = True).stdout.strip()
+        except OSError:
+            commit = ''
+        return {'commit': commit, 'python': python_version(), 'pandas': pandas.__version__,
+                'numpy': numpy.__version__, 'openpyxl': openpyxl.__version__,
+                'platform': platform(), 'cpus': cpu_count() or 1}
+
+    def run(self, path: Path | str | None = None) -> list[dict]:
+        '''Generate campaigns in `path` (default: a temporary folder, removed after)
+        and run all operations on them, results are printed as each is measured.
+
+        Return results of each scale and operation'''
+        with TemporaryDirectory() as folder:
+            path = Path(path or folder)
+            print(f"{'scale':<8}{'operation':<12}{'rows':>9}{'best':>9}{'median':>9}{'peak MiB':>10}")
+            for scale, params in self.scales.items():
+                campaign = Campaign(**dict({'seed': self.seed}, **params))
+                (path / scale).mkdir(parents = True, exist_ok = True)
+                start = perf_counter()
+                data = campaign.save_data(path / scale)
+                root = campaign.save_excels(path / scale) if {'merge', 'append_zip'} & set(self.names) \
+                    else path / scale / campaign.starting_date.isoformat()
+                generated = perf_counter() - start
+                last = campaign.last_coll
+                month = (last.year + last.month // 12, last.month % 12 + 1)
+                context = SimpleNamespace(root = root, data = data, days = campaign.days,
+                                          month = month, workers = self.workers)
+                rows = len(campaign.data())
+                for name in self.names:
+                    seconds = [self.__measure(name, context, False)[0] for _ in range(self.repeat)]
+                    peak = self.__measure(name, context, True)[1] if self.memory else 0
+                    result = {
+                        'scale': scale, 'operation': name, 'params': campaign.params,
+                        'rows': rows, 'generated': round(generated, 3), 'workers': self.workers,
+                        'seconds': [round(second, 4) for second in seconds],
+                        'best': round(min(seconds), 4), 'median': round(median(seconds), 4),
+                        'peak_mib': round(peak / 1048576, 2) if self.memory else None}
+                    self.results.append(result)
+                    print(f"{scale:<8}{name:<12}{rows:>9}{result['best']:>9.3f}{result['median']:>9.3f}"
+                          f"{result['peak_mib'] if self.memory else '-':>10}")
+        return self.results
+
+    def __measure(self, name: str, context: SimpleNamespace, traced: bool) -> tuple[float, int]:
+        with ProcessPoolExecutor(1) as executor:
+            return executor.submit(_measure, name, context, traced).result()
+
+    def save(self, path: Path | str) -> Path:
+        '''Save results with versions (see `version`) as json
+
+        Return the path of the json'''
+        Path(path).write_text(dumps({
+            'time': datetime.now().isoformat(timespec = 'seconds'), 'version': self.version(),
+            'repeat': self.repeat, 'results': self.results}, ensure_ascii = False, indent = 1), 'utf-8')
+        return Path(path)
+
+    @staticmethod
+    def compare(base: Path | str | dict, other: Path | str | dict) -> DataFrame:
+        '''Compare results of two json files (or their contents) by scale and operation
+
+        Return best seconds, peak memory and ratios (`other` / `base`)'''
+        frames = []
+        for results in (base, other):
+            if not isinstance(results, dict):
+                results = loads(Path(results).read_text('utf-8'))
+            frames.append(DataFrame(results['results']).set_index(['scale', 'operation'])[['best', 'peak_mib']])
+        compared = concat(frames, axis = 1, keys = ('base', 'other'), join = 'inner')
+        compared[('ratio', 'best')] = compared[('other', 'best')] / compared[('base', 'best')]
+        compared[('ratio', 'peak_mib')] = compared[('other', 'peak_mib')] / compared[('base', 'peak_mib')]
+        return compared
+
+if __name__ == "__main__":
+
+    from argparse import ArgumentParser
+    parser = ArgumentParser()
+    parser.add_argument("--scale", type = str, action = 'append', choices = scales, default = [])
+    parser.add_argument("--operation", type = str, action = 'append', choices = operations, default = [])
+    parser.add_argument("--repeat", type = int, default = 1)
+    parser.add_argument("--workers", type = int, default = 0)
+    parser.add_argument("--seed", type = int, default = 0)
+    parser.add_argument("--path", type = str, default = None)
+    parser.add_argument("--output", type = str, default = f"benchmark_{date.today().isoformat()}.json")
+    parser.add_argument("--compare", type = str, default = None)
+    parser.add_argument("-nomemory", action = 'store_true')
+    kwargs = vars(parser.parse_args())
+
+    benchmark = Benchmark(
+        {scale: scales[scale] for scale in kwargs['scale'] or scales},
+        kwargs['operation'] or list(operations), kwargs['repeat'],
+        not kwargs['nomemory'], kwargs['workers'], kwargs['seed'])
+    benchmark.run(kwargs['path'])
+    print('results >>', benchmark.save(kwargs['output']))
+    if kwargs['compare']:
+        print(benchmark.compare(kwargs['compare'], kwargs['output']).round(3).to_string())
@@ -0,0 +1,359 @@
+__all__ = ('ColumnStore', 'compact', 'concat_compact', 'save_mapped', 'load_mapped', 'weekdays')
+
+from datetime import date
+from hashlib import md5
+from json import dumps, loads
+from os import replace
+from typing import Iterable
+from numpy import ndarray, asarray, isin, load, save, savez_compressed, unique
+from numpy import int8, int16, int32, float32
+from pandas import Categorical, CategoricalDtype, DataFrame, Series, concat, to_timedelta
+from pandas.api.types import is_numeric_dtype, union_categoricals
+from pathlib import Path
+
+weekdays = ('星期一', '星期二', '星期三', '星期四', '星期五', '星期六', '星期日')
+compact_types = {
+    'date_flight': 'int32', 'day_week': 'int8', 'airline': 'category', 'type': 'category',
+    'dep': 'category', 'arr': 'category', 'time_dep': 'int16', 'time_arr': 'int16',
+    'price': 'int32', 'price_rate': 'float32', 'date_coll': 'int32',
+    'day_adv': 'int16', 'hour_dep': 'int8', 'route': 'category',
+}
+
+def compact(data: DataFrame) -> DataFrame:
+    '''
+    Convert merged data to the compact layout in place, other columns are kept.
+
+    - `date_flight`, `date_coll`: `int32` ordinals; `day_adv`: `int16`; `hour_dep`: `int8`
+    - `day_week`: `int8` from 1 (`星期一`) to 7 (`星期日`)
+    - `time_dep`, `time_arr`: `int16` minutes since midnight
+    - `price`: `int32`; `price_rate`: `float32`
+    - `airline`, `type`, `dep`, `arr`, `route`: ordered categorical of sorted names,
+    so that groups are sorted by names as grouping strings (`observed = True`)
+
+    Return `data` itself.
+    '''
+    for key in compact_types.keys():
+        if key in data:
+            data[key] = _compact(key, data[key])
+    return data
+
+def _compact(key: str, values: Series) -> Series:
+    if compact_types[key] == 'category':
+        return _ordered(values)
+    elif values.dtype == compact_types[key]:
+        return values
+    elif key == 'day_week' and not is_numeric_dtype(values):
+        values = values.astype(object).map({name: idx for idx, name in enumerate(weekdays, 1)})
+    elif key in ('time_dep', 'time_arr') and not is_numeric_dtype(values):
+        values = to_timedelta(values.astype(str)).dt.total_seconds() // 60
+    return values.astype(compact_types[key])
+
+def _ordered(values: Series) -> Series:
+    if not isinstance(values.dtype, CategoricalDtype):
+        values = values.astype('category')
+    elif values.cat.ordered and values.cat.categories.is_monotonic_increasing:
+        return values
+    if not values.cat.categories.is_monotonic_increasing:
+        values = values.cat.reorder_categories(values.cat.categories.sort_values())
+    return values.cat.as_ordered()
+
+def concat_compact(frames: Iterable[DataFrame]) -> DataFrame:
+    '''Concatenate compact data with a new index, 
+    categoricals are kept by the union of their categories.'''
+    frames = list(frames)
+    frames = [frame for frame in frames if len(frame)] or frames[:1]
+    if not frames:
+        return DataFrame()
+    keys = [key for key in frames[0].keys() if all(
+        key in frame and isinstance(frame[key].dtype, CategoricalDtype) for frame in frames)]
+    data = concat([frame.drop(columns = keys) for frame in frames], ignore_index = True)
+    for key in keys:
+        try:
+            values = union_categoricals([frame[key] for frame in frames], 
+                                        sort_categories = True, ignore_order = True)
+        except TypeError:
+            values = concat([frame[key].astype(object) for frame in frames], ignore_index = True)
+        data.insert(list(frames[0].keys()).index(key), key, _ordered(Series(values)))
+    return data
+
+def save_mapped(data: DataFrame, path: Path | str) -> Path:
+    '''Write columns of compact data as `.npy` files in the folder `path` for `load_mapped`, 
+    categoricals as codes with their categories in `columns.json`.
+    
+    Return the folder.'''
+    path = Path(path)
+    path.mkdir(parents = True, exist_ok = True)
+    columns = {}
+    for idx, key in enumerate(data.keys()):
+        values = data[key]
+        if isinstance(values.dtype, CategoricalDtype):
+            columns[key] = {'file': f'{idx}.npy', 'categories': values.cat.categories.tolist(), 'object': False}
+            values = values.cat.codes
+        elif not is_numeric_dtype(values):
+            values = values.astype('category')
+            columns[key] = {'file': f'{idx}.npy', 'categories': values.cat.categories.tolist(), 'object': True}
+            values = values.cat.codes
+        else:
+            columns[key] = {'file': f'{idx}.npy'}
+        save(path / f'{idx}.npy', values.to_numpy())
+    (path / 'columns.json').write_text(dumps(columns, ensure_ascii = False, default = int), 'utf-8')
+    return path
+
+def load_mapped(path: Path | str) -> DataFrame:
+    '''Data written by `save_mapped`, with numbers memory-mapped read-only, 
+    so that processes share the pages of the same files instead of copies sent to each.'''
+    path = Path(path)
+    columns = loads((path / 'columns.json').read_text('utf-8'))
+    frame = {}
+    for key, column in columns.items():
+        values = load(path / column['file'], mmap_mode = 'r')
+        if 'categories' in column:
+            values = Categorical.from_codes(values, column['categories'], ordered = not column['object'])
+            frame[key] = values.astype(object) if column['object'] else values
+        else:
+            frame[key] = values
+    return DataFrame(frame, columns = list(columns.keys()), copy = False)
+
+class ColumnStore():
+    '''
+    Columnar store of merged data
+    =====
+    Compressed `numpy` archives partitioned by collect date, replacing `merged_{root}.csv`.
+
+    Each partition is an append-only `.npz` file written once and never changed,
+    `manifest.json` holds the schema and the statistics of every partition
+    (rows, ranges of `date_flight` and `day_adv`, routes and airlines),
+    so that reads only open partitions that may match and only the columns needed.
+
+    Schema
+    -----
+    The same as `compact`, with categorical columns stored as `int32` codes with their categories.
+
+    Data read are in the compact layout as `Rebuilder.merge` returns.
+
+    Sources
+    -----
+    Excels ingested are recorded in the manifest by `f'{collect date}/{name}'` with
+    size, mtime, content hash and rows, see `scan`. Data with a `source` column keep it
+    in partitions, so that rows of a changed or deleted source can be `retire`d
+    without rewriting any partition.
+
+    Parameters
+    -----
+    - path: `Path` | `str`, folder of the store, created if not exists.
+    '''
+    schema = {
+        'date_flight': int32, 'day_week': int8, 'airline': str, 'type': str,
+        'dep': str, 'arr': str, 'time_dep': int16, 'time_arr': int16,
+        'price': int32, 'price_rate': float32, 'date_coll': int32,
+        'day_adv': int16, 'hour_dep': int8, 'route': str,
+    }
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents = True, exist_ok = True)
+        self.__manifest = self.path / 'manifest.json'
+        if self.__manifest.exists():
+            manifest = loads(self.__manifest.read_text('utf-8'))
+            self.partitions: dict[str, dict] = manifest['partitions']
+            self.sources: dict[str, dict] = manifest.get('sources', {})
+        else:
+            self.partitions: dict[str, dict] = {}
+            self.sources: dict[str, dict] = {}
+
+    def __len__(self) -> int:
+        return sum(partition['rows'] for partition in self.partitions.values())
+
+    def dates(self) -> list[date]:
+        '''Collect dates in the store'''
+        return sorted(set(date.fromordinal(partition['date_coll']) for partition in self.partitions.values()))
+
+    @staticmethod
+    def source(file: Path) -> str:
+        '''Key of an excel as a source'''
+        return f'{file.parent.name}/{file.name}'
+
+    def scan(self, files: Iterable[Path]) -> tuple[list[Path], list[str], list[str]]:
+        '''
+        Compare excels with the sources ingested, by size and mtime first, then by content hash.
+
+        Return
+        -----
+        - files new or changed, to be ingested with their `records`
+        - keys of sources changed
+        - keys of sources deleted: in the same collect dates as `files` but not found
+        '''
+        pending, changed, keys = [], [], set()
+        for file in files:
+            key = self.source(file)
+            keys.add(key)
+            record, stat = self.sources.get(key), file.stat()
+            if record and record['size'] == stat.st_size and record['mtime'] == stat.st_mtime:
+                continue
+            if record and record['size'] == stat.st_size and record['hash'] == self.hash(file):
+                record['mtime'] = stat.st_mtime
+                continue
+            pending.append(file)
+            if record:
+                changed.append(key)
+        folders = set(key.split('/', 1)[0] for key in keys)
+        deleted = sorted(key for key in self.sources.keys() if key.split('/', 1)[0] in folders and key not in keys)
+        return pending, changed, deleted
+
+    @staticmethod
+    def hash(file: Path) -> str:
+        return md5(file.read_bytes()).hexdigest()
+
+    def records(self, files: Iterable[Path], rows: Iterable[int]) -> dict[str, dict]:
+        '''Source records of excels and their row counts, for `append`'''
+        records = {}
+        for file, count in zip(files, rows):
+            stat = file.stat()
+            records[self.source(file)] = {'size': stat.st_size, 'mtime': stat.st_mtime,
+                                          'hash': self.hash(file), 'rows': int(count)}
+        return records
+
+    def retire(self, keys: Iterable[str]) -> int:
+        '''Exclude rows of sources from reads and forget the sources.
+
+        Return the number of rows retired.'''
+        rows = 0
+        for key in keys:
+            record = self.sources.pop(key, None)
+            if record is None:
+                continue
+            for partition in self.partitions.values():
+                if key in partition.get('sources', ()) and key not in partition.get('retired', ()):
+                    partition.setdefault('retired', []).append(key)
+            rows += record['rows']
+        self.__save()
+        return rows
+
+    def append(self, data: DataFrame, sources: dict[str, dict] = None) -> int:
+        '''Write merged data as new partitions, one for each collect date, 
+        with `sources` recorded (see `records`) if given.
+
+        Return the number of rows written.'''
+        if not set(self.schema.keys()) <= set(data.keys()):
+            raise ValueError("ERROR: Merge data by merge method first!")
+        rows = 0
+        for date_coll, group in data.groupby('date_coll', sort = True):
+            date_coll = int(date_coll)
+            name = date.fromordinal(date_coll).isoformat()
+            name = f'{name}.{sum(1 for partition in self.partitions.values() if partition["date_coll"] == date_coll)}'
+            columns = {}
+            schema = dict(self.schema, source = str) if 'source' in group else self.schema
+            for key, dtype in schema.items():
+                values = _compact(key, group[key]) if key in compact_types else group[key]
+                if dtype is str:
+                    codes, categories = self.__encode(values)
+                    columns[key], columns[f'{key}.categories'] = codes, categories
+                else:
+                    columns[key] = values.to_numpy().astype(dtype)
+            with open(self.path / f'{name}.tmp', 'wb') as file:
+                savez_compressed(file, **columns)
+            replace(self.path / f'{name}.tmp', self.path / f'{name}.npz')
+            self.partitions[name] = {
+                'file': f'{name}.npz', 'rows': len(group), 'date_coll': date_coll,
+                'date_flight': [int(columns['date_flight'].min()), int(columns['date_flight'].max())],
+                'day_adv': [int(columns['day_adv'].min()), int(columns['day_adv'].max())],
+                'routes': columns['route.categories'].tolist(),
+                'airlines': columns['airline.categories'].tolist(),
+            }
+            if 'source' in group:
+                self.partitions[name]['sources'] = columns['source.categories'].tolist()
+                self.sources.update((key, record) for key, record in (sources or {}).items()
+                                    if key in self.partitions[name]['sources'])
+            self.__save()
+            rows += len(group)
+        if sources:
+            self.sources.update(sources)
+            self.__save()
+        return rows
+
+    def read(self, date_flight: tuple[int, int] = None, day_adv: tuple[int, int] = None,
+             routes: Iterable[str] = None, airlines: Iterable[str] = None,
+             date_coll: tuple[int, int] = None, columns: Iterable[str] = None) -> DataFrame:
+        '''
+        Read data matching all predicates, skipping partitions that cannot match.
+
+        - date_flight / day_adv / date_coll: `tuple`, inclusive range `(min, max)`,
+        `0` or `None` for no limit on a side, dates as ordinals.
+        - routes / airlines: names to keep, e.g. `'广州-北京'` / `'南方航空'`.
+        - columns: columns to read, default: all in `schema`.
+        '''
+        routes = None if routes is None else set(routes)
+        airlines = None if airlines is None else set(airlines)
+        columns = list(self.schema.keys()) if columns is None else list(columns)
+        frames = []
+        for partition in self.partitions.values():
+            if not self.__overlaps(partition['date_flight'], date_flight) or \
+                not self.__overlaps(partition['day_adv'], day_adv) or \
+                not self.__overlaps([partition['date_coll']] * 2, date_coll) or \
+                routes is not None and routes.isdisjoint(partition['routes']) or \
+                airlines is not None and airlines.isdisjoint(partition['airlines']):
+                continue
+            with load(self.path / partition['file']) as archive:
+                members = {}
+                def member(key: str) -> ndarray:
+                    '''Each access to `archive` inflates the member again, so load it once'''
+                    if key not in members:
+                        members[key] = archive[key]
+                    return members[key]
+
+                mask = None
+                if partition.get('retired'):
+                    categories = member('source.categories').tolist()
+                    codes = [idx for idx, name in enumerate(categories) if name in partition['retired']]
+                    mask = ~isin(member('source'), codes)
+                for key, limits in (('date_flight', date_flight), ('day_adv', day_adv)):
+                    if limits and limits[0]:
+                        mask = self.__and(mask, member(key) >= limits[0])
+                    if limits and limits[1]:
+                        mask = self.__and(mask, member(key) <= limits[1])
+                for key, names in (('route', routes), ('airline', airlines)):
+                    if names is not None:
+                        categories = member(f'{key}.categories')
+                        codes = [idx for idx, name in enumerate(categories.tolist()) if name in names]
+                        mask = self.__and(mask, isin(member(key), codes))
+                if mask is not None and not mask.any():
+                    continue
+                frame = {}
+                for key in columns:
+                    values = member(key) if mask is None else member(key)[mask]
+                    if self.schema[key] is str:
+                        frame[key] = Categorical.from_codes(
+                            values, member(f'{key}.categories').astype(object), ordered = True)
+                        if mask is not None:
+                            frame[key] = frame[key].remove_unused_categories()
+                    else:
+                        frame[key] = values
+                frames.append(DataFrame(frame, columns = columns))
+        if not frames:
+            return compact(DataFrame({key: Series(dtype = object) for key in columns}))
+        return concat_compact(frames)
+
+    def __save(self) -> None:
+        '''Replace the manifest atomically'''
+        temp = self.path / 'manifest.tmp'
+        temp.write_text(dumps({'schema': {key: getattr(dtype, '__name__', str(dtype)) for key, dtype in self.schema.items()},
+                               'partitions': self.partitions, 'sources': self.sources}, ensure_ascii = False, indent = 1), 'utf-8')
+        replace(temp, self.__manifest)
+
+    @staticmethod
+    def __encode(values: Series) -> tuple[ndarray, ndarray]:
+        if isinstance(values.dtype, CategoricalDtype):
+            values = values.cat.remove_unused_categories()
+            return values.cat.codes.to_numpy().astype(int32), asarray(values.cat.categories, dtype = str)
+        categories, codes = unique(asarray(values, dtype = str), return_inverse = True)
+        return codes.astype(int32), categories
+
+    @staticmethod
+    def __overlaps(bounds: list[int], limits: tuple[int, int] | None) -> bool:
+        if not limits:
+            return True
+        return (not limits[0] or bounds[1] >= limits[0]) and (not limits[1] or bounds[0] <= limits[1])
+
+    @staticmethod
+    def __and(mask: ndarray | None, other: ndarray) -> ndarray:
+        return other if mask is None else mask & other
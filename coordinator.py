@@ -0,0 +1,421 @@
+__all__ = ('LeaseQueue', 'QueueServer', 'QueueClient', 'Coordinator', 'Worker')
+
+from time import sleep
+from datetime import datetime, date, time
+from json import dumps, loads
+from sqlite3 import connect
+from contextlib import contextmanager
+from socket import create_connection
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from threading import Event, Lock, Thread
+from typing import Callable, Generator, Iterable
+from uuid import uuid4
+from pandas import DataFrame
+from pathlib import Path
+from civilaviation import Route
+from ctripcrawler import CtripCrawler, ItineraryCollector
+
+class LeaseQueue():
+    '''
+    Itinerary queue with leases
+    =====
+    Shared queue on a SQLite file, usable by several processes on the same host
+    or, through `QueueServer`, by nodes on other hosts.
+
+    Itineraries are keyed as `f'{Route.format()} {date}'`, the same as `ItineraryCollector`.
+
+    Parameters
+    -----
+    - path: `Path` | `str`, the SQLite database file, default: `queue.db`
+    - attempts: `int`, releases and expired leases allowed before an itinerary is marked failed, default: `5`
+
+    Methods
+    -----
+    - `put`: Queue itineraries, existing ones are kept
+    - `claim`: Lease queued (or expired) itineraries to a worker
+    - `renew`: Extend the leases of a worker
+    - `release`: Return leased itineraries to the queue on failure
+    - `complete`: Store the rows of an itinerary and mark it done
+    - `fetch` / `ack`: Stream stored rows to the only writer
+    - `status`: Count itineraries by status
+    '''
+    def __init__(self, path: Path | str = 'queue.db', attempts: int = 5) -> None:
+        self.path = Path(path)
+        self.attempts = attempts if attempts > 1 else 1
+        self.__lock = Lock()
+        self.__conn = connect(self.path, timeout = 30, isolation_level = None, check_same_thread = False)
+        self.__conn.execute('PRAGMA journal_mode=WAL')
+        self.__conn.execute('''CREATE TABLE IF NOT EXISTS itineraries (
+            key TEXT PRIMARY KEY, status TEXT DEFAULT 'queued', worker TEXT,
+            expiry REAL DEFAULT 0, attempts INTEGER DEFAULT 0)''')
+        self.__conn.execute('''CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT, worker TEXT, rows TEXT)''')
+        self.__conn.execute('CREATE INDEX IF NOT EXISTS idx_status ON itineraries (status, expiry)')
+
+    @contextmanager
+    def __begin(self) -> Generator:
+        with self.__lock:
+            cursor = self.__conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                yield cursor
+                cursor.execute('COMMIT')
+            except:
+                cursor.execute('ROLLBACK')
+                raise
+
+    def put(self, itineraries: Iterable[str]) -> int:
+        '''Return the number of itineraries newly queued'''
+        with self.__begin() as cursor:
+            cursor.executemany('INSERT OR IGNORE INTO itineraries (key) VALUES (?)',
+                               ((key, ) for key in itineraries))
+            return cursor.rowcount
+
+    def claim(self, worker: str, count: int = 1, lease: float = 60) -> list[str]:
+        '''Lease at most `count` itineraries for `lease` seconds, expired leases return first 
+        as releases (see `release`), so that an itinerary whose workers keep dying fails'''
+        now = datetime.now().timestamp()
+        with self.__begin() as cursor:
+            cursor.execute("UPDATE itineraries SET status = CASE WHEN attempts + 1 >= ? THEN 'failed' "
+                           "ELSE 'queued' END, worker = NULL, expiry = 0, attempts = attempts + 1 "
+                           "WHERE status = 'leased' AND expiry < ?", (self.attempts, now))
+            keys = [key for key, in cursor.execute(
+                "SELECT key FROM itineraries WHERE status = 'queued' LIMIT ?", (count, ))]
+            cursor.executemany("UPDATE itineraries SET status = 'leased', worker = ?, expiry = ? "
+                               "WHERE key = ?", ((worker, now + lease, key) for key in keys))
+        return keys
+
+    def renew(self, worker: str, keys: Iterable[str], lease: float = 60) -> int:
+        '''Return the number of leases still held and renewed'''
+        expiry = datetime.now().timestamp() + lease
+        with self.__begin() as cursor:
+            cursor.executemany(
+                "UPDATE itineraries SET expiry = ? WHERE key = ? AND worker = ? AND status = 'leased'",
+                ((expiry, key, worker) for key in keys))
+            return cursor.rowcount
+
+    def release(self, worker: str, keys: Iterable[str]) -> int:
+        '''Return leased itineraries to the queue, or mark them failed after `attempts` releases'''
+        with self.__begin() as cursor:
+            cursor.executemany(
+                "UPDATE itineraries SET status = CASE WHEN attempts + 1 >= ? THEN 'failed' "
+                "ELSE 'queued' END, worker = NULL, expiry = 0, attempts = attempts + 1 "
+                "WHERE key = ? AND worker = ? AND status = 'leased'",
+                ((self.attempts, key, worker) for key in keys))
+            return cursor.rowcount
+
+    def complete(self, worker: str, key: str, rows: list[list]) -> bool:
+        '''Store rows of an itinerary, return `False` if the lease was lost'''
+        with self.__begin() as cursor:
+            cursor.execute("UPDATE itineraries SET status = 'done', expiry = 0 "
+                           "WHERE key = ? AND worker = ? AND status = 'leased'", (key, worker))
+            if not cursor.rowcount:
+                return False
+            cursor.execute('INSERT INTO results (key, worker, rows) VALUES (?, ?, ?)',
+                           (key, worker, dumps(rows, default = str, ensure_ascii = False)))
+            return True
+
+    def fetch(self, after: int = 0, limit: int = 100) -> list[tuple[int, str, list]]:
+        '''Return stored results `(id, key, rows)` after result id `after`'''
+        with self.__lock:
+            results = self.__conn.execute('SELECT id, key, rows FROM results WHERE id > ? '
+                                          'ORDER BY id LIMIT ?', (after, limit)).fetchall()
+        return list((idx, key, loads(rows)) for idx, key, rows in results)
+
+    def ack(self, upto: int) -> int:
+        '''Drop results written by the writer, return the number dropped'''
+        with self.__lock:
+            return self.__conn.execute('DELETE FROM results WHERE id <= ?', (upto, )).rowcount
+
+    def status(self) -> dict[str, int]:
+        with self.__lock:
+            counts = self.__conn.execute(
+                'SELECT status, COUNT(*) FROM itineraries GROUP BY status').fetchall()
+        return dict(counts)
+
+    def close(self) -> None:
+        self.__conn.close()
+
+
+class QueueServer(ThreadingTCPServer):
+    '''
+    Serve a `LeaseQueue` on TCP with one JSON request per line,
+    `{"method": "claim", "args": [...]}` -> `{"result": ...}` or `{"error": ...}`
+
+    Parameters
+    -----
+    - queue: `LeaseQueue`
+    - host: `str`, default: `127.0.0.1`, this host only; requests are not authenticated, 
+    serve on other interfaces (e.g. `0.0.0.0`) only within a trusted network
+    - port: `int`, default: `5757`, `0` == any free port
+    '''
+    daemon_threads = allow_reuse_address = True
+    methods = {'put', 'claim', 'renew', 'release', 'complete', 'fetch', 'ack', 'status'}
+
+    def __init__(self, queue: LeaseQueue, host: str = '127.0.0.1', port: int = 5757) -> None:
+        self.queue = queue
+        ThreadingTCPServer.__init__(self, (host, port), _QueueHandler)
+
+    def start(self) -> Thread:
+        '''Serve in a daemon thread, return the thread'''
+        thread = Thread(target = self.serve_forever, daemon = True)
+        thread.start()
+        return thread
+
+class _QueueHandler(StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = loads(line)
+                if request.get('method') not in QueueServer.methods:
+                    raise AttributeError(f"Unknown method {request.get('method')}")
+                result = {'result': getattr(self.server.queue, request['method'])(*request.get('args', []))}
+            except Exception as error:
+                result = {'error': f'{error.__class__.__name__}: {error}'}
+            self.wfile.write(dumps(result, default = str, ensure_ascii = False).encode() + b'\n')
+
+
+class QueueClient():
+    '''Client of `QueueServer` with the same methods as `LeaseQueue`'''
+    def __init__(self, host: str = '127.0.0.1', port: int = 5757, timeout: float = 30) -> None:
+        self.address, self.timeout = (host, port), timeout
+        self.__lock = Lock()
+        self.__socket = None
+
+    def __call(self, method: str, *args):
+        with self.__lock:
+            for retry in range(3):
+                try:
+                    if self.__socket is None:
+                        self.__socket = create_connection(self.address, self.timeout)
+                        self.__file = self.__socket.makefile('rwb')
+                    self.__file.write(dumps({'method': method, 'args': args},
+                                            default = str, ensure_ascii = False).encode() + b'\n')
+                    self.__file.flush()
+                    response = self.__file.readline()
+                    if not response:
+                        raise ConnectionError('Queue server closed the connection')
+                    break
+                except OSError:
+                    self.close()
+                    if retry == 2:
+                        raise
+                    sleep(1)
+        response = loads(response)
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response['result']
+
+    def put(self, itineraries: Iterable[str]) -> int:
+        return self.__call('put', list(itineraries))
+
+    def claim(self, worker: str, count: int = 1, lease: float = 60) -> list[str]:
+        return self.__call('claim', worker, count, lease)
+
+    def renew(self, worker: str, keys: Iterable[str], lease: float = 60) -> int:
+        return self.__call('renew', worker, list(keys), lease)
+
+    def release(self, worker: str, keys: Iterable[str]) -> int:
+        return self.__call('release', worker, list(keys))
+
+    def complete(self, worker: str, key: str, rows: list[list]) -> bool:
+        return self.__call('complete', worker, key, rows)
+
+    def fetch(self, after: int = 0, limit: int = 100) -> list[tuple[int, str, list]]:
+        return list(tuple(item) for item in self.__call('fetch', after, limit))
+
+    def ack(self, upto: int) -> int:
+        return self.__call('ack', upto)
+
+    def status(self) -> dict[str, int]:
+        return self.__call('status')
+
+    def close(self) -> None:
+        if self.__socket is not None:
+            self.__socket.close()
+        self.__socket = None
+
+
+class Worker():
+    '''
+    Crawl leased itineraries from a shared queue
+    =====
+    Claim itineraries, keep leases renewed while collecting,
+    complete them with rows or release them on failure.
+
+    Parameters
+    -----
+    - crawler: `CtripCrawler`, any crawler with `collector`
+    - queue: `LeaseQueue` | `QueueClient`
+    - name: `str`, the worker id, default: random
+    - batch: `int`, itineraries claimed each time, default: `5`
+    - lease: `float`, seconds of a lease, renewed every third of it, default: `60`
+    '''
+    def __init__(self, crawler: CtripCrawler, queue: LeaseQueue | QueueClient,
+                 name: str = '', batch: int = 5, lease: float = 60) -> None:
+        self.crawler, self.queue = crawler, queue
+        self.name = name if name else uuid4().hex[:8]
+        self.batch = batch if batch > 1 else 1
+        self.lease = lease
+        self.__held: set[str] = set()
+        self.__stop = Event()
+
+    def __renewer(self) -> None:
+        while not self.__stop.wait(self.lease / 3):
+            if len(self.__held):
+                try:
+                    self.queue.renew(self.name, list(self.__held), self.lease)
+                except Exception as error:
+                    print(f'  WARN: lease renewal failed, {error}')
+
+    def run(self, **kwargs) -> int:
+        '''
+        Collect until the queue is empty, return the number of itineraries completed.
+
+        - attempt: `int`, the number of attempt to get ample data, default: `3`
+        - noretry: `list`, routes connecting the city has no retry, default: `list()`
+        - idle: `float`, seconds to wait for expired leases before quitting, default: `0`
+        - proxy: same as `CtripCrawler.run`
+        '''
+        crawler = self.crawler
+        noretry: list = kwargs.get('noretry', [])
+        attempt: int = kwargs.get('attempt', 3) if kwargs.get('attempt', 3) > 1 else 1
+        idle: float = kwargs.get('idle', 0)
+        proxy = kwargs['proxy'] if isinstance(kwargs.get('proxy'), (Callable, Iterable, int, float)) else None
+        status = self.queue.status()
+        crawler.total = max(sum(status.values()), 1)
+        crawler.idct = status.get('done', 0) + status.get('failed', 0)
+        renewer = Thread(target = self.__renewer, daemon = True)
+        self.__stop.clear()
+        renewer.start()
+        collected = 0
+        try:
+            while True:
+                keys = self.queue.claim(self.name, self.batch, self.lease)
+                if not len(keys):
+                    status = self.queue.status()
+                    if idle > 0 and status.get('leased', 0):
+                        sleep(idle)
+                        continue
+                    break
+                self.__held |= set(keys)
+                for key in keys:
+                    route, flight_date = key.split(' ', 1)
+                    flight_date, route = date.fromisoformat(flight_date), Route.fromformat(route)
+                    dep, arr = route.separates('code')
+                    curr = crawler.show_progress(flight_date, route)
+                    datarow, done = [], False
+                    try:
+                        for _ in range(attempt):
+                            flag, datarow = crawler.collector(flight_date, route, proxy)
+                            if flag[1] != 'V2':
+                                print(f'  ...timeout, code: {flag[0]}', end = '')
+                                sleep(crawler.backoff(proxy))
+                                continue
+                            if len(datarow) >= crawler.limits or \
+                                (flight_date != crawler.flight_date and len(datarow)):
+                                done = True
+                                break
+                            elif dep in noretry or arr in noretry:
+                                done = True
+                                break
+                    except Exception as error:
+                        print(f'  WARN: {error} in {key}')
+                    if done and self.queue.complete(self.name, key, list(
+                        list(item.isoformat() if isinstance(item, (date, time)) else item
+                             for item in row) + [key] for row in datarow)):
+                        collected += 1
+                    else:
+                        self.queue.release(self.name, [key])
+                        crawler.warned()
+                    self.__held.discard(key)
+                    crawler.idct += 1
+                    crawler.avg = (datetime.now().timestamp() - curr + crawler.avg * crawler.idct) \
+                        / (crawler.idct + 1)
+        finally:
+            self.__stop.set()
+            if len(self.__held):
+                self.queue.release(self.name, list(self.__held))
+                self.__held.clear()
+            crawler.close()
+        print(f'\r{collected} itineraries collected by worker {self.name}')
+        return collected
+
+
+class Coordinator():
+    '''
+    Multi-node crawl coordinator
+    =====
+    Queue all itineraries of an `ItineraryCollector` on a `LeaseQueue`,
+    serve it to remote `Worker`s and stream their rows to one csv writer
+    in the format of `ItineraryCollector.run`, to be organized into excels.
+
+    Parameters
+    -----
+    - collector: `ItineraryCollector`, itineraries to be queued
+    - queue: `LeaseQueue` | `Path` | `str`, default: `queue.db`
+
+    Examples
+    -----
+    Coordinator node: queue itineraries, serve and write rows
+    >>> coordinator = Coordinator(ItineraryCollector(**kwargs), 'queue.db')
+    >>> coordinator.serve('0.0.0.0', 5757)
+    >>> coordinator.drain('temp.csv')
+    >>> for data in coordinator.collector.organize('temp.csv'): ...
+
+    Worker nodes: claim itineraries until all done
+    >>> Worker(CtripCrawler(**kwargs), QueueClient('192.168.1.2', 5757)).run(proxy = 'proxypool')
+    '''
+    header = ['flight_date', 'dow', 'airlineName', 'craftType', 'departureName', 'arrivalName',
+              'departureTime', 'arrivalTime', 'price', 'rate', 'itinerary']
+
+    def __init__(self, collector: ItineraryCollector, queue: LeaseQueue | Path | str = 'queue.db') -> None:
+        self.collector = collector
+        self.queue = queue if isinstance(queue, LeaseQueue) else LeaseQueue(queue)
+        self.server = None
+        queued = self.queue.put(f'{route.format()} {flight_date}'
+                                for flight_date, route in collector.itineraries)
+        print(f'{queued} itineraries queued in {self.queue.path.name}')
+
+    def serve(self, host: str = '127.0.0.1', port: int = 5757) -> QueueServer:
+        '''Serve the queue in a background thread, to remote workers only if `host` 
+        is given as an interface they reach (see `QueueServer`)'''
+        self.server = QueueServer(self.queue, host, port)
+        self.server.start()
+        print('queue served at {0}:{1}'.format(*self.server.server_address))
+        return self.server
+
+    def results(self, interval: float = 5, wait: bool = True) -> Generator:
+        '''Yield `(key, rows)` of completed itineraries until none is queued or leased'''
+        while True:
+            status = self.queue.status()
+            results = self.queue.fetch(0, 500)
+            for idx, key, rows in results:
+                yield key, rows
+            if len(results):
+                self.queue.ack(results[-1][0])
+                continue
+            if not wait or not (status.get('queued', 0) or status.get('leased', 0)):
+                break
+            sleep(interval)
+
+    def drain(self, tempfile: Path | str, interval: float = 5, wait: bool = True) -> int:
+        '''Write rows streamed from workers to `tempfile`, return the number of itineraries written'''
+        tempfile, written = Path(tempfile), 0
+        if not tempfile.exists():
+            DataFrame(columns = self.header).to_csv(tempfile, index = False)
+        for key, rows in self.results(interval, wait):
+            if len(rows):
+                DataFrame(rows).to_csv(tempfile, mode = 'a', header = False, index = False)
+            written += 1
+            print(f'\r{key} written, {written} itineraries', end = '')
+        status = self.queue.status()
+        print(f"\r{written} itineraries written in {tempfile.name},",
+              f"{status.get('failed', 0)} failed")
+        return written
+
+    def shutdown(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
@@ -0,0 +1,202 @@
+__all__ = ('MomentStore', 'grain', 'moments', 'cell_moments', 'rollup', 'pearson', 'mean_of')
+
+from datetime import date
+from json import dumps, loads
+from os import replace
+from typing import Hashable, Iterable
+from numpy import asarray, bincount, clip, errstate, float64, int8, int32, isin, load, nan, ones, savez_compressed, sqrt, unique, where
+from pandas import DataFrame, MultiIndex, Series, concat
+from pathlib import Path
+
+grain = ('route', 'airline', 'date_coll', 'date_flight', 'hour_dep')
+
+def moments(data: DataFrame, keys: Iterable[str], x: str, y: str | DataFrame | None = None) -> DataFrame:
+    '''
+    Grouped sufficient statistics of Pearson correlation in one pass
+    -----
+    - data: `DataFrame` with columns of `keys` and `x`
+    - keys: columns to group by, groups are sorted as `groupby`
+    - x: column of the variable, e.g. `price_rate`
+    - y: column of the other variable in `data`, or a `DataFrame` of targets
+    in the same index of `data`, one column for each target (e.g. all weekdays), 
+    or `None` for statistics of `x` only (see `rollup`)
+
+    Return `DataFrame` indexed by groups, with columns `n`, `x`, `xx` and `y`, `xy`, `yy`
+    of each target, as `(statistic, target)`. Statistics are sums, so that those
+    of different data or of finer groups can be added up (`groupby(level = ..., observed = True).sum()`).
+    '''
+    groups = data.groupby(list(keys), observed = True, sort = True)
+    sizes = groups.size()
+    codes, count = groups.ngroup().to_numpy(), len(sizes)
+    targets = data[[y]] if isinstance(y, str) else DataFrame(index = data.index) if y is None else y
+    values = data[x].to_numpy(float64)
+    columns = {('n', ''): sizes.to_numpy(float64),
+               ('x', ''): bincount(codes, values, count),
+               ('xx', ''): bincount(codes, values * values, count)}
+    for stat in ('y', 'xy', 'yy'):
+        for target in targets.keys():
+            target_values = targets[target].to_numpy(float64)
+            columns[(stat, target)] = bincount(codes, \
+                target_values if stat == 'y' else target_values * (values if stat == 'xy' else target_values), count)
+    return DataFrame(columns, index = sizes.index, columns = MultiIndex.from_tuples(columns.keys()))
+
+def cell_moments(data: DataFrame, x: str = 'price_rate') -> DataFrame:
+    '''Moments of `x` only (see `moments`) in cells of `grain`, with names in `object` levels, 
+    so that cells of different data (e.g. of different collect dates) are concatenated 
+    and sorted (`sort_index`) the same as computed together.'''
+    stats = moments(data, grain, x)
+    stats.index = stats.index.set_levels([level.astype(object) if level.dtype == 'category' else level \
+        for level in stats.index.levels], verify_integrity = False)
+    return stats
+
+def rollup(stats: DataFrame, keys: Iterable[Series], y: Series, targets: Iterable[Hashable] = None) -> DataFrame:
+    '''
+    Moments of cells added up by groups, with the other variable constant in each cell
+    -----
+    - stats: moments of `x` only, see `cell_moments`
+    - keys: values of each cell to group by, named as the levels of groups, e.g. `route`
+    - y: value of the other variable of each cell, e.g. `day_adv` of its flight and collect date
+    - targets: values of `y`, one indicator target for each (e.g. all weekdays), 
+    default: `y` itself as the only target named by `y.name`
+
+    Return the same as `moments` of the rows of all cells.
+    '''
+    n, x, xx = (stats[(stat, '')].to_numpy() for stat in ('n', 'x', 'xx'))
+    values = y.to_numpy()
+    targets = {y.name: values.astype(float64)} if targets is None else \
+        {target: (values == target).astype(float64) for target in targets}
+    columns = {('n', ''): n, ('x', ''): x, ('xx', ''): xx}
+    for stat in ('y', 'xy', 'yy'):
+        for target, value in targets.items():
+            columns[(stat, target)] = value * (x if stat == 'xy' else n * value if stat == 'yy' else n)
+    frame = DataFrame(columns, columns = MultiIndex.from_tuples(columns.keys()))
+    return frame.groupby([Series(key.to_numpy(), name = key.name) for key in keys], sort = True).sum()
+
+def pearson(moments: DataFrame) -> DataFrame:
+    '''
+    Pearson correlation coefficients from `moments`, one column for each target.
+
+    A group with either variable constant (including a single row) is `nan`, as `Series.corr`.
+    '''
+    n, sx, sxx = (moments[(stat, '')].to_numpy()[:, None] for stat in ('n', 'x', 'xx'))
+    sy, sxy, syy = (moments[stat].to_numpy() for stat in ('y', 'xy', 'yy'))
+    var_x, var_y, cov = n * sxx - sx * sx, n * syy - sy * sy, n * sxy - sx * sy
+    '''Variances and covariances within rounding errors of the sums are zero, 
+    as they are when centered first'''
+    constant = (var_x <= n * sxx * 1e-10) | (var_y <= n * syy * 1e-10)
+    cov = where(abs(cov) <= n * abs(sxy) * 1e-10, 0, cov)
+    with errstate(divide = 'ignore', invalid = 'ignore'):
+        coef = clip(cov / sqrt(var_x * var_y), -1, 1)
+    return DataFrame(where(constant, nan, coef), index = moments.index, columns = moments['y'].columns)
+
+def mean_of(values: DataFrame, level: Hashable | list[Hashable]) -> DataFrame:
+    '''Mean of `values` by `level` of the index, `nan` if any value of the group is `nan`
+    (as `numpy.mean` of the group instead of `DataFrame.mean`, which skips `nan`)'''
+    means = values.groupby(level = level, observed = True).mean()
+    return means.mask(values.isna().groupby(level = level, observed = True).any())
+
+class MomentStore():
+    '''
+    Store of sufficient statistics
+    =====
+    Moments of rates in cells of `grain` (see `cell_moments`) persisted by collect date, 
+    so that correlations of new collect dates are merged in without reading the rows of others.
+
+    Each collect date is a compressed `numpy` archive replaced as a whole, 
+    `manifest.json` records the `ColumnStore` partitions it was computed from: 
+    statistics are only valid for a collect date whose partitions are the same and not retired.
+
+    Parameters
+    -----
+    - path: `Path` | `str`, folder of the store, created if not exists.
+    '''
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        self.path.mkdir(parents = True, exist_ok = True)
+        self.__manifest = self.path / 'manifest.json'
+        if self.__manifest.exists():
+            self.dates: dict[str, dict] = loads(self.__manifest.read_text('utf-8'))['dates']
+        else:
+            self.dates: dict[str, dict] = {}
+
+    def valid(self, partitions: dict[str, dict]) -> list[int]:
+        '''Collect dates (ordinals) whose statistics match `partitions` of a `ColumnStore`'''
+        current, retired = {}, set()
+        for name, partition in partitions.items():
+            current.setdefault(partition['date_coll'], []).append(name)
+            if partition.get('retired'):
+                retired.add(partition['date_coll'])
+        return sorted(record['date_coll'] for record in self.dates.values() \
+            if record['date_coll'] not in retired and sorted(current.get(record['date_coll'], [])) == record['partitions'])
+
+    def append(self, stats: DataFrame, partitions: dict[str, dict]) -> int:
+        '''Write `stats` (see `cell_moments`) by collect date, replacing those stored, 
+        with the names of `partitions` in the same collect date recorded.
+
+        Return the number of cells written.'''
+        count = 0
+        levels = stats.index.get_level_values('date_coll')
+        for date_coll in unique(levels):
+            group = stats[levels == date_coll]
+            date_coll = int(date_coll)
+            name = date.fromordinal(date_coll).isoformat()
+            columns = {}
+            for key in grain:
+                if key == 'date_coll':
+                    continue
+                values = group.index.get_level_values(key)
+                if key in ('route', 'airline'):
+                    categories, codes = unique(asarray(values, dtype = str), return_inverse = True)
+                    columns[key], columns[f'{key}.categories'] = codes.astype(int32), categories
+                else:
+                    columns[key] = values.to_numpy().astype(int8 if key == 'hour_dep' else int32)
+            for stat in ('n', 'x', 'xx'):
+                columns[stat] = group[(stat, '')].to_numpy(float64)
+            with open(self.path / f'{name}.tmp', 'wb') as file:
+                savez_compressed(file, **columns)
+            replace(self.path / f'{name}.tmp', self.path / f'{name}.npz')
+            self.dates[name] = {
+                'file': f'{name}.npz', 'date_coll': date_coll, 'cells': len(group), 
+                'partitions': sorted(key for key, partition in partitions.items() \
+                    if partition['date_coll'] == date_coll)}
+            self.__save()
+            count += len(group)
+        return count
+
+    def read(self, dates: Iterable[int], date_flight: tuple[int, int] = None, day_adv: tuple[int, int] = None,
+             routes: Iterable[str] = None, airlines: Iterable[str] = None) -> DataFrame:
+        '''Statistics of collect `dates` (ordinals) in cells matching all predicates, 
+        the same as `ColumnStore.read` of rows, in the order of `cell_moments`'''
+        routes = None if routes is None else set(routes)
+        airlines = None if airlines is None else set(airlines)
+        dates, frames = set(dates), []
+        for record in self.dates.values():
+            if record['date_coll'] not in dates:
+                continue
+            with load(self.path / record['file']) as archive:
+                columns = {key: archive[key] for key in archive.files}
+            mask = ones(len(columns['n']), bool)
+            for values, limits in ((columns['date_flight'], date_flight), 
+                                   (columns['date_flight'] - record['date_coll'], day_adv)):
+                if limits and limits[0]:
+                    mask &= values >= limits[0]
+                if limits and limits[1]:
+                    mask &= values <= limits[1]
+            for key, names in (('route', routes), ('airline', airlines)):
+                if names is not None:
+                    mask &= isin(columns[key], [idx for idx, name in enumerate(columns[f'{key}.categories'].tolist()) if name in names])
+            index = {key: columns[f'{key}.categories'].astype(object)[columns[key][mask]] \
+                if key in ('route', 'airline') else columns[key][mask] for key in grain if key != 'date_coll'}
+            index['date_coll'] = [record['date_coll']] * int(mask.sum())
+            frames.append(DataFrame({(stat, ''): columns[stat][mask] for stat in ('n', 'x', 'xx')}, 
+                                    index = MultiIndex.from_arrays([index[key] for key in grain], names = grain)))
+        if not frames:
+            return DataFrame(columns = MultiIndex.from_tuples([('n', ''), ('x', ''), ('xx', '')]), 
+                             index = MultiIndex.from_arrays([[] for _ in grain], names = grain))
+        return concat(frames).sort_index()
+
+    def __save(self) -> None:
+        '''Replace the manifest atomically'''
+        temp = self.path / 'manifest.tmp'
+        temp.write_text(dumps({'grain': grain, 'dates': self.dates}, ensure_ascii = False, indent = 1), 'utf-8')
+        replace(temp, self.__manifest)
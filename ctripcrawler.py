@@ -1,20 +1,25 @@
-__all__ = ('CtripCrawler', 'CtripSearcher', 'ItineraryCollector')
+__all__ = ('CtripCrawler', 'CtripSearcher', 'ItineraryCollector', 'RouteExcel')
 
-from time import sleep
+from time import sleep, perf_counter
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from queue import Queue, Empty, Full
+from threading import Event, Lock, Thread
 from datetime import datetime, date, time, timedelta
 from urllib.parse import urlencode
 from pandas import DataFrame, concat, read_csv
-from requests import get, post
+from requests import get, post, Response
 from requests.exceptions import RequestException, Timeout, JSONDecodeError
 from json import dumps
 from hashlib import md5
+from numpy import percentile
 from numpy.random import random, seed
 from random import choice
 from sys import exit
 from typing import Callable, Generator, Iterable, Literal
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment
-from openpyxl.cell import Cell
+from openpyxl.cell import Cell, WriteOnlyCell
 from pathlib import Path
 from civilaviation import Airport, Route
 
@@ -33,11 +38,15 @@ class CtripCrawler():
     - `ignore_routes`: Routes to be ignored, default: `set()`
     - `ignore_threshold`: Routes whose flights are less than this value are not collected and noted, default: `3`
     - `with_return`: Collect return flights, default: `True`
+    - `timeout`: Maximum seconds of a request, adapted per proxy by its p99 latency, default: `10`
+    - `hedge`: Maximum ratio of requests hedged through another proxy once exceeding p95 latency, default: `0` == no hedging
     
     Methods
     -----
     - `run`: Start the crawler in an order of itinerary (each route and each flight date)
+    - `stream`: Same as `run`, with events of each itinerary and each route as they happen
     - `proxy`: Return a proxy dict by the pre-set proxy parameter or ProxyPool
+    - `request`: Post with adaptive timeout and hedging
     
     See Also
     -----
@@ -158,7 +167,9 @@ class CtripCrawler():
         day_limit: int = 0, 
         ignore_routes: set = set(), 
         ignore_threshold: int = 3, 
-        with_return: bool = True, ) -> None:
+        with_return: bool = True, 
+        timeout: float = 10, 
+        hedge: float = 0, ) -> None:
 
         self.routes, cities = [], []
         for item in targets:
@@ -212,11 +223,20 @@ class CtripCrawler():
             raise ValueError(f'{curr_date} + {self.days} days exceeds {flight_date}')
 
         self.warn = self.idct = 0
+        self.__lock = Lock()
         self.avg = 2.9 if with_return else 1.3
         self.with_return = with_return
         self.limits = self.__threshold if self.__threshold else 1
         self.file = None
 
+        '''Latency records for adaptive timeouts and hedging'''
+        self.timeout = timeout if timeout > 0 else 10
+        self.hedge = min(hedge, 1) if hedge > 0 else 0
+        self.latency: dict[str, deque] = {}
+        self.__records = Lock()     # Latency is recorded by hedged requests in other threads
+        self.requests = self.hedges = 0
+        self.__executor = None
+
     @staticmethod
     def proxy(key: Literal['proxypool'] | str | Iterable[str] | int = None) -> dict | None:
         '''Get a random proxy from either proxylist or proxypool'''
@@ -266,6 +286,96 @@ class CtripCrawler():
             else:
                 return "https://www.sogou.com/tx?" + urlencode({"ie": "utf8", "query": query})
 
+    @staticmethod
+    def rotates(proxy) -> bool:
+        '''Whether the proxy parameter gives different proxies for each request'''
+        return isinstance(proxy, (Callable, str)) or \
+            (isinstance(proxy, Iterable) and len(set(proxy)) > 1)
+
+    @staticmethod
+    def proxy_name(proxy: dict | None) -> str:
+        return proxy.get("http", "direct") if isinstance(proxy, dict) else "direct"
+
+    def percentile(self, q: float, proxy: dict | None = None) -> float | None:
+        '''Latency percentile `q` of a proxy, or of all proxies if `proxy` has few records'''
+        with self.__records:
+            records = list(self.latency.get(self.proxy_name(proxy), ()))
+            if len(records) < 10:
+                records = list(item for latency in self.latency.values() for item in latency)
+        return float(percentile(records, q)) if len(records) >= 10 else None
+
+    def adaptive_timeout(self, proxy: dict | None) -> float:
+        '''Twice the p99 latency of a proxy within [1, `timeout`] seconds'''
+        p99 = self.percentile(99, proxy)
+        return self.timeout if p99 is None else min(max(2 * p99, 1.0), self.timeout)
+
+    def __post(self, proxy: dict | None, **kwargs) -> Response:
+        timeout, start = self.adaptive_timeout(proxy), perf_counter()
+        try:
+            response = post(self.url, proxies = proxy, timeout = timeout, **kwargs)
+        except Timeout:
+            self.__record(proxy, timeout)   # Censored at the timeout, pushing it up
+            raise
+        self.__record(proxy, perf_counter() - start)
+        return response
+
+    def __record(self, proxy: dict | None, latency: float) -> None:
+        with self.__records:
+            self.latency.setdefault(self.proxy_name(proxy), deque(maxlen = 100)).append(latency)
+
+    def request(self, proxy, **kwargs) -> Response:
+        '''Post to `url` through `proxy` (any proxy parameter of `run`) with an adaptive timeout.
+        
+        With `hedge`, a request exceeding the p95 latency is duplicated through another proxy
+        and the first response is taken, while hedges stay within `hedge` of all requests.'''
+        first = proxy() if isinstance(proxy, Callable) else self.proxy(proxy)
+        self.requests += 1
+        p95 = self.percentile(95, first) if self.hedge and self.rotates(proxy) else None
+        if p95 is None:
+            return self.__post(first, **kwargs)
+        
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(4)
+        futures = {self.__executor.submit(self.__post, first, **kwargs)}
+        done, futures = wait(futures, p95)
+        if not done and self.hedges + 1 <= self.hedge * self.requests:
+            second = proxy() if isinstance(proxy, Callable) else self.proxy(proxy)
+            if self.proxy_name(second) != self.proxy_name(first):
+                self.hedges += 1
+                futures.add(self.__executor.submit(self.__post, second, **kwargs))
+        futures |= done
+        while len(futures):
+            done, futures = wait(futures, return_when = FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in (done | futures) - {future}:   # Others are closed once returned
+                        other.add_done_callback(self.__discard)
+                    return future.result()
+        return future.result()  # Raise the exception of the last request
+
+    @staticmethod
+    def __discard(future: Future) -> None:
+        '''Close the response of a hedged request not taken'''
+        if not future.cancelled() and future.exception() is None:
+            future.result().close()
+
+    def backoff(self, proxy) -> float:
+        '''Seconds to wait before retrying a failed request, 
+        retries through a rotating proxy go to another proxy at once'''
+        return 0.5 if self.rotates(proxy) else 5
+
+    def warned(self) -> None:
+        '''Count a warning, from any stage of `run` or `stream`'''
+        with self.__lock:
+            self.warn += 1
+
+    def close(self) -> None:
+        '''Release threads kept between requests, called at the end of `run` and `stream`; 
+        hedged requests still running are closed when they return'''
+        if self.__executor is not None:
+            self.__executor.shutdown(wait = False)
+            self.__executor = None
+
 
     def collector(self, flight_date: date, route: Route, proxy) -> tuple[tuple, list[list]]:
         '''Web crawler main'''
@@ -280,9 +390,7 @@ class CtripCrawler():
                                      "acityname": arrivalName, "date": flight_date.isoformat()}]
 
         try:
-            proxy = proxy() if isinstance(proxy, Callable) else self.proxy(proxy)
-            response = post(
-                self.url, data = dumps(payload), headers = header, proxies = proxy, timeout = 10)
+            response = self.request(proxy, data = dumps(payload), headers = dict(header))
             code, url = response.status_code, response.url
             data = response.json().get('data', {})
             response.close()
@@ -319,7 +427,7 @@ class CtripCrawler():
                             arrivalName, departureTime, arrivalTime, price, rate])
                 except Exception as error:
                     print(f"  WARN: {error} in {dcity}-{acity} {flight_date.strftime('%m/%d')}")
-                    self.warn += 1
+                    self.warned()
             if len(datarows):
                 datarows.sort(key = lambda x: x[6])
         except JSONDecodeError:
@@ -341,6 +449,11 @@ class CtripCrawler():
               end = f'{int(self.idct / self.total * 100):03d}%')
         return datetime.now().timestamp()
 
+    @staticmethod
+    def output_file(dcity: str, acity: str, path: Path = Path(), with_return: bool = True) -> Path:
+        '''Path of the excel of a route: `dcity~acity.xlsx` with return, else `dcity-acity.xlsx`'''
+        return Path(path / f'{dcity}~{acity}.xlsx') if with_return else Path(path / f'{dcity}-{acity}.xlsx')
+
     @staticmethod
     def output_excel(datarows: list, dcity: str, acity: str, path: Path = Path(), 
                      values_only: bool = False, with_return: bool = True) -> Path:
@@ -374,7 +487,7 @@ class CtripCrawler():
                 row[9].number_format = '0%' # Make the rate show as percentage
                 wsheet.append(row)
 
-        file = Path(path / f'{dcity}~{acity}.xlsx') if with_return else Path(path / f'{dcity}-{acity}.xlsx')
+        file = CtripCrawler.output_file(dcity, acity, path, with_return)
         wbook.save(file)
         wbook.close
         return file
@@ -384,6 +497,10 @@ class CtripCrawler():
         '''
         Collect all data, output and yield data of city tuple flights collected in list.
         
+        Stages run concurrently with bounded queues in between: collect (request and parse 
+        each itinerary, in a thread) -> aggregate (route by route, this generator) -> write excels 
+        (in a thread), so requests go on while data is consumed or saved.
+        
         Output Parameters
         -----
         - Store data or generate list? 
@@ -392,6 +509,8 @@ class CtripCrawler():
             - path: `Path` | `str`, default: `Path("First Flight Date" / "Current Date")`
         - With format or not?
             - values_only: `bool`, default: `False`
+        - How many routes may wait for the writer? 
+            - buffer: `int`, default: `4`
         
         Collect Parameters
         -----
@@ -417,19 +536,151 @@ class CtripCrawler():
         - proxy: `Iterable[str]`, list of proxy urls
         - proxy: `int` | 'float', random sleep time within this seconds
         '''
-        files = 0
-        __ignores = set()
+        files, ignores = [], set()
+        path, events, stop = self.__start(kwargs, ignores)
+        values_only: bool = kwargs.get('values_only', False)
+        tasks = Queue(kwargs.get('buffer', 4) if kwargs.get('buffer', 4) > 1 else 1)
+        writer = Thread(target = self.__write, daemon = True, args = (tasks, files))
+        if with_output:
+            writer.start()
+
+        '''Aggregate data by route'''
+        try:
+            datarows = []
+            while True:
+                event = events.get()
+                if event[0] == 'rows':
+                    datarows.extend(event[3])
+                    continue
+                elif event[0] == 'error':
+                    raise event[1]
+                elif event[0] == 'done':
+                    break
+                _, route, antiflag, flag = event
+                dep, arr = route.separates('code')
+                msg = f'\r{dep}-{arr} '
+                if antiflag is None:    # Ignored route
+                    pass
+                elif len(datarows) and with_output and antiflag:
+                    self.file = self.output_file(dep, arr, path, self.with_return)
+                    tasks.put((datarows, dep, arr, path, values_only, self.with_return))
+                    yield datarows
+                elif len(datarows) and antiflag:
+                    yield datarows
+                    print(msg + 'generated!               ')
+                elif len(datarows) and not antiflag:
+                    print(msg + 'WARN: output disabled, code: {0}, version: {1}'.format(*flag))
+                    self.warned()
+                else:
+                    print(msg + 'WARN: no data, code: {0}, version: {1}'.format(*flag))
+                    self.warned()
+                datarows = []
+        finally:
+            stop.set()
+            if with_output:
+                tasks.put(None)
+                writer.join()
+            self.close()
+        self.__summary(with_output, ignores, len(files), path)
+
+    def stream(self, with_output: bool = True, on_itinerary: Callable[[date, Route, list], None] = None, 
+               on_route: Callable[[Route, Path | None], None] = None, **kwargs) -> Generator:
+        '''
+        Collect all data and yield events as soon as they happen, holding no route data in memory.
+        
+        - `('itinerary', flight_date, route, datarow)`: data of an itinerary once parsed, 
+        `route` is the OUTbound or INbound one.
+        - `('route', route, file)`: a route is completed with data, `file` is its saved excel 
+        (same as `run`), or `None` if `with_output` is `False`.
+        
+        Callbacks `on_itinerary(flight_date, route, datarow)` and `on_route(route, file)` 
+        are called with the same events before they are yielded.
+        
+        Parameters see `run`, excels are written row by row while collecting.
+        '''
+        files, ignores = 0, set()
+        path, events, stop = self.__start(kwargs, ignores)
+        values_only: bool = kwargs.get('values_only', False)
+        buffer: int = kwargs.get('buffer', 4) if kwargs.get('buffer', 4) > 1 else 1
+        tasks, saved = Queue(buffer * self.days * 2), Queue()
+        writer = Thread(target = self.__stream_write, daemon = True, 
+                        args = (tasks, saved, path, values_only))
+        if with_output:
+            writer.start()
+
+        try:
+            rows, collecting = 0, True
+            while collecting or with_output and writer.is_alive() or not saved.empty():
+                try:
+                    event = events.get(timeout = 0.1) if collecting else None
+                except Empty:
+                    event = None
+                if event is None:
+                    if not collecting and with_output:
+                        writer.join(0.1)
+                elif event[0] == 'rows':
+                    _, flight_date, route, datarow = event
+                    rows += len(datarow)
+                    if with_output:
+                        tasks.put(('rows', route, datarow))
+                    if on_itinerary is not None:
+                        on_itinerary(flight_date, route, datarow)
+                    yield 'itinerary', flight_date, route, datarow
+                elif event[0] == 'error':
+                    raise event[1]
+                elif event[0] == 'done':
+                    collecting = False
+                    if with_output:
+                        tasks.put(None)
+                else:
+                    _, route, antiflag, flag = event
+                    dep, arr = route.separates('code')
+                    if antiflag is None:
+                        pass
+                    elif rows and antiflag and not with_output:
+                        saved.put((route, None))
+                        print(f'\r{dep}-{arr} generated!               ')
+                    elif rows and antiflag:
+                        pass    # Announced once saved
+                    elif rows:
+                        print(f'\r{dep}-{arr} WARN: output disabled, code: {flag[0]}, version: {flag[1]}')
+                        self.warned()
+                    else:
+                        print(f'\r{dep}-{arr} WARN: no data, code: {flag[0]}, version: {flag[1]}')
+                        self.warned()
+                    if with_output:
+                        tasks.put(('save' if rows and antiflag else 'discard', route, None))
+                    rows = 0
+                while not saved.empty():
+                    route, file = saved.get()
+                    if file is not None:
+                        self.file = file
+                        files += 1
+                        print(f'\r{route.format()} collected!               ')
+                    if on_route is not None:
+                        on_route(route, file)
+                    yield 'route', route, file
+        finally:
+            stop.set()
+            if with_output and collecting:
+                tasks.put(None)
+                writer.join()
+            self.close()
+        self.__summary(with_output, ignores, files, path)
 
-        '''Initialize running parameters'''
+    def __start(self, kwargs: dict, ignores: set) -> tuple[Path, Queue, Event]:
+        '''Prepare the routes of `run` parameters and start the collect stage.
+        
+        Return the output path, the queue of collected events and the stop event'''
         path = Path(kwargs.get('path', Path(self.first_date) / Path(date.today().isoformat())))
         path.mkdir(parents = True, exist_ok = True)
-        values_only: bool = kwargs.get('values_only', False)
         parts: int = kwargs.get('parts', 1)
         part: int = kwargs.get('part', 1)
         overwrite: bool = kwargs.get('overwrite', False)
         noretry: list = kwargs.get('noretry', [])
         attempt: int = kwargs.get('attempt', 3) if kwargs.get('attempt', 3) > 1 else 1
         antiempty: int = kwargs.get('antiempty') if kwargs.get('antiempty', 0) >= 1 else 0
+        buffer: int = kwargs.get('buffer', 4) if kwargs.get('buffer', 4) > 1 else 1
         proxy = kwargs['proxy'] if isinstance(kwargs.get('proxy'), (Callable, Iterable, int, float)) else None
 
         '''Part separates'''
@@ -454,117 +705,16 @@ class CtripCrawler():
             self.total = len(routes) * self.days
         dates = list((self.flight_date + timedelta(i)) for i in range(self.days))
 
-        '''Data collecting controller'''
-        for route in routes:
-            dep, arr = route.separates('code')
-            exist = Path(path / f'{dep}~{arr}.xlsx').exists() or \
-                Path(path / f'{dep}-{arr}.xlsx').exists() or \
-                Path(path / f'{arr}~{dep}.xlsx').exists()
-            if not overwrite and exist:
-                print(f'{dep}-{arr} already collected, skip')
-                self.total -= self.days
-                continue    # Already processed.
-            last_date = self.flight_date   #reset
-            datarows = []
-            for collect_date in dates:
-                curr = self.show_progress(collect_date, route)
-
-                '''Get OUTbound flights data, attempts for ample data'''
-                for _ in range(attempt):
-                    flag, datarow = self.collector(collect_date, route, proxy)
-                    while flag[1] != 'V2':
-                        if flag[1] == 'Timeout' or flag[0] != 200:
-                            print(f'  ...timeout, code: {flag[0]}', end = '')
-                            sleep(5)
-                        else:
-                            try:
-                                print('  WARN: code {0} [200], {1} [V2]'.format(*flag))
-                                input('\r\nContinue (Any) / Exit (*nix: Ctrl-D, Windows: Ctrl-Z+Return): ')
-                            except EOFError:
-                                exit(0)
-                        curr = datetime.now().timestamp()
-                        flag, datarow = self.collector(collect_date, route, proxy)
-                    if len(datarow) >= self.limits or (collect_date != self.flight_date and len(datarow)):
-                        if collect_date > last_date:
-                            last_date = collect_date
-                        datarows.extend(datarow)
-                        break
-                    elif dep in noretry or arr in noretry:
-                        print(f' ...few data in {dep}-{arr} ', 
-                                end = collect_date.strftime('%m/%d'))
-                        break
-                else:
-                    if collect_date == self.flight_date and len(datarow) < self.__threshold:
-                        self.total -= self.days
-                        print(f'\r{dep}-{arr} has {len(datarow)} flight(s), ignored. ')
-                        __ignores.add((dep, arr))
-                        break
-                    elif len(datarow) < self.limits:
-                        print(f'  WARN: few data in {dep}-{arr} ', 
-                              end = collect_date.strftime('%m/%d'))
-                        self.warn += 1
-
-                '''Get INbound flights data, attempts for ample data'''
-                if self.with_return:
-                    for _ in range(attempt):
-                        flag, datarow = self.collector(collect_date, route.returns, proxy)
-                        while flag[1] != 'V2':
-                            if flag[1] == 'Timeout' or flag[0] != 200:
-                                print(f'  ...timeout, code: {flag[0]}', end = '')
-                                sleep(5)
-                            else:
-                                try:
-                                    print('  WARN: code {0} [200], {1} [V2]'.format(*flag))
-                                    input('\r\nContinue (Any) / Exit (*nix: Ctrl-D, Windows: Ctrl-Z+Return): ')
-                                except EOFError:
-                                    exit(0)
-                            curr = datetime.now().timestamp()
-                            flag, datarow = self.collector(collect_date, route, proxy)
-                        if len(datarow) >= self.limits or (collect_date != self.flight_date and len(datarow) > 0):
-                            if collect_date > last_date:
-                                last_date = collect_date 
-                            datarows.extend(datarow)
-                            break
-                        elif dep in noretry or arr in noretry:
-                            print(f' ...few data in {arr}-{dep} ', 
-                                  end = collect_date.strftime('%m/%d'))
-                            break
-                    else:
-                        if collect_date == self.flight_date and len(datarow) < self.__threshold:
-                            self.total -= self.days
-                            print(f'\r{arr}-{dep} has {len(datarow)} flight(s), ignored. ')
-                            __ignores.add((arr, dep))
-                            break
-                        elif len(datarow) < self.limits:
-                            print(f'  WARN: few data in {arr}-{dep} ', 
-                                  end = collect_date.strftime('%m/%d'))
-                            self.warn += 1
-
-                self.idct += 1
-                self.avg = (datetime.now().timestamp() - curr + self.avg \
-                    * (self.total - 1)) / self.total
-            else:
-                antiflag = last_date + timedelta(antiempty) >= collect_date if antiempty else True
-                msg = f'\r{dep}-{arr} '
-                if len(datarows) and with_output and antiflag:
-                    self.file = self.output_excel(datarows, dep, arr, path, values_only, self.with_return)
-                    yield datarows
-                    print(msg + 'collected' + ('!               ' if values_only else ' and formatted! '))
-                    files += 1
-                elif len(datarows) and antiflag:
-                    yield datarows
-                    print(msg + 'generated!               ')
-                elif len(datarows) and not antiflag:
-                    print(msg + 'WARN: output disabled, code: {0}, version: {1}'.format(*flag))
-                    self.warn += 1
-                else:
-                    print(msg + 'WARN: no data, code: {0}, version: {1}'.format(*flag))
-                    self.warn += 1
+        stop, events = Event(), Queue(buffer * self.days * 2)
+        Thread(target = self.__collect, daemon = True, args = (
+            routes, dates, path, overwrite, noretry, attempt, antiempty, proxy, ignores, events, stop)).start()
+        return path, events, stop
 
+    def __summary(self, with_output: bool, ignores: set, files: int, path: Path) -> None:
         if with_output:
-            if len(__ignores) > 0:
+            if len(ignores) > 0:
                 with open(f'IgnoredOrError_{self.__threshold}.txt', 'a') as updates:
-                    updates.write(str(__ignores) + '\n')
+                    updates.write(str(ignores) + '\n')
                     print('Ignorance set updated, ', end = '')
             print(files, 'routes collected in', path.name) if files > 1 else \
                 print(files, 'route collected in', path.name)
@@ -572,19 +722,214 @@ class CtripCrawler():
             print('Total warning:', self.warn) if self.warn else print()
         self.warn = 0
 
+    @staticmethod
+    def __put(queue: Queue, item: tuple, stop: Event) -> None:
+        '''Put with backpressure until the consumer stops'''
+        while not stop.is_set():
+            try:
+                return queue.put(item, timeout = 1)
+            except Full:
+                continue
+        raise GeneratorExit
+
+    def __attempt(self, collect_date: date, route: Route, attempt: int, 
+                  noretry: list, proxy) -> tuple[tuple, list, bool | None]:
+        '''Collect an itinerary with attempts for ample data.
+        
+        Return flag, data and `True` for ample data, `False` for few data, `None` for an ignored route'''
+        dep, arr = route.separates('code')
+        for _ in range(attempt):
+            flag, datarow = self.collector(collect_date, route, proxy)
+            while flag[1] != 'V2':
+                if flag[1] == 'Timeout' or flag[0] != 200:
+                    print(f'  ...timeout, code: {flag[0]}', end = '')
+                    sleep(self.backoff(proxy))
+                else:
+                    try:
+                        print('  WARN: code {0} [200], {1} [V2]'.format(*flag))
+                        input('\r\nContinue (Any) / Exit (*nix: Ctrl-D, Windows: Ctrl-Z+Return): ')
+                    except EOFError:
+                        exit(0)
+                self.__tick = datetime.now().timestamp()
+                flag, datarow = self.collector(collect_date, route, proxy)
+            if len(datarow) >= self.limits or (collect_date != self.flight_date and len(datarow)):
+                return flag, datarow, True
+            elif dep in noretry or arr in noretry:
+                print(f' ...few data in {dep}-{arr} ', end = collect_date.strftime('%m/%d'))
+                return flag, datarow, False
+        if collect_date == self.flight_date and len(datarow) < self.__threshold:
+            self.total -= self.days
+            print(f'\r{dep}-{arr} has {len(datarow)} flight(s), ignored. ')
+            return flag, datarow, None
+        elif len(datarow) < self.limits:
+            print(f'  WARN: few data in {dep}-{arr} ', end = collect_date.strftime('%m/%d'))
+            self.warned()
+        return flag, datarow, False
+
+    def __collect(self, routes: list[Route], dates: list[date], path: Path, overwrite: bool, 
+                  noretry: list, attempt: int, antiempty: int, proxy, ignores: set, 
+                  events: Queue, stop: Event) -> None:
+        '''Collect stage: put `('rows', date, route, data)` of each itinerary 
+        and `('route', route, antiflag, flag)` at the end of each route in `events`'''
+        try:
+            flag = (0, 'Unknown')
+            for route in routes:
+                dep, arr = route.separates('code')
+                exist = Path(path / f'{dep}~{arr}.xlsx').exists() or \
+                    Path(path / f'{dep}-{arr}.xlsx').exists() or \
+                    Path(path / f'{arr}~{dep}.xlsx').exists()
+                if not overwrite and exist:
+                    print(f'{dep}-{arr} already collected, skip')
+                    self.total -= self.days
+                    continue    # Already processed.
+                last_date = self.flight_date   #reset
+                for collect_date in dates:
+                    self.__tick = self.show_progress(collect_date, route)
+                    itineraries = (route, route.returns) if self.with_return else (route, )
+                    for _route in itineraries:  # OUTbound and INbound flights
+                        flag, datarow, ample = self.__attempt(collect_date, _route, attempt, noretry, proxy)
+                        if ample is None:
+                            ignores.add(_route.separates('code'))
+                            break
+                        elif ample:
+                            if collect_date > last_date:
+                                last_date = collect_date
+                            self.__put(events, ('rows', collect_date, _route, datarow), stop)
+                    else:
+                        self.idct += 1
+                        self.avg = (datetime.now().timestamp() - self.__tick + self.avg \
+                            * (self.total - 1)) / self.total
+                        continue
+                    self.__put(events, ('route', route, None, flag), stop)
+                    break
+                else:
+                    antiflag = last_date + timedelta(antiempty) >= collect_date if antiempty else True
+                    self.__put(events, ('route', route, antiflag, flag), stop)
+        except GeneratorExit:
+            return
+        except BaseException as error:
+            events.put(('error', error))
+        else:
+            events.put(('done', ))
+
+    def __write(self, tasks: Queue, files: list[Path]) -> None:
+        '''Write stage: format and save excels of `output_excel` arguments in `tasks`, 
+        and add them to `files` once saved'''
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            try:
+                file = self.output_excel(*task)
+            except Exception as error:
+                print(f'\r{task[1]}-{task[2]} WARN: output failed, {error}')
+                self.warned()
+            else:
+                files.append(file)
+                print(f'\r{task[1]}-{task[2]} collected' + ('!               ' if task[4] else ' and formatted! '))
+
+    def __stream_write(self, tasks: Queue, saved: Queue, path: Path, values_only: bool) -> None:
+        '''Write stage of `stream`: append rows of each route to its excel as they come, 
+        then save or discard it; put `(route, file)` of saved excels in `saved`'''
+        excel = None
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            action, route, datarow = task
+            try:
+                if action == 'rows':
+                    if excel is None:
+                        excel = RouteExcel(*route.separates('code'), path, values_only, self.with_return)
+                    excel.append(datarow)
+                elif action == 'save' and excel is not None:
+                    saved.put((route, excel.save()))
+                    excel = None
+                elif excel is not None:
+                    excel.discard()
+                    excel = None
+            except Exception as error:
+                print(f'\r{route.format()} WARN: output failed, {error}')
+                self.warned()
+                excel = None
+
+class RouteExcel():
+    '''
+    Excel of a route written row by row in write-only mode, 
+    formatted the same as `CtripCrawler.output_excel`.
+    
+    Rows go to a temporary file as they are appended, until `save`.
+    '''
+    title = ('日期', '星期', '航司', '机型', '出发机场', '到达机场', '出发时', '到达时', '价格', '折扣')
+    
+    def __init__(self, dcity: str, acity: str, path: Path = Path(), 
+                 values_only: bool = False, with_return: bool = True) -> None:
+        self.file = CtripCrawler.output_file(dcity, acity, path, with_return)
+        self.values_only = values_only
+        self.wbook = Workbook(write_only = True)
+        self.wsheet = self.wbook.create_sheet()
+        if values_only:
+            self.wsheet.append(self.title)
+            return
+        self.wsheet.column_dimensions['A'].width = 11
+        self.wsheet.column_dimensions['B'].width = 7
+        self.wsheet.column_dimensions['C'].width = 12
+        self.wsheet.column_dimensions['G'].width = self.wsheet.column_dimensions['H'].width = 7.5
+        self.wsheet.column_dimensions['D'].width = self.wsheet.column_dimensions['I'].width = \
+            self.wsheet.column_dimensions['J'].width = 6
+        row = []
+        for item in self.title:
+            cell = WriteOnlyCell(self.wsheet, item)
+            cell.alignment = Alignment(vertical = 'center', horizontal = 'center')
+            cell.font = Font(bold = True)
+            row.append(cell)
+        self.wsheet.append(row)
+    
+    def append(self, datarows: list) -> None:
+        if self.values_only:
+            for data in datarows:
+                self.wsheet.append(data)
+            return
+        align = Alignment(vertical = 'center', horizontal = 'center')
+        for data in datarows:
+            row = list(WriteOnlyCell(self.wsheet, item) for item in data)
+            for i in range(2, 8):
+                row[i].alignment = align    # Adjust alignment
+            row[6].number_format = row[7].number_format = 'HH:MM'  # Adjust time formats
+            row[9].number_format = '0%' # Make the rate show as percentage
+            self.wsheet.append(row)
+    
+    def save(self) -> Path:
+        self.wbook.save(self.file)
+        self.wbook.close()
+        return self.file
+    
+    def discard(self) -> None:
+        '''Close without saving, the temporary file is removed at exit'''
+        self.wsheet.close()
+
 class CtripSearcher(CtripCrawler):
     """
     Ctrip flight tickets crawler using batch search method.
     
     API: https://flights.ctrip.com/international/search/api/search/batchSearch
     
-    Parameters see class `CtripCrawler`
+    Parameters see class `CtripCrawler`, and for transaction id tokens:
+    - `token_ttl`: Seconds a transaction id stays valid in cache, default: `60`
+    - `token_uses`: Searches allowed with one transaction id, default: `3`
+    - `prefetch`: Itineraries whose tokens are obtained ahead of need, default: `2`, `0` == no prefetch
     """
-    def __init__(self, **kwargs) -> None:
+    def __init__(self, token_ttl: float = 60, token_uses: int = 3, prefetch: int = 2, **kwargs) -> None:
         CtripCrawler.__init__(self, **kwargs)
         self.url = "https://flights.ctrip.com/international/search/api/search/batchSearch"
         self.header = {"origin": "https://flights.ctrip.com", 
                        "content-type": "application/json;charset=UTF-8"}
+        self.token_ttl = token_ttl
+        self.token_uses = token_uses if token_uses > 1 else 1
+        self.prefetch = prefetch if prefetch > 0 else 0
+        self.__tokens: dict[tuple[str, str, str], list] = {}    # key -> [id, data, expiry, uses]
+        self.__pending: dict[tuple[str, str, str], Future] = {}    # key -> (id, data, fetched)
+        self.__executor = None
 
     @staticmethod
     def cookie() -> str:
@@ -605,7 +950,11 @@ class CtripSearcher(CtripCrawler):
     @staticmethod
     def transaction_id(dep: str, arr: str, dates: str | date, proxy: dict = None) -> tuple[str, dict]:
         url = f"https://flights.ctrip.com/international/search/api/flightlist/oneway-{dep}-{arr}?_=1&depdate={dates}&cabin=y&containstax=1"
-        response = get(url, proxies = proxy)
+        try:
+            response = get(url, proxies = proxy, timeout = 10)
+        except RequestException as error:
+            print("  WARN: get transaction id failed,", error.__class__.__name__, end = '')
+            return "", None
         if response.status_code != 200:
             print("  WARN: get transaction id failed, status code", response.status_code, end = '')
             return "", None
@@ -617,15 +966,90 @@ class CtripSearcher(CtripCrawler):
             print("  WARN: get transaction id failed,", error, end = '')
             return "", None
 
+    def token(self, dep: str, arr: str, dates: date) -> tuple[str, dict]:
+        '''Return a transaction id and search data of an itinerary, 
+        reused from cache or prefetched ones before requesting a new one'''
+        key, now = (dep, arr, dates.isoformat()), datetime.now().timestamp()
+        cached = self.__tokens.get(key)
+        if cached and cached[2] > now and cached[3] < self.token_uses:
+            cached[3] += 1
+            return cached[0], cached[1]
+        future = self.__pending.pop(key, None)
+        transaction_id, data, fetched = future.result() if future else ("", None, 0)
+        if fetched + self.token_ttl <= datetime.now().timestamp():  # Not prefetched or expired
+            fetched = datetime.now().timestamp()
+            transaction_id, data = self.transaction_id(dep, arr, dates, self.proxy())
+        if transaction_id == "" or data is None:
+            self.__tokens.pop(key, None)
+        else:
+            self.__tokens[key] = [transaction_id, data, fetched + self.token_ttl, 1]
+        return transaction_id, data
+
+    def __prefetch(self, dep: str, arr: str, dates: date, proxy: dict = None) -> tuple[str, dict, float]:
+        '''Request a transaction id ahead of need, with the time it is requested'''
+        fetched = datetime.now().timestamp()
+        return *self.transaction_id(dep, arr, dates, proxy), fetched
+
+    def discard(self, dep: str, arr: str, dates: date) -> None:
+        '''Drop the cached token of an itinerary after a failed search'''
+        self.__tokens.pop((dep, arr, dates.isoformat()), None)
+
+    def schedule(self, flight_date: date, route: Route) -> int:
+        '''Prefetch tokens of the itineraries following (`flight_date`, `route`) 
+        in the order of `run`: return route of the day, then both routes of the next day.
+        
+        Return the number of tokens requested.'''
+        if not self.prefetch:
+            return 0
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(self.prefetch)
+        now, itineraries = datetime.now().timestamp(), []
+        if self.with_return:
+            itineraries.append((flight_date, route.returns))
+        if flight_date + timedelta(1) < self.flight_date + timedelta(self.days):
+            itineraries.append((flight_date + timedelta(1), route))
+            if self.with_return:
+                itineraries.append((flight_date + timedelta(1), route.returns))
+        
+        for key in list(self.__tokens.keys()):  # Expired tokens are dropped here
+            if self.__tokens[key][2] <= now:
+                del self.__tokens[key]
+        keys = list((*_route.separates('code'), dates.isoformat()) for dates, _route in itineraries)
+        for key in list(self.__pending.keys()):     # So are prefetches not coming next (e.g. routes ignored)
+            if key not in keys:
+                self.__pending.pop(key).cancel()
+        scheduled = 0
+        for (dates, _route), key in zip(itineraries, keys):
+            dep, arr = key[:2]
+            if key in self.__tokens or key in self.__pending:
+                continue
+            if scheduled >= self.prefetch:
+                break
+            self.__pending[key] = self.__executor.submit(
+                self.__prefetch, dep, arr, dates, self.proxy())
+            scheduled += 1
+        return scheduled
+
+    def close(self) -> None:
+        '''Drop prefetched tokens and stop the prefetch threads, started again when needed'''
+        for future in self.__pending.values():
+            future.cancel()
+        self.__pending.clear()
+        if self.__executor is not None:
+            self.__executor.shutdown(wait = False, cancel_futures = True)
+            self.__executor = None
+        CtripCrawler.close(self)
+
 
     def collector(self, flight_date: date, route: Route, proxy) -> tuple[tuple, list[list]]:
         datarows = list()
         dcity, acity = route.separates('code')
         departureName, arrivalName = route.separates('city')
         dow = self.day_week[flight_date.isoweekday()]
-        transaction_id, data = self.transaction_id(dcity, acity, flight_date, self.proxy())
+        transaction_id, data = self.token(dcity, acity, flight_date)
         if transaction_id == "" or data is None:
-            return datarows
+            return (0, 'Timeout'), datarows
+        self.schedule(flight_date, route)   # Tokens ahead are obtained while searching
         self.header["referer"] = self.referers(Route.random() if random() > 0.5 else route)
         self.header["transactionid"] = transaction_id
         self.header["sign"] = self.sign(transaction_id, dcity, acity, flight_date)
@@ -634,8 +1058,7 @@ class CtripSearcher(CtripCrawler):
         self.header["cookie"] = self.cookie()
 
         try:
-            proxy = proxy() if isinstance(proxy, Callable) else self.proxy(proxy)
-            response = post(self.url, data = dumps(data), headers = self.header, proxies = proxy, timeout = 10)
+            response = self.request(proxy, data = dumps(data), headers = dict(self.header))
             code, url = response.status_code, response.url
             routeList = response.json()
             response.close()
@@ -644,6 +1067,7 @@ class CtripSearcher(CtripCrawler):
                 routeList = routeList.get('data').get('flightItineraryList')
             else:
                 print('  WARN: data return error', routeList["data"]["context"]["flag"], end = '')
+                self.discard(dcity, acity, flight_date)
                 return datarows
             for routes in routeList:
                 flightSegments = routes.get('flightSegments')
@@ -673,9 +1097,10 @@ class CtripSearcher(CtripCrawler):
                         datarows.sort(key = lambda x: x[6])
                 except Exception as error:
                     print(f"  WARN: {error} in {dcity}-{acity} {flight_date.strftime('%m/%d')}")
-                    self.warn += 1
+                    self.warned()
         except JSONDecodeError:
             response.close()
+            self.discard(dcity, acity, flight_date)
             flag = code, 'Not a json response ' + url if url != self.url else ''
         except Timeout or RequestException:
             flag = 0, 'Timeout'
@@ -767,7 +1192,7 @@ class ItineraryCollector(CtripCrawler):
                 while flag[1] != 'V2':
                     if flag[1] == 'Timeout' or flag[0] != 200:
                         print(f'  ...timeout, code: {flag[0]}', end = '')
-                        sleep(5)
+                        sleep(self.backoff(proxy))
                     else:
                         try:
                             print('  WARN: code {0} [200], {1} [V2]'.format(*flag))
@@ -788,12 +1213,13 @@ class ItineraryCollector(CtripCrawler):
             else:
                 if len(datarow) < self.limits:
                     print(f"  WARN: few data in {dep}-{arr} {itinerary[0].strftime('%m/%d')}")
-                    self.warn += 1
+                    self.warned()
             
             self.idct += 1
             self.avg = (datetime.now().timestamp() - curr + self.avg * (self.total - 1)) / self.total
         else:
             print(f'{collected} itineraries collected in {tempfile}')
+        self.close()
     
     def organize(self, *tempfile: Path | str, **kwargs) -> Generator:
         '''
@@ -1,14 +1,30 @@
-from typing import Literal
-from pandas import DataFrame, concat, read_csv, read_excel
-from numpy import mean, nan
-from openpyxl import Workbook
+from typing import IO, Iterable, Iterator, Literal
+from pandas import DataFrame, Series, concat, read_csv, read_excel
+from numpy import ndarray, array, zeros, float64, int64
+from openpyxl.utils import get_column_letter
 from openpyxl.styles import Font, Alignment, PatternFill
 from openpyxl.styles.differential import DifferentialStyle
 from openpyxl.formatting.rule import Rule
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, time, timedelta
 from zipfile import ZipFile
-from pathlib import Path
+from pathlib import Path, PurePosixPath
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from itertools import repeat
+from os import cpu_count
+from re import S, compile as re_compile, findall as re_findall, search as re_search, sub as re_sub
+from html import unescape
+from functools import lru_cache
+from collections import OrderedDict
 from civilaviation import Airport, Route
+from columnstore import ColumnStore, compact, concat_compact, save_mapped, load_mapped, weekdays
+from correlation import MomentStore, grain, cell_moments, rollup, pearson, mean_of
+from reportbook import ReportBook, ShardWriter
+from aggregate import Partial
 from warnings import filterwarnings
 
 class Rebuilder():
@@ -25,7 +41,8 @@ class Rebuilder():
     - `dates`: Show mean rate by flight dates and collect dates (with day of week and days advanced).
     
     - Note:
-        - Excels contain sheets with detailed view.
+        - Excels contain sheets with detailed view, written sheet by sheet 
+        in write-only mode with shared styles (see `ReportBook`).
         - Time are included as a detailed view. 
         - Aircraft types are ignored for little contribution.
     
@@ -37,10 +54,37 @@ class Rebuilder():
     - `week`: Day of week
     - `hour`: Hour of departure
     
+    - Note: Correlations are added up from sufficient statistics of cells by route, airline, 
+    collect date, flight date and hour, computed only for collect dates appended and 
+    saved with `save_store`, so that new collect dates are merged in without a full recompute.
+    
+    Build all
+    -----
+    - `build_all`: Build all reports at once, in processes sharing the merged data.
+    
+    Queries
+    -----
+    Tables behind the overviews, computed from the merged data on first call:
+    - `route_adv_curve`: Rates of routes by days advanced.
+    - `airline_hour_profile`: Flights and daily ratios of airlines by hour of departure.
+    - `date_grid`: Rates of routes by collect date and flight date.
+    
+    - Note: Results are kept in a LRU cache of `cache_size` keyed by query and version of the 
+    merged data (changed when data are merged, appended or reset), shared with the overviews.
+    
+    Out of core
+    -----
+    - `scan`: Aggregate merged data larger than memory from a csv or a store chunk by chunk, 
+    into overviews and tables of queries, see `scan_tables`; medians are from quantile sketches 
+    of bounded relative error (see `QuantileSketch`).
+    
     Data formatter
     -----
-    Merge all rebuilt data to `DataFrame`
+    Merge all rebuilt data to `DataFrame` in compact dtypes (see `compact`)
         - Note: Save the merged data to a csv file manually for further usage.
+        - `memory_report`: Memory usage of the merged data by column.
+        - Derived features (daily density, ratio, competition, dates) are computed once, 
+        shared by all reports and cleared when data are appended or reset.
     
     Load data
     -----
@@ -48,6 +92,12 @@ class Rebuilder():
     - `append_folder`: Append excel files from folders in `Path`.
     - `append_zip`: Append excel files from zip files in `Path`.
     - `append_data`: Append saved `DataFrame` from a `.csv` file.
+    - `append_frame`: Append merged `DataFrame` in memory.
+    - `append_store`: Append saved data from a `ColumnStore`, reading only what matches.
+    
+    Save data
+    -----
+    - `save_store`: Append merged data to a `ColumnStore` partitioned by collect date.
     
     Parameters
     -----
@@ -71,6 +121,32 @@ class Rebuilder():
     set_date = "mm\"-\"dd"
     set_percent = "0.00%"
     index_name = '索引-INDEX'
+    cache_size = 32
+    scan_tables = {
+        'routes': (('route', ), {
+            'rows': ('price_rate', 'size'), 'date_flight': ('date_flight', 'nunique'), 
+            'date_coll': ('date_coll', 'nunique'), 'type': ('type', 'nunique'), 
+            'mean': ('price_rate', 'mean'), 'median': ('price_rate', 'median'), 
+            'airline': ('airline', 'nunique'), 'hour_comp': ('hour_comp', 'mean'), 
+            'density_day': ('density_day', 'mean')}), 
+        'airlines': (('airline', ), {
+            'rows': ('ratio_daily', 'size'), 'date_flight': ('date_flight', 'nunique'), 
+            'date_coll': ('date_coll', 'nunique'), 'route': ('route', 'nunique'), 
+            'type': ('type', 'nunique'), 'mean': ('ratio_daily', 'mean'), 'median': ('ratio_daily', 'median')}), 
+        'route_dates': (('route', 'date_flight'), {
+            'mean': ('price_rate', 'mean'), 'median': ('price_rate', 'median'), 'std': ('price_rate', 'std')}), 
+        'coll_dates': (('date_coll', 'route'), {
+            'count': ('price_rate', 'size'), 'mean': ('price_rate', 'mean'), 'median': ('price_rate', 'median')}), 
+        'flight_dates': (('date_flight', 'route'), {
+            'count': ('price_rate', 'size'), 'mean': ('price_rate', 'mean'), 'median': ('price_rate', 'median')}), 
+        'colls': (('date_coll', ), {'count': ('price_rate', 'size'), 'median': ('price_rate', 'median')}), 
+        'flights': (('date_flight', ), {'count': ('price_rate', 'size'), 'median': ('price_rate', 'median')}), 
+        'route_adv_curve': (('route', 'day_adv'), {
+            'count': ('price_rate', 'size'), 'mean': ('price_rate', 'mean'), 'std': ('price_rate', 'std')}), 
+        'airline_hour_profile': (('airline', 'hour_dep'), {
+            'count': ('ratio_daily', 'size'), 'mean': ('ratio_daily', 'mean')}), 
+        'date_grid': (('date_coll', 'route', 'date_flight'), {
+            'sum': ('price_rate', 'sum'), 'count': ('price_rate', 'count'), 'mean': ('price_rate', 'mean')})}
     cheapAir = {
         '长龙航空', '天津航', '龙江航空', '首都航', '乌航', '幸福航空', '北部湾航', 
         '西部航', '成都航空', '多彩航空', '福航', '九元航空', '金鹏航', '湖南航空', 
@@ -82,6 +158,15 @@ class Rebuilder():
         
         self.__merge = DataFrame()
         self.__preprocess = DataFrame()
+        self.__features: dict[str, Series] = {}
+        self.__featured = self.__merge
+        self.__stats: DataFrame | None = None
+        self.__stated = self.__merge
+        self.__stale: set[int] = set()
+        self.__stored: list[DataFrame] = []
+        self.__queries: OrderedDict[tuple, DataFrame] = OrderedDict()
+        self.__versioned = self.__merge
+        self.__version = 0
         
         self.__header_min = {
             'date_flight', 'day_week', 'airline', 'type', 'dep',
@@ -115,8 +200,7 @@ class Rebuilder():
         self.__day_limit = day_limit if isinstance(day_limit, int) else 0
         self.__root = Path(root)
         
-        self.__files: list[Path] = []
-        self.__unlink: list[Path] = []
+        self.__files: list[Path | ArchivedFile] = []
         
         self.__warn = 0
         
@@ -204,7 +288,7 @@ class Rebuilder():
         '''
         Append data from a zip file to process.
         
-        - paths: `Path`, where to find and extract the zip file in `root`.
+        - paths: `Path`, where to find the zip file in `root`.
         
                 default: all folders in the `root`
         
@@ -212,6 +296,8 @@ class Rebuilder():
         
                 default: `orig.zip` as a collection's extract.
         
+        Excels are read from the zip file in memory when merging, nothing is extracted.
+        
         Return the number of excels loaded.
         '''
         files = 0
@@ -237,18 +323,17 @@ class Rebuilder():
                 continue
             
             try:
-                zip = ZipFile(path / Path(file_name), "r")
-                zip.extractall(path)
-                zip.close
+                with ZipFile(path / Path(file_name), "r") as zip:
+                    names = zip.namelist()
             except:
                 print(f"WARN: {file_name} cannot be loaded in", path.name)
                 self.__warn += 1
                 continue
-            for item in path.iterdir():
+            for name in names:
+                item = ArchivedFile(path / Path(file_name), name)
                 if item.match("*.xlsx") and "_" not in item.name:
                     files += 1
                     self.__files.append(item)
-                    self.__unlink.append(item)
         return files
     
     
@@ -259,8 +344,13 @@ class Rebuilder():
         if path == '' or path == None or path == Path():
             path = f'merged_{self.__root.name}.csv'
         print('loading data >>', Path(path).name)
-        data = read_csv(Path(path))
-        if not self.__header_min < set(data.keys()):
+        return self.append_frame(read_csv(Path(path)))
+    
+    def append_frame(self, data: DataFrame) -> DataFrame:
+        '''Append merged data `DataFrame` in memory, converted to the compact layout in place
+        
+        Return appended data `DataFrame`'''
+        if not self.__header_min <= set(data.keys()):
             print("ERROR: Required header missing!")
             return None
         elif not self.__header_req < set(data.keys()):
@@ -271,34 +361,427 @@ class Rebuilder():
                 data.drop(data[data['day_adv'] > self.__day_limit].index, inplace = True)
             if self.__starting_date:
                 data.drop(data[data['date_flight'] < self.__starting_date].index, inplace = True)
-            self.__merge = concat([data, self.__merge]) if len(self.__merge) else data
+            data = compact(data).reset_index(drop = True)
+            self.__append(data)
+            return data
+        else:
+            print("ERROR: No valid data loaded!")
+            return None
+    
+    def append_store(self, path: Path | str | None = None, 
+                     date_flight: tuple[int, int] = None, day_adv: tuple[int, int] = None, 
+                     routes: Iterable[str] = None, airlines: Iterable[str] = None) -> DataFrame:
+        '''Load / append data from a `ColumnStore` folder, only reading partitions and rows matching 
+        `date_flight` / `day_adv` ranges, `routes` and `airlines` (see `ColumnStore.read`), 
+        as well as `starting_date` and `day_limit`.
+        
+        Return appended data `DataFrame`'''
+        if path == '' or path == None or path == Path():
+            path = f'merged_{self.__root.name}'
+        print('loading data >>', Path(path).name)
+        date_flight = list(date_flight) if date_flight else [0, 0]
+        date_flight[0] = max(date_flight[0], self.__starting_date)
+        day_adv = list(day_adv) if day_adv else [0, 0]
+        if self.__day_limit:
+            day_adv[1] = min(day_adv[1], self.__day_limit) if day_adv[1] else self.__day_limit
+        store = ColumnStore(path)
+        data = store.read(date_flight, day_adv, routes, airlines)
+        if len(data) > 0:
+            stored = MomentStore(store.path / 'moments')
+            dates = set(stored.valid(store.partitions)) & set(data['date_coll'].unique())
+            self.__append(data, stored.read(dates, date_flight, day_adv, routes, airlines) if dates else None)
             return data
         else:
             print("ERROR: No valid data loaded!")
             return None
     
+    def save_store(self, path: Path | str | None = None, data: DataFrame = None) -> int:
+        '''Append merged data (default: data loaded or merged) to a `ColumnStore` folder, 
+        collect dates already in the store are skipped as partitions are append-only. 
+        Sufficient statistics of correlations of the merged data are saved with new partitions 
+        (see `MomentStore`), so that `append_store` reads them instead of computing.
+        
+        Return the number of rows written'''
+        if path == '' or path == None or path == Path():
+            path = f'merged_{self.__root.name}'
+        merged = data is None
+        if data is None:
+            if not len(self.__merge):
+                self.__merge = self.merge()
+            data = self.__merge
+        store = ColumnStore(path)
+        exist = set(day.toordinal() for day in store.dates())
+        if exist & set(data['date_coll'].unique()):
+            print("WARN: Collect dates already stored are skipped:", 
+                  ', '.join(date.fromordinal(int(day)).isoformat() for day in sorted(exist & set(data['date_coll'].unique()))))
+            self.__warn += 1
+            data = data[~data['date_coll'].isin(exist)]
+        rows = store.append(data)
+        if merged and rows:
+            stats = self.__moments()
+            MomentStore(store.path / 'moments').append(stats[stats.index.get_level_values('date_coll').isin(
+                data['date_coll'].unique())], store.partitions)
+        return rows
+    
     
     def reset(self, unlink_file: bool = True, clear_rebuilt: bool = False) -> int:
         '''
         Clear all files in the data process queue
         -----
-        - unlink_file: `True`, unlink excels zip file extracted
+        - unlink_file: kept for compatibility, excels in zip files are no longer extracted
         - clear_rebuilt: `True`, clear all rebuilt data
         - Return current count of total warnings and reset to 0
         '''
-        if unlink_file and len(self.__unlink):
-            for file in self.__unlink:
-                file.unlink()
         self.__files.clear()
-        self.__unlink.clear()
         if clear_rebuilt:
             del self.__merge
             self.__merge = DataFrame()
+            self.__features.clear()
+            self.__stats, self.__stated = None, self.__merge
+            self.__stale.clear()
+            self.__stored.clear()
             del self.__preprocess
             self.__preprocess = DataFrame()
         warn, self.__warn = self.__warn, 0 
         return warn
     
+    def __append(self, data: DataFrame, stats: DataFrame = None) -> None:
+        '''Append compact `data` to merged data, with sufficient statistics of its collect dates 
+        read from a `MomentStore` if given, otherwise they are computed on demand (see `__moments`)'''
+        synced = self.__stated is self.__merge
+        dates = set(data['date_coll'].unique())
+        exist = set(self.__merge['date_coll'].unique()) if len(self.__merge) else set()
+        self.__merge = concat_compact([data, self.__merge]) if len(self.__merge) else data
+        self.__features.clear()
+        if stats is not None and len(stats):
+            '''Statistics of collect dates already merged are recomputed with the rows merged'''
+            stored = set(stats.index.get_level_values('date_coll').unique()) - exist
+            self.__stored.append(stats[stats.index.get_level_values('date_coll').isin(stored)])
+            dates -= stored
+        self.__stale.update(dates)
+        if synced:
+            self.__stated = self.__merge
+    
+    def memory_report(self, deep: bool = True) -> DataFrame:
+        '''Memory usage of the merged data by column, with dtype, bytes and share, 
+        in descending order of bytes, and the total in the last row.
+        
+        - deep: `True`, count memory of Python objects in `object` columns'''
+        usage = self.__merge.memory_usage(index = True, deep = deep)
+        report = DataFrame({
+            'dtype': [str(self.__merge.index.dtype) if key == 'Index' else str(self.__merge[key].dtype) \
+                for key in usage.index], 
+            'bytes': usage.values}, index = usage.index).sort_values('bytes', ascending = False)
+        report['share'] = report['bytes'] / max(usage.sum(), 1)
+        report.loc['total'] = ['', usage.sum(), 1.0]
+        report['MiB'] = (report['bytes'] / 1048576).round(2)
+        return report
+    
+    def __feature(self, name: str) -> Series:
+        '''
+        Derived feature of merged data, computed once and cached until data change
+        -----
+        - `price_rate`: compact `float32` rates restored to `float64`, 
+        in 6 decimals the same as before compaction
+        - `date_flight`, `date_coll`: `date` of ordinals
+        - `month`: month of `date_flight`
+        - `density_day`: flights of the route on the day of flight and collect
+        - `ratio_daily`: rate divided by the mean of the route on the day of flight and collect
+        - `hour_comp`: airlines of the route in the hour of departure on the day of flight and collect
+        '''
+        if self.__featured is not self.__merge:
+            self.__features.clear()
+            self.__featured = self.__merge
+        if name in self.__features:
+            return self.__features[name]
+        self.__features[name] = self.__derive(self.__merge, name, \
+            self.__feature('price_rate') if name == 'ratio_daily' else None).rename(name)
+        return self.__features[name]
+    
+    @staticmethod
+    def __derive(data: DataFrame, name: str, rates: Series = None) -> Series:
+        '''Derived feature `name` of compact `data` (see `__feature`), 
+        with `float64` rates of `data` for `ratio_daily`'''
+        if name == 'price_rate':
+            feature = data['price_rate'].astype('float64').round(6)
+        elif name in ('date_flight', 'date_coll'):
+            feature = data[name].map({ordinal: date.fromordinal(ordinal) \
+                for ordinal in data[name].unique()}).astype(object)
+        elif name == 'month':
+            feature = data['date_flight'].map({ordinal: date.fromordinal(ordinal).month \
+                for ordinal in data['date_flight'].unique()}).astype('int64')
+        elif name in data.keys():
+            feature = data[name]
+        elif name == 'density_day':
+            feature = data.groupby(["date_flight", \
+                "route", "date_coll"], observed = True)['date_flight'].transform("count")
+        elif name == 'ratio_daily':
+            rates = Rebuilder.__derive(data, 'price_rate') if rates is None else rates
+            feature = rates / rates.groupby([data["date_coll"], \
+                data["date_flight"], data["route"]], observed = True).transform("mean")
+        elif name == 'hour_comp':
+            feature = data.groupby(["date_coll","date_flight", \
+                "hour_dep", "route"], observed = True)["airline"].transform("nunique")
+        else:
+            raise KeyError(name)
+        return feature
+    
+    def __data(self, *features: str) -> DataFrame:
+        '''Merged data with cached `features` (see `__feature`) and `float64` rates, 
+        columns are shared with the cache without copying, and are replaced 
+        instead of changed in place by reports'''
+        columns = {key: self.__merge[key] for key in self.__merge.keys()}
+        for name in ('price_rate', ) + features:
+            columns[name] = self.__feature(name)
+        return concat(columns, axis = 1, copy = False)
+    
+    def __query(self, key: tuple, function, *args) -> DataFrame:
+        '''Result of `function(*args)` memoized by `key` and version of merged data (merged first 
+        if none), in a LRU cache of `cache_size`; results of former versions are dropped'''
+        if not len(self.__merge):
+            self.__merge = self.merge()
+        if self.__versioned is not self.__merge:
+            self.__queries.clear()
+            self.__versioned = self.__merge
+            self.__version += 1
+        key = (self.__version, ) + key
+        if key in self.__queries:
+            self.__queries.move_to_end(key)
+            return self.__queries[key]
+        result = self.__queries[key] = function(*args)
+        while len(self.__queries) > max(self.cache_size, 1):
+            self.__queries.popitem(last = False)
+        return result
+    
+    @staticmethod
+    def __day(day: date | str | int) -> int:
+        '''Ordinal of a `date`, an iso format string or an ordinal'''
+        if isinstance(day, str):
+            day = date.fromisoformat(day)
+        return day.toordinal() if isinstance(day, date) else int(day)
+    
+    def route_adv_curve(self, route: str | None = None) -> DataFrame:
+        '''
+        Advance purchase curve
+        -----
+        Rates of `route` by days advanced, with columns `count`, `mean` and `std`.
+        
+        - route: `str`, e.g. `广州-北京`
+        
+                default: `None`, all routes by `route` and `day_adv`
+        
+        Results are shared with the cache, and are not to be changed in place.
+        '''
+        curves = self.__query(('route_adv_curve', ), lambda: self.__feature('price_rate').groupby(
+            [self.__merge['route'], self.__merge['day_adv']], observed = True).agg(
+                ['size', 'mean', 'std']).rename(columns = {'size': 'count'}))
+        return curves if route is None else self.__query(('route_adv_curve', route), lambda: curves.loc[route])
+    
+    def airline_hour_profile(self, airline: str | None = None) -> DataFrame:
+        '''
+        Hour profile
+        -----
+        Flights of `airline` by hour of departure, with columns `count` and `mean` of daily ratios 
+        (rate divided by the mean of the route on the day of flight and collect).
+        
+        - airline: `str`, e.g. `春秋航空`
+        
+                default: `None`, all airlines by `airline` and `hour_dep`
+        
+        Results are shared with the cache, and are not to be changed in place.
+        '''
+        profiles = self.__query(('airline_hour_profile', ), lambda: self.__feature('ratio_daily').groupby(
+            [self.__merge['airline'], self.__merge['hour_dep']], observed = True).agg(
+                ['size', 'mean']).rename(columns = {'size': 'count'}))
+        return profiles if airline is None else self.__query(('airline_hour_profile', airline), lambda: profiles.loc[airline])
+    
+    def date_grid(self, day: date | str | int | None = None, 
+                  by: Literal['date_coll', 'date_flight'] = 'date_coll') -> DataFrame:
+        '''
+        Date grid
+        -----
+        Rates of routes (rows) on `day` by the other date (columns of ordinals), 
+        as `(statistic, date)` of statistics `sum`, `count` and `mean`.
+        
+        - day: `date` | `str` (iso format) | `int` (ordinal), a collect date or a flight date by `by`
+        
+                default: `None`, all days by `by` and `route`
+        
+        - by: `date_coll` for flight dates of a collect date, or `date_flight` for collect dates of a flight date
+        
+        Results are shared with the cache, and are not to be changed in place.
+        '''
+        def pivot() -> DataFrame:
+            grid = self.__data().pivot_table('price_rate', [by, 'route'], other, ['sum', 'count'], observed = True)
+            return concat({'sum': grid['sum'], 'count': grid['count'], 'mean': grid['sum'] / grid['count']}, axis = 1)
+        
+        other = 'date_flight' if by == 'date_coll' else 'date_coll'
+        grid = self.__query(('date_grid', by), pivot)
+        if day is None:
+            return grid
+        day = self.__day(day)
+        return self.__query(('date_grid', by, day), lambda: grid.loc[day].dropna(axis = 1, how = 'all'))
+    
+    def scan(self, path: Path | str | None = None, chunk_rows: int = 1000000, 
+             tables: dict[str, Partial] | None = None) -> dict[str, DataFrame]:
+        '''
+        Aggregate out of core
+        -----
+        Stream merged data in chunks of whole collect dates into partial aggregates (see `Partial`), 
+        instead of loading all of them (`append_data` / `append_store`); data loaded are not changed.
+        
+        - path: `Path` | `str`, a `.csv` file of merged data or a `ColumnStore` folder.
+        
+                default: `merged_{root}.csv` if exists, else the store `merged_{root}`
+        
+        - chunk_rows: `int`, rows read from the csv at a time, rows of the last collect date 
+        of a chunk are added with the next; a store is read by collect date.
+        - tables: `dict`, partial aggregates by name, added to in place so that they can be 
+        merged with others (e.g. of other stores).
+        
+                default: `None`, new partials of `scan_tables`: overviews of routes, airlines 
+                and dates (medians within `0.1%`), and tables of queries by cell 
+                (see `route_adv_curve`, `airline_hour_profile` and `date_grid`)
+        
+        `starting_date` and `day_limit` apply as loading. Derived columns (e.g. `density_day`) 
+        are computed by chunk, the same as of all data if rows of each collect date are 
+        consecutive in the csv (as merged).
+        
+        Return results of `tables` by name'''
+        if path == '' or path == None or path == Path():
+            path = f'merged_{self.__root.name}.csv'
+            if not Path(path).exists():
+                path = f'merged_{self.__root.name}'
+        if tables is None:
+            tables = {name: Partial(keys, **aggregations) for name, (keys, aggregations) in self.scan_tables.items()}
+        derived = [name for name in ('density_day', 'ratio_daily', 'hour_comp', 'month') \
+            if any(name in table.columns for table in tables.values())]
+        print('scanning data >>', Path(path).name)
+        rows = 0
+        for data in self.__chunks(Path(path), chunk_rows):
+            data['price_rate'] = self.__derive(data, 'price_rate')
+            for name in derived:
+                data[name] = self.__derive(data, name, data['price_rate'])
+            for table in tables.values():
+                table.add(data)
+            rows += len(data)
+            print(f"\rscanning >> {rows} rows", end = '')
+        print()
+        return {name: table.result() for name, table in tables.items()}
+    
+    def __chunks(self, path: Path, chunk_rows: int) -> Iterator[DataFrame]:
+        '''Compact data of whole collect dates from a csv or a `ColumnStore` folder, 
+        filtered by `starting_date` and `day_limit`'''
+        if path.is_dir():
+            store = ColumnStore(path)
+            for day in store.dates():
+                data = store.read((self.__starting_date, 0), (0, self.__day_limit), 
+                                  date_coll = (day.toordinal(), day.toordinal()))
+                if len(data):
+                    yield data
+            return
+        def consecutive(data: DataFrame) -> DataFrame:
+            split = seen & set(data['date_coll'].unique())
+            if split:
+                print("WARN: Rows of collect dates are not consecutive, derived columns are computed by chunk:", 
+                      ', '.join(date.fromordinal(int(day)).isoformat() for day in sorted(split)))
+                self.__warn += 1
+            seen.update(data['date_coll'].unique())
+            return compact(data.reset_index(drop = True))
+        
+        held, seen = None, set()
+        for data in read_csv(path, chunksize = max(chunk_rows, 1)):
+            if not self.__header_min | self.__header_req <= set(data.keys()):
+                raise ValueError("ERROR: Required header missing!")
+            if self.__day_limit:
+                data = data[data['day_adv'] <= self.__day_limit]
+            if self.__starting_date:
+                data = data[data['date_flight'] >= self.__starting_date]
+            data = data if held is None else concat([held, data])
+            if not len(data):
+                continue
+            last = data['date_coll'].iloc[-1]
+            held = data[data['date_coll'] == last]
+            data = data[data['date_coll'] != last]
+            if len(data):
+                yield consecutive(data)
+        if held is not None and len(held):
+            yield consecutive(held)
+    
+    def __moments(self) -> DataFrame:
+        '''
+        Sufficient statistics of rates in cells of `correlation.grain`
+        -----
+        Computed only for collect dates appended since the last call, from their rows, 
+        or read from the store (see `append_store`), and kept until data change.
+        Cells are concatenated in the same order as computed from all data at once, 
+        so that correlations are identical to a full recompute.
+        '''
+        if self.__stated is not self.__merge:
+            self.__stats, self.__stored = None, []
+            self.__stale = set(self.__merge['date_coll'].unique())
+            self.__stated = self.__merge
+        if self.__stale or self.__stored:
+            stale = list(self.__stale)
+            frames = [stats[~stats.index.get_level_values('date_coll').isin(stale)] \
+                for stats in [self.__stats] + self.__stored if stats is not None]
+            rows = self.__merge['date_coll'].isin(stale).to_numpy()
+            if rows.any():
+                data = self.__merge.loc[rows, list(grain)]
+                data['price_rate'] = self.__merge.loc[rows, 'price_rate'].astype('float64').round(6)
+                frames.append(cell_moments(data))
+            self.__stats = concat(frames).sort_index() if len(frames) > 1 else frames[0]
+            self.__stale.clear()
+            self.__stored.clear()
+        return self.__stats
+    
+    def __cells(self, *features: str) -> tuple[DataFrame, DataFrame]:
+        '''Sufficient statistics (see `__moments`) with values of their cells by row: 
+        `correlation.grain`, `day_adv`, `day_week` and `month` of `date_flight`, 
+        with `date_flight` / `date_coll` as `date` if in `features`'''
+        stats = self.__moments()
+        values = stats.index.to_frame(index = False)
+        ordinals = values['date_flight'].astype('int64')
+        values['day_adv'] = ordinals - values['date_coll'].astype('int64')
+        values['day_week'] = (ordinals - 1) % 7 + 1
+        values['month'] = ordinals.map({ordinal: date.fromordinal(ordinal).month for ordinal in ordinals.unique()})
+        for name in features:
+            values[name] = values[name].map({ordinal: date.fromordinal(int(ordinal)) \
+                for ordinal in values[name].unique()}).astype(object)
+        return stats, values
+    
+    @staticmethod
+    def __sharded(function, cells: DataFrame, workers: int, *args) -> dict:
+        '''Results of `function(shard, *args)` by group merged, with groups at level 0 of `cells` 
+        split into shards of similar rows, in processes if `workers` > 1 (`-1` for all cores)'''
+        if workers < 0:
+            workers = cpu_count() or 1
+        groups = cells.index.get_level_values(0)
+        sizes = Series(groups).value_counts()
+        if workers <= 1 or len(sizes) <= 1:
+            return function(cells, *args)
+        shards = [[] for _ in range(min(workers, len(sizes)))]
+        loads = [0] * len(shards)
+        for name, size in sizes.items():
+            idx = loads.index(min(loads))
+            shards[idx].append(name)
+            loads[idx] += size
+        results = {}
+        with ProcessPoolExecutor(len(shards)) as executor:
+            for result in executor.map(function, (cells[groups.isin(names)] for names in shards), 
+                                       *(repeat(arg) for arg in args)):
+                results.update(result)
+        return results
+    
+    @staticmethod
+    def __ranked(data: DataFrame, key: str, item: str) -> dict[str, list]:
+        '''Unique `item`s of each `key` in descending order of their rows, 
+        items with the same rows are in the order of appearance'''
+        sizes = data.groupby([key, item], observed = True).size()
+        orders = data[[key, item]].drop_duplicates().groupby([key], observed = True)[item].agg(list)
+        return {name: sorted(items, reverse = True, key = lambda x: sizes[(name, x)]) \
+            for name, items in orders.items()}
+    
     @staticmethod
     def __diffrule(index: int | Literal['red', 'yellow', 'blue', 'green'] | tuple[str, str], 
                    type: str, op: str = None, formula = ()) -> Rule:
@@ -323,19 +806,47 @@ class Rebuilder():
                     dxf = DifferentialStyle(font = Font(color = index[0]), \
                         fill = PatternFill(bgColor = index[1], fill_type = "solid")))
     
-    def indexbook(self, data: DataFrame = None, airlines: bool = False):
-        '''Return a workbook with route index aka menu'''
+    @staticmethod
+    def __striped(by: Literal['ROW', 'COLUMN'], formula: str) -> tuple[Rule, Rule]:
+        '''Rules of `formula` (relative to the top left cell) for a whole range, in colors of 
+        `__diffrule` by the index of each row or column: even -> red, odd -> yellow'''
+        return tuple(Rebuilder.__diffrule(color, 'expression', formula = [f"AND(MOD({by}(), 2) = {parity}, {formula})"]) \
+            for color, parity in (('red', 0), ('yellow', 1)))
+    
+    @staticmethod
+    def __monthly(days: Iterable[date], file: str, shard: int) -> dict[str, str]:
+        '''Excel of the sheet of each day by title, `shard` months of days in each excel 
+        named by the first month, or all in `file` if `shard` <= 0'''
+        if shard <= 0:
+            return {day.strftime("%m-%d"): file for day in days}
+        months = sorted({(day.year, day.month) for day in days})
+        return {day.strftime("%m-%d"): file.replace(".xlsx", "_{0}-{1:02d}.xlsx".format( \
+            *months[months.index((day.year, day.month)) // shard * shard])) for day in days}
+    
+    @staticmethod
+    def __sheet(shards: ShardWriter, book: ReportBook, pending: dict[str, list], path: Path | str, 
+                index: str, file: str, sheet: dict, last: bool = False) -> None:
+        '''Write `sheet` (see `ReportBook.write`) to `book` of the index if not sharded (no `files`), 
+        else add it to `pending` sheets of `file`; sheets of a file are submitted to `shards` 
+        once sheets of the next file begin or at the `last`, linked back to the `index` excel'''
+        if not book.files:
+            book.write(**sheet)
+            return
+        for other in [name for name in pending.keys() if name != file]:
+            shards.submit(Path(path) / other, book.index, {book.index: index}, pending.pop(other))
+        pending.setdefault(file, []).append(sheet)
+        if last:
+            shards.submit(Path(path) / file, book.index, {book.index: index}, pending.pop(file))
+    
+    def indexbook(self, data: DataFrame = None, airlines: bool = False, files: dict[str, str] = {}) -> ReportBook:
+        '''Return a `ReportBook` with route index aka menu, 
+        linked to sheets in other excels of `files` by title (see `ReportBook`)'''
         data = self.__merge if data is None else data.get(['route', 'airline'])
-        wb = Workbook()
-        ws = wb.active
-        ws.title = self.index_name
-        ws.append(('航空公司' if airlines else '', '出发', '到达'))
-        for idx in range(1, 4):
-            ws.cell(1, idx).font = self.set_bold
-            ws.cell(1, idx).alignment = self.set_align
-        ws.auto_filter.ref, ws.freeze_panes = 'A1:B1', 'C2'
-        
-        cities, row = {}, 1
+        book = ReportBook(self.index_name, files)
+        ws = book.sheet(self.index_name, 'C2', {'A': 12} if airlines else {}, 'A1:B1')
+        ws.append(('航空公司' if airlines else '', '出发', '到达'), 'header')
+        
+        cities, rows = {}, []
         for route in data['route'].unique():
             dep, arr = route.split('-', 1)
             if cities.get(dep):
@@ -345,72 +856,158 @@ class Rebuilder():
         for city in cities.keys():
             cities[city].sort(key = lambda x: len(cities[x]), reverse = True)
         for dep in sorted(cities.keys(), key = lambda x: len(cities[x]), reverse = True):
-            col = 2
-            row += 1
-            ws.cell(row, col, dep).alignment = self.set_align
-            for arr in cities[dep]:
-                col += 1
-                cell = ws.cell(row, col, arr)
-                cell.hyperlink = f"#'{dep}-{arr}'!A1"
-                cell.font = self.set_hyperlink
-                cell.alignment = self.set_align
+            rows.append([None, dep] + cities[dep])
         
         if airlines:
-            ws.column_dimensions['A'].width = 12
-            airlines = sorted(data['airline'].unique(), reverse = True, \
-                key = lambda x: len(data.loc[data['airline'] == x]))
-            for idx in range(len(airlines)):
-                airline = airlines[idx]
-                cell = ws.cell(idx + 2, 1, airline)
-                cell.hyperlink = f"#'{airline}'!A1"
-                cell.alignment = self.set_align
-                cell.font = self.set_hyperlink
-        return wb
-    
-    
-    def merge(self) -> DataFrame:
-        total = len(self.__files)
-        if total == 0:
-            raise ValueError("ERROR: NO FILE / DATA LOADED!")
-        frame = []
-        header = (
-            'date_flight', 'day_week', 'airline', 'type', 'dep',                            #04
-            'arr', 'time_dep', 'time_arr', 'price', 'price_rate')                           #09
-        idct, percent = 0, -1
-        for file in self.__files:
-            idct += 1
-            if percent != int(idct / total * 100):
-                percent = int(idct / total * 100)
-                print(f"\rmerging >> {percent:03d}", end = '%')
-            date_coll = date.fromisoformat(file.parent.name).toordinal()
-            data = read_excel(file, names = header).assign(date_coll = date_coll)    #10
-            
-            data['date_flight'] = data['date_flight'].map(lambda x: x.toordinal())
-            if self.__starting_date:
-                data.drop(data[data['date_flight'] < self.__starting_date].index, inplace = True)
-            data['day_adv'] = data['date_flight'] - date_coll                               #11
-            if self.__day_limit:
-                data.drop(data[data['day_adv'] > self.__day_limit].index, inplace = True)
-            data['hour_dep'] = data['time_dep'].map(lambda x: x.hour if x.hour else 24)     #12
-            data['route'] = data['dep'].map(Airport) + data['arr'].map(Airport)             #13
-            frame.append(data)
+            counts = data['airline'].value_counts()
+            airlines = sorted(data['airline'].unique(), reverse = True, key = lambda x: counts[x])
+        else:
+            airlines = []
+        for idx in range(max(len(rows), len(airlines))):
+            row = rows[idx] if idx < len(rows) else [None]
+            styles = dict.fromkeys(range(3, len(row) + 1), 'link_center')
+            links = {col: f"'{row[1]}-{row[col - 1]}'!A1" for col in styles.keys()}
+            if len(row) > 1:
+                styles[2] = 'center'
+            if idx < len(airlines):
+                row[0], styles[1], links[1] = airlines[idx], 'link_center', f"'{airlines[idx]}'!A1"
+            ws.append(row, styles, links)
+        ws.close()
+        return book
+    
+    
+    def merge(self, workers: int = 0, store: Path | str | None = None) -> DataFrame:
+        '''Merge all loaded excels with derived columns to `DataFrame`.
+        
+        - workers: `int`, number of processes parsing excels in parallel.
+        
+                default: `0`, serial; `-1` for all cores
+        
+        - store: `Path` | `str`, merge incrementally into a `ColumnStore` folder: 
+        only excels new or changed since last ingested are parsed and appended, 
+        rows of changed excels are retired, deleted excels are warned.
+        
+                default: `None`, merge all excels in memory
+        
+        Order of the merged data is the same as files loaded, 
+        or as partitions in the store if `store` is given.'''
+        if store is None:
+            if len(self.__files) == 0:
+                raise ValueError("ERROR: NO FILE / DATA LOADED!")
+            return concat_compact(self.__parse(self.__files, workers, self.__starting_date, self.__day_limit))
+        
+        store = ColumnStore(store)
+        files, changed, deleted = store.scan(self.__files)
+        for key in deleted:
+            print("WARN: Source deleted:", key)
+            self.__warn += 1
+        if changed:
+            print(f"{len(changed)} source(s) changed, {store.retire(changed)} row(s) retired")
+        print(f"{len(files)} new or changed of {len(self.__files)} source(s)")
+        if files:
+            frames = self.__parse(files, workers)
+            records = store.records(files, (len(frame) for frame in frames))
+            store.append(concat_compact(frame.assign(source = ColumnStore.source(file)) 
+                                        for file, frame in zip(files, frames)), records)
+        return store.read(date_flight = (self.__starting_date, 0), day_adv = (0, self.__day_limit))
+    
+    @staticmethod
+    def __parse(files: list[Path], workers: int = 0, *args: int) -> list[DataFrame]:
+        '''Parse excels by `_merge_file` in load order, in processes if `workers` > 1'''
+        total = len(files)
+        if workers < 0:
+            workers = cpu_count() or 1
+        if workers > 1 and total > 1:
+            executor = ProcessPoolExecutor(min(workers, total))
+            frames = executor.map(_merge_file, files, *(repeat(arg) for arg in args), 
+                                  chunksize = max(1, min(8, total // (workers * 4))))
+        else:
+            executor = None
+            frames = (_merge_file(file, *args) for file in files)
+        frame, percent = [], -1
+        try:
+            for data in frames:
+                frame.append(data)
+                if percent != int(len(frame) / total * 100):
+                    percent = int(len(frame) / total * 100)
+                    print(f"\rmerging >> {percent:03d}", end = '%')
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures = True)
         print()
-        return concat(frame)
+        return frame
     
+    def build_all(self, workers: int = 0, path: Path | str = Path(), 
+                  reports: dict[str, dict] | None = None) -> dict[str, float]:
+        '''
+        Build reports in processes sharing the merged data
+        -----
+        - workers: `int`, number of processes, each builds a report at a time.
+        
+                default: `0`, serial in this process; `-1` for all cores
+        
+        - path: `Path` | `str`, folder of the excels
+        - reports: `dict`, keyword arguments of each report method by name.
+        
+                default: `None`, all of `dates`, `routes`, `airlines`, `month`, 
+                `adv`, `week` and `hour` (by `airline`) in default arguments
+        
+        Merged data are written once as memory-mapped columns (see `save_mapped`) 
+        read by all processes, instead of pickling the `DataFrame` to each. 
+        A summary of seconds of each report is printed at the end.
+        
+        Return seconds of each report by name'''
+        if reports is None:
+            reports = {'dates': {}, 'routes': {}, 'airlines': {}, 'month': {}, 
+                       'adv': {}, 'week': {}, 'hour': {'key': 'airline'}}
+        if not len(self.__merge):
+            self.__merge = self.merge()
+        if workers < 0:
+            workers = cpu_count() or 1
+        start, seconds = perf_counter(), {}
+        if workers > 1 and len(reports) > 1:
+            with TemporaryDirectory() as folder:
+                save_mapped(self.__merge, folder)
+                executor = ProcessPoolExecutor(min(workers, len(reports)))
+                try:
+                    futures = [executor.submit(_build_report, Path(folder), self.__root, name, 
+                                               dict(kwargs, path = path)) for name, kwargs in reports.items()]
+                    print(f"\rbuilding >> {0:03d}", end = '%')
+                    for future in as_completed(futures):
+                        name, seconds[name] = future.result()
+                        print(f"\rbuilding >> {int(len(seconds) / len(reports) * 100):03d}", end = '%')
+                finally:
+                    executor.shutdown(cancel_futures = True)
+        else:
+            for name, kwargs in reports.items():
+                seconds[name] = perf_counter()
+                getattr(self, name)(**dict(kwargs, path = path))
+                seconds[name] = perf_counter() - seconds[name]
+        total = perf_counter() - start
+        print(f"\r{'report':<10}{'seconds':>8}")
+        for name in reports.keys():
+            print(f"{name:<10}{seconds[name]:>8.1f}")
+        print(f"{'total':<10}{total:>8.1f}, sum of reports {sum(seconds.values()):.1f}")
+        return seconds
     
-    def dates(self, path: Path | str = Path(), file: str = '') -> None:
+    def dates(self, path: Path | str = Path(), file: str = '', shard: int = 0, workers: int = 0) -> None:
         '''Date overview by date of collect and date of flight
         
-        Output separated excel with conditional formats'''
+        Output separated excel with conditional formats
+        
+        - shard: `int`, months of dates in each excel, written in `workers` processes 
+        as each is built; the excel of index links to sheets in them with their averages. 
+        
+                default: `0`, all dates in one excel, averages of the index are formulas'''
         
         if not len(self.__merge):
             self.__merge = self.merge()
-        data = self.__merge.sort_values('date_flight')
+        data = self.__data()
         total_flights = sorted(date.fromordinal(ordinal) \
             for ordinal in data['date_flight'].unique())
         total_colls = sorted(date.fromordinal(ordinal) \
             for ordinal in data['date_coll'].unique())
-        total, idct, percent = len(data), -1, 0
+        percent = -1
         
         if file == '' or file is None:
             file_coll = f"overview_{self.__root.name}_coll_dates.xlsx"
@@ -431,250 +1028,144 @@ class Rebuilder():
         if (Path(path) / Path(file_flight)).exists():
             file_flight = file_flight.replace(".xlsx", f"_{tstring}.xlsx")
         
-        '''Add index aka index'''
-        wb_coll = Workbook()
-        index_coll = wb_coll.active
-        index_coll.title = self.index_name
-        index_coll.column_dimensions['A'].width = 11
-        index_coll.freeze_panes = 'E2'
-        index_coll.append(["收集日期", "航班总数", "航线总数", "航班日数"] + total_flights)
-        for idx in range(1, 5):
-            index_coll.cell(1, idx).font = self.set_bold
-            index_coll.cell(1, idx).alignment = self.set_align
-        for idx in range(5, index_coll.max_column + 1):
-            cell = index_coll.cell(1, idx)
-            cell.number_format = self.set_date
-            cell.alignment = self.set_align
-            cell.hyperlink = f"{file_flight}#'{total_flights[idx - 5].strftime('%m-%d')}'!A2"
-            cell.font = self.set_hyperlink
-            cell.alignment = self.set_align
-        
-        wb_flight = Workbook()
-        index_flight = wb_flight.active
-        index_flight.title = self.index_name
-        index_flight.column_dimensions['A'].width = 11
-        index_flight.freeze_panes = 'E2'
-        index_flight.append(["航班日期", "航班总数", "航线总数", "收集日数"] + total_colls)
-        for idx in range(1, 5):
-            index_flight.cell(1, idx).font = self.set_bold
-            index_flight.cell(1, idx).alignment = self.set_align
-        for idx in range(5, index_flight.max_column + 1):
-            cell = index_flight.cell(1, idx)
-            cell.number_format = self.set_date
-            cell.alignment = self.set_align
-            cell.hyperlink = f"{file_coll}#'{total_colls[idx - 5].strftime('%m-%d')}'!C3"
-            cell.font = self.set_hyperlink
-            cell.alignment = self.set_align
+        '''Add index aka index, sheets are in the excel of its months when sharded'''
+        files_coll = self.__monthly(total_colls, file_coll, shard)
+        files_flight = self.__monthly(total_flights, file_flight, shard)
+        book_coll = ReportBook(self.index_name, files_coll if shard > 0 else {})
+        index_coll = book_coll.sheet(self.index_name, 'E2', {'A': 11})
+        index_coll.append(["收集日期", "航班总数", "航线总数", "航班日数"] + total_flights, 
+                          ['header'] * 4 + ['date_link'] * len(total_flights), 
+                          {idx: f"{files_flight[day.strftime('%m-%d')]}#'{day.strftime('%m-%d')}'!A2" for idx, day in enumerate(total_flights, 5)})
+        
+        book_flight = ReportBook(self.index_name, files_flight if shard > 0 else {})
+        index_flight = book_flight.sheet(self.index_name, 'E2', {'A': 11})
+        index_flight.append(["航班日期", "航班总数", "航线总数", "收集日数"] + total_colls, 
+                            ['header'] * 4 + ['date_link'] * len(total_colls), 
+                            {idx: f"{files_coll[day.strftime('%m-%d')]}#'{day.strftime('%m-%d')}'!C3" for idx, day in enumerate(total_colls, 5)})
+        
+        
+        '''Aggregate both date grids before writing, 
+        cell, row and footer averages are all from sums and counts of the grids'''
+        print(f"\rmerging dates >> {0:03d}", end = '%')
+        grid_coll = self.date_grid(by = 'date_coll')
+        grid_flight = self.date_grid(by = 'date_flight')
+        median_coll = data.groupby(['date_coll', 'route'], observed = True)['price_rate'].median()
+        median_flight = data.groupby(['date_flight', 'route'], observed = True)['price_rate'].median()
+        medians_coll = data.groupby(['date_coll'], observed = True)['price_rate'].median()
+        medians_flight = data.groupby(['date_flight'], observed = True)['price_rate'].median()
+        idct, total = 0, len(medians_coll) + len(medians_flight)
+        shards, pending = ShardWriter(workers), {}
         
         
         '''Append date of collect data'''
-        sheets_coll = data.groupby(["date_coll"])
-        for coll_date, group in sheets_coll:
+        sums, counts = grid_coll['sum'].groupby(level = 0).sum(), grid_coll['count'].groupby(level = 0).sum()
+        for coll_date in medians_coll.index:
+            idct += 1
+            if percent != int(idct / total * 100):
+                percent = int(idct / total * 100)
+                print(f"\rmerging dates >> {percent:03d}", end = '%')
             sheet = date.fromordinal(coll_date)
-            ws = wb_coll.create_sheet(sheet.strftime("%m-%d"))
-            row = {}
-            footers = ['平均', group["price_rate"].median(), group["price_rate"].mean()]
-            header = [sheet, len(group), len(group["route"].unique()), len(group["date_flight"].unique())]
-            flight_dates = sorted(group["date_flight"].unique())
-            routes, rows = group.groupby(["route"]), group.groupby(["date_flight"])
+            flight_dates = counts.columns[counts.loc[coll_date] > 0]
+            cells, count = grid_coll['sum'].loc[coll_date], grid_coll['count'].loc[coll_date]
+            footers = ['平均', medians_coll[coll_date], sums.loc[coll_date].sum() / counts.loc[coll_date].sum()] + \
+                (sums.loc[coll_date, flight_dates] / counts.loc[coll_date, flight_dates]).tolist()
+            header = [sheet, int(counts.loc[coll_date].sum()), len(cells), len(flight_dates)]
             title = {
                 'date': ["航线 \ 日期", "折扣中位", "折扣均值"], 
                 'week': ["(星期)", None, None], 
-                'adv': ["(提前天数)", None, None]}
+                'adv': ["(提前天数)", None, "返回索引"]}
             for ordinal in flight_dates:
                 title['date'].append(date.fromordinal(ordinal))
                 title['week'].append(date.fromordinal(ordinal).isoweekday())
                 title['adv'].append(ordinal - coll_date)
-                try:
-                    footers.append(rows.get_group(ordinal)["price_rate"].mean())
-                except:
-                    footers.append(None)
-            
-            for route, group in routes:
-                idct += len(group)
-                if percent != int(idct / total * 25):
-                    percent = int(idct / total * 25)
-                    print(f"\rmerging dates >> {percent:03d}", end = '%')
-                group.sort_values('date_flight', inplace = True)
-                rows = group.groupby(["date_flight"])
-                row[route] = [route, group["price_rate"].median(), group["price_rate"].mean()]
-                for ordinal in flight_dates:
-                    try:
-                        row[route].append(rows.get_group(ordinal)["price_rate"].mean())
-                    except:
-                        row[route].append(None)
-                del rows
-            del routes
             
-            '''Format sheet'''
-            for item in title.values():
-                ws.append(item)
-            ws.cell(1, 1).hyperlink = f"#'{self.index_name}'!A1"
-            ws.cell(1, 1).font = self.set_hyperlink
-            for idx in range(4, ws.max_column + 1):
-                ws.cell(1, idx).number_format = self.set_date
+            means = cells[flight_dates] / count[flight_dates]
+            means = means.astype(object).where(means.notna(), None)
+            styles = [None] + ['percent'] * (len(footers) - 1)
+            rows = [(title['date'], [None, None, None] + ['date'] * len(flight_dates), {1: None}), 
+                    (title['week'], ), (title['adv'], None, {3: None})]
+            for route in cells.index:
+                rows.append(([route, median_coll[(coll_date, route)], cells.loc[route].sum() / count.loc[route].sum()] + \
+                    means.loc[route].tolist(), styles))
+            rows.append((footers, styles))
             
-            for route in row.values():
-                ws.append(route)
-            for cols in ws.iter_cols(2, ws.max_column, 4, ws.max_row):
-                for cell in cols:
-                    cell.number_format = self.set_percent
-            ws.freeze_panes = 'D4'
-            ws.column_dimensions['A'].width = 14
-            
-            ws.append(footers)
-            for idx in range(2, ws.max_column + 1):
-                ws.cell(ws.max_row, idx).number_format = self.set_percent
+            '''Sheet condition format, rates above the average of the route in whole rows'''
+            last, end = get_column_letter(len(footers)), len(rows)
+            formats = [(f"B4:B{end - 1}", [self.__diffrule(0, 'cellIs', '>', [f"$B${end}"])]), 
+                       (f"C4:C{end - 1}", [self.__diffrule(0, 'cellIs', '>', [f"$C${end}"])]), 
+                       (f"D4:{last}{end - 1}", self.__striped('ROW', 'D4 > $C4'))]
+            self.__sheet(shards, book_coll, pending, path, file_coll, files_coll[sheet.strftime("%m-%d")], 
+                         {'title': sheet.strftime("%m-%d"), 'rows': rows, 'formats': formats, 
+                          'freeze': 'D4', 'widths': {'A': 14}}, coll_date == medians_coll.index[-1])
             
             ratios = list(None for _ in total_flights)
-            for item in title["date"][3:]:
-                idx = total_flights.index(item)
-                _idx = title["date"].index(item)
-                ratios[idx] = f"='{ws.title}'!{ws.cell(ws.max_row, _idx + 1).coordinate}"
-            index_coll.append(header + ratios)
-            cell = index_coll.cell(index_coll.max_row, 1)
-            cell.hyperlink = f"#'{ws.title}'!C3"
-            cell.font = self.set_hyperlink
-        del sheets_coll
+            for idx, item in enumerate(title["date"][3:], 4):
+                ratios[total_flights.index(item)] = footers[idx - 1] if shard > 0 else \
+                    f"='{sheet.strftime('%m-%d')}'!{get_column_letter(idx)}{end}"
+            index_coll.append(header + ratios, [None] * 4 + ['percent'] * len(ratios), {1: f"'{sheet.strftime('%m-%d')}'!C3"})
+        index_coll.close()
         
         
         '''Append date of flight data'''
-        sheets_flight = data.groupby(["date_flight"])
-        for flight_date, group in sheets_flight:
+        sums, counts = grid_flight['sum'].groupby(level = 0).sum(), grid_flight['count'].groupby(level = 0).sum()
+        for flight_date in medians_flight.index:
+            idct += 1
+            if percent != int(idct / total * 100):
+                percent = int(idct / total * 100)
+                print(f"\rmerging dates >> {percent:03d}", end = '%')
             sheet = date.fromordinal(flight_date)
-            ws = wb_flight.create_sheet(sheet.strftime("%m-%d"))
-            row = {}
-            footers = ['平均', group["price_rate"].median(), group["price_rate"].mean()]
-            header = [sheet, len(group), len(group["route"].unique()), len(group["date_coll"].unique())]
-            coll_dates = sorted(group["date_coll"].unique())
-            routes, rows = group.groupby(["route"]), group.groupby(["date_coll"])
+            coll_dates = counts.columns[counts.loc[flight_date] > 0]
+            cells, count = grid_flight['sum'].loc[flight_date], grid_flight['count'].loc[flight_date]
+            footers = ['平均', medians_flight[flight_date], sums.loc[flight_date].sum() / counts.loc[flight_date].sum()] + \
+                (sums.loc[flight_date, coll_dates] / counts.loc[flight_date, coll_dates]).tolist()
+            header = [sheet, int(counts.loc[flight_date].sum()), len(cells), len(coll_dates)]
             title = ["航线 \ 收集", "折扣中位", "折扣均值"]
             for ordinal in coll_dates:
                 title.append(date.fromordinal(ordinal))
-                try:
-                    footers.append(rows.get_group(ordinal)["price_rate"].mean())
-                except:
-                    footers.append(None)
-            
-            for route, group in routes:
-                idct += len(group)
-                if percent != int(idct / total * 25 + 25):
-                    percent = int(idct / total * 25 + 25)
-                    print(f"\rmerging dates >> {percent:03d}", end = '%')
-                group.sort_values('date_coll', inplace = True)
-                rows = group.groupby(["date_coll"])
-                row[route] = [route, group["price_rate"].median(), group["price_rate"].mean()]
-                for ordinal in coll_dates:
-                    try:
-                        row[route].append(rows.get_group(ordinal)["price_rate"].mean())
-                    except:
-                        row[route].append(None)
-                del rows
-            del routes
             
-            '''Format sheet'''
-            ws.append(title)
-            ws.cell(1, 1).hyperlink = f"#'{self.index_name}'!A1"
-            ws.cell(1, 1).font = self.set_hyperlink
-            for idx in range(2, ws.max_column + 1):
-                ws.cell(1, idx).number_format = self.set_date
+            means = cells[coll_dates] / count[coll_dates]
+            means = means.astype(object).where(means.notna(), None)
+            styles = [None] + ['percent'] * (len(footers) - 1)
+            rows = [(title, [None] + ['date'] * (len(title) - 1), {1: None})]
+            for route in cells.index:
+                rows.append(([route, median_flight[(flight_date, route)], cells.loc[route].sum() / count.loc[route].sum()] + \
+                    means.loc[route].tolist(), styles))
+            rows.append((footers, styles))
             
-            for route in row.values():
-                ws.append(route)
-            for cols in ws.iter_cols(2, ws.max_column, 2, ws.max_row):
-                for cell in cols:
-                    cell.number_format = self.set_percent
-            ws.freeze_panes = 'D2'
-            ws.column_dimensions['A'].width = 14
-            
-            ws.append(footers)
-            for idx in range(2, ws.max_column + 1):
-                ws.cell(ws.max_row, idx).number_format = self.set_percent
+            '''Sheet condition format, rates above the average of the route in whole rows'''
+            last, end = get_column_letter(len(footers)), len(rows)
+            formats = [(f"B4:B{end - 1}", [self.__diffrule(0, 'cellIs', '>', [f"$B${end}"])]), 
+                       (f"C4:C{end - 1}", [self.__diffrule(0, 'cellIs', '>', [f"$C${end}"])]), 
+                       (f"D2:{last}{end - 1}", self.__striped('ROW', 'D2 > $C2'))]
+            self.__sheet(shards, book_flight, pending, path, file_flight, files_flight[sheet.strftime("%m-%d")], 
+                         {'title': sheet.strftime("%m-%d"), 'rows': rows, 'formats': formats, 
+                          'freeze': 'D2', 'widths': {'A': 14}}, flight_date == medians_flight.index[-1])
             
             ratios = list(None for _ in total_colls)
-            for item in title[3:]:
-                idx = total_colls.index(item)
-                _idx = title.index(item)
-                ratios[idx] = f"='{ws.title}'!{ws.cell(ws.max_row, _idx + 1).coordinate}"
-            index_flight.append(header + ratios)
-            cell = index_flight.cell(index_flight.max_row, 1)
-            cell.hyperlink = f"#'{ws.title}'!A2"
-            cell.font = self.set_hyperlink
-        del sheets_flight
-        
-        
-        '''Sheets condition format'''
-        for cols in index_coll.iter_cols(5, index_coll.max_column, 2, index_coll.max_row):
-            for cell in cols:
-                cell.number_format = self.set_percent
-        total, idct = len(wb_coll.sheetnames), 0
-        for ws in wb_coll:
-            idct += 1
-            if percent != int(idct / total * 25 + 50):
-                percent = int(idct / total * 25 + 50)
-                print(f"\rmerging dates >> {percent:03d}", end = '%')
-            if ws.title == self.index_name:
-                continue
-            cell = ws.cell(3, 3, "返回索引")
-            cell.hyperlink = f"#'{self.index_name}'!A1"
-            cell.font = self.set_hyperlink
-            med_string = f"B4:B{ws.max_row - 1}"
-            med_rule = self.__diffrule(0, 'cellIs', '>', [f"$B${ws.max_row}"])
-            ws.conditional_formatting.add(med_string, med_rule)
-            avg_string = f"C4:C{ws.max_row - 1}"
-            avg_rule = self.__diffrule(0, 'cellIs', '>', [f"$C${ws.max_row}"])
-            ws.conditional_formatting.add(avg_string, avg_rule)
-            for row in range(4, ws.max_row):
-                rstring = f"{ws.cell(row, 4).coordinate}:{ws.cell(row, ws.max_column).coordinate}"
-                ws.conditional_formatting.add(rstring, self.__diffrule(row, 'cellIs', '>', [f"$C${row}"]))
-        
-        
-        for cols in index_flight.iter_cols(5, index_flight.max_column, 2, index_flight.max_row):
-            for cell in cols:
-                cell.number_format = self.set_percent
-        total, idct = len(wb_flight.sheetnames), 0
-        for ws in wb_flight:
-            idct += 1
-            if percent != int(idct / total * 25 + 75):
-                percent = int(idct / total * 25 + 75)
-                print(f"\rmerging dates >> {percent:03d}", end = '%')
-            if ws.title == self.index_name:
-                continue
-            med_string = f"B4:B{ws.max_row - 1}"
-            med_rule = self.__diffrule(0, 'cellIs', '>', [f"$B${ws.max_row}"])
-            ws.conditional_formatting.add(med_string, med_rule)
-            avg_string = f"C4:C{ws.max_row - 1}"
-            avg_rule = self.__diffrule(0, 'cellIs', '>', [f"$C${ws.max_row}"])
-            ws.conditional_formatting.add(avg_string, avg_rule)
-            for row in range(2, ws.max_row):
-                rstring = f"{ws.cell(row, 4).coordinate}:{ws.cell(row, ws.max_column).coordinate}"
-                ws.conditional_formatting.add(rstring, self.__diffrule(row, 'cellIs', '>', [f"$C${row}"]))
+            for idx, item in enumerate(title[3:], 4):
+                ratios[total_colls.index(item)] = footers[idx - 1] if shard > 0 else \
+                    f"='{sheet.strftime('%m-%d')}'!{get_column_letter(idx)}{end}"
+            index_flight.append(header + ratios, [None] * 4 + ['percent'] * len(ratios), {1: f"'{sheet.strftime('%m-%d')}'!A2"})
+        index_flight.close()
         
         '''Output merged data'''
         print("\r saving")
-        wb_coll.save(Path(path) / Path(file_coll))
-        wb_coll.close
-        wb_flight.save(Path(path) / Path(file_flight))
-        wb_flight.close
+        book_coll.save(Path(path) / Path(file_coll))
+        book_flight.save(Path(path) / Path(file_flight))
+        shards.wait()
     
     
-    def routes(self, path: Path | str = Path(), file: str = ''):
-        '''Route overview'''
+    def routes(self, path: Path | str = Path(), file: str = '', shard: int = 0, workers: int = 0):
+        '''Route overview
+        
+        - shard: `int`, city pairs (both directions) of route sheets in each excel, 
+        written in `workers` processes as each is built; the excel of index and overviews links to them. 
+        
+                default: `0`, all in one excel'''
         if not len(self.__merge):
             self.__merge = self.merge()
-        data = self.__merge.copy()
-        
-        if 'density_day' not in data.keys():
-            data['density_day'] = data.groupby(["date_flight", \
-                "route", "date_coll"])['date_flight'].transform("count")
-        if 'ratio_daily' not in data.keys():
-            data['ratio_daily'] = data["price_rate"] / data.groupby(["date_coll", \
-                "date_flight", "route"])["price_rate"].transform("mean")
-        if 'hour_comp' not in data.keys():
-            data['hour_comp'] = data.groupby(["date_coll","date_flight", \
-                "hour_dep", "route"])["airline"].transform("nunique")
-        
-        overview, total = data.groupby(["route"]), len(data)
+        data = self.__data('density_day', 'ratio_daily', 'hour_comp')
+        total = len(data)
         title = [
             '航线', '总计', '航班日数', '收集日数', '机型数量', '全价', 
             '折扣平均', '折扣中位', '运营航司', '时段竞争', '日航班数']
@@ -684,6 +1175,34 @@ class Rebuilder():
             for ordinal in data['date_flight'].unique())
         title_coll = {}
         
+        '''Aggregate all routes in a few passes, then split by route'''
+        print(f"\rmerging routes >> {0:03d}", end = '%')
+        overview = data.groupby(["route"], observed = True).agg(
+            rows = ('price_rate', 'size'), date_flight = ('date_flight', 'nunique'),
+            date_coll = ('date_coll', 'nunique'), type = ('type', 'nunique'),
+            mean = ('price_rate', 'mean'), median = ('price_rate', 'median'),
+            airline = ('airline', 'nunique'), hour_comp = ('hour_comp', 'mean'),
+            density_day = ('density_day', 'mean'))
+        hours = data.groupby(["route", "hour_dep"], observed = True).agg(
+            count = ('hour_dep', 'size'), hour_comp = ('hour_comp', 'mean'),
+            ratio_daily = ('ratio_daily', 'mean')).unstack()
+        hour_count = hours['count'].reindex(columns = range(5, 25)).fillna(0)
+        hour_comp = hours['hour_comp'].reindex(columns = range(5, 25))
+        hour_ratio = hours['ratio_daily'].reindex(columns = range(5, 25))
+        advs = self.route_adv_curve()
+        adv_mean = advs['mean'].unstack().reindex(columns = data['day_adv'].unique())
+        adv_std = advs['std'].unstack().reindex(columns = data['day_adv'].unique())
+        dates = data.groupby(["route", "date_flight"], observed = True)['price_rate'].agg(['mean', 'median', 'std'])
+        date_mean = dates['mean'].unstack().reindex(columns = data['date_flight'].unique())
+        date_median = dates['median'].unstack().reindex(columns = data['date_flight'].unique())
+        date_std = dates['std'].unstack().reindex(columns = data['date_flight'].unique())
+        colls = data.groupby(["route", "date_coll"], observed = True)['price_rate'].mean()
+        grid_adv = data.groupby(["route", "date_flight", "day_adv"], observed = True)['price_rate'].mean()
+        grid_coll = data.groupby(["route", "date_flight", "date_coll"], observed = True)['price_rate'].mean()
+        flights = data[['route', 'date_flight']].drop_duplicates().groupby(
+            ["route"], observed = True)['date_flight'].agg(list)
+        print(f"\rmerging routes >> {40:03d}", end = '%')
+        
         route_density = {}
         route_ratio = {}
         route_comp = {}
@@ -696,238 +1215,160 @@ class Rebuilder():
         headers = {}
         footers = {}
         idct, percent = 0, -1
-        for name, group in overview:
-            idct += len(group)
-            if percent != int(idct / total * 80):
-                percent = int(idct / total * 80)
+        for name, stats in zip(overview.index, overview.to_dict('records')):
+            idct += stats['rows']
+            if percent != int(idct / total * 40 + 40):
+                percent = int(idct / total * 40 + 40)
                 print(f"\rmerging routes >> {percent:03d}", end = '%')
             
             headers[name] = [
-                name, len(group), group['date_flight'].nunique(), 
-                group['date_coll'].nunique(), group['type'].nunique(), 
-                Route.fromformat(name).airfare, group['price_rate'].mean(), 
-                group['price_rate'].median(), group['airline'].nunique(), 
-                round(group['hour_comp'].mean(), 2), round(group['density_day'].mean())]
+                name, stats['rows'], stats['date_flight'],
+                stats['date_coll'], stats['type'],
+                Route.fromformat(name).airfare, stats['mean'],
+                stats['median'], stats['airline'],
+                round(float64(stats['hour_comp']), 2), round(stats['density_day'])]
             footers[name] = {'date': {}, 'day': [], 'coll': []}
-            route_comp[name] = []
-            route_density[name] = []
-            route_ratio[name] = []
+            route_comp[name] = list(comp if comp else None for comp in hour_comp.loc[name].to_numpy())
+            route_density[name] = list(round(count / stats['rows'], 2) if count else None \
+                for count in hour_count.loc[name].to_numpy())
+            route_ratio[name] = list(round(ratio, 2) if ratio else None for ratio in hour_ratio.loc[name].to_numpy())
             route_adv_mean[name] = []
             route_adv_std[name] = []
             route_date[name] = {}
             route_date_mean[name] = []
             route_date_std[name] = []
             route_coll[name] = {}
-            title_adv[name] = sorted(group['day_adv'].unique())
-            title_coll[name] = sorted(group['date_coll'].unique(), reverse = True)
+            title_adv[name] = advs.loc[name].index.tolist()
+            title_coll[name] = colls.loc[name].index.tolist()[::-1]
             
-            for hour in range(5, 25):
-                hour_airline = group.loc[group['hour_dep'] == hour].get('hour_comp', 0).mean()
-                route_comp[name].append(hour_airline if hour_airline else None)
-                hour_count = group['hour_dep'].value_counts().get(hour, 0)
-                route_density[name].append(round(hour_count / len(group['hour_dep']), 2) \
-                    if hour_count else None)
-                hour_ratio = group.loc[group['hour_dep'] == hour].get('ratio_daily', 0).mean()
-                route_ratio[name].append(round(hour_ratio, 2) if hour_ratio else None)
-            for day in data['day_adv'].unique():
-                mean = group.loc[group['day_adv'] == day].get('price_rate', 0).mean()
+            for mean, std in zip(adv_mean.loc[name], adv_std.loc[name]):
                 if mean:
                     route_adv_mean[name].append(mean)
                 else:
                     route_adv_mean[name].append(None)
                     continue
-                std = group.loc[group['day_adv'] == day].get('price_rate', 0).std()
                 route_adv_std[name].append(std if std else None)
-            for ordinal in data['date_flight'].unique():
-                mean = group.loc[group['date_flight'] == ordinal].get('price_rate', 0).mean()
+            for ordinal, mean, median, std in zip(date_mean.columns, date_mean.loc[name], 
+                                                  date_median.loc[name], date_std.loc[name]):
                 if mean:
                     route_date_mean[name].append(mean)
-                    footers[name]['date'][ordinal] = [mean, 
-                        group.loc[group['date_flight'] == ordinal].get('price_rate', 0).median()]
+                    footers[name]['date'][ordinal] = [mean, median]
                 else:
                     route_date_mean[name].append(None)
                     continue
-                std = group.loc[group['date_flight'] == ordinal].get('price_rate', 0).std()
                 route_date_std[name].append(std if std else None)
-            for day in group['date_flight'].unique():
+            for day in flights[name]:
                 route_date[name][day] = list(None for _ in title_adv[name])
                 route_coll[name][day] = list(None for _ in title_coll[name])
-            for (ordinal, day), _group in group.groupby(['date_flight', 'day_adv']):
-                route_date[name][ordinal][title_adv[name].index(day)] = _group['price_rate'].mean()
-            for (ordinal, day), _group in group.groupby(['date_flight', 'date_coll']):
-                route_coll[name][ordinal][title_coll[name].index(day)] = _group['price_rate'].mean()
-            for day, _group in group.groupby(['day_adv']):
-                footers[name]['day'].append(_group['price_rate'].mean())
-            for day, _group in group.groupby(['date_coll']):
-                footers[name]['coll'].append(_group['price_rate'].mean())
-            footers[name]['coll'].reverse()
-        
-        wb = self.indexbook()
-        for sheet in ('时刻密度', '时刻竞争', '时刻系数'):
-            ws = wb.create_sheet(sheet)
-            ws.append(title_hour)
-            for idx in range(1, len(title_hour) + 1):
-                ws.cell(1, idx).font = self.set_bold
-                ws.cell(1, idx).alignment = self.set_align
-        for sheet in ('单日平均折扣', '单日标准差'):
-            ws = wb.create_sheet(sheet)
-            ws.append(title_date)
-            for idx in range(1, len(title_date) + 1):
-                if idx > len(title):
-                    ws.cell(1, idx).number_format = self.set_date
-                ws.cell(1, idx).font = self.set_bold
-                ws.cell(1, idx).alignment = self.set_align
-        for sheet in ('提前平均折扣', '提前标准差'):
-            ws = wb.create_sheet(sheet)
-            ws.append(title_adv["overview"])
-            for idx in range(1, len(title_adv["overview"]) + 1):
-                ws.cell(1, idx).font = self.set_bold
-                ws.cell(1, idx).alignment = self.set_align
+            index = {day: idx for idx, day in enumerate(title_adv[name])}
+            for (ordinal, day), mean in grid_adv.loc[name].items():
+                route_date[name][ordinal][index[day]] = mean
+            index = {day: idx for idx, day in enumerate(title_coll[name])}
+            for (ordinal, day), mean in grid_coll.loc[name].items():
+                route_coll[name][ordinal][index[day]] = mean
+            footers[name]['day'] = advs.loc[name]['mean'].tolist()
+            footers[name]['coll'] = colls.loc[name].tolist()[::-1]
+
+        '''Output file, sheets of a route and of its return are in the same excel when sharded'''
+        if file == '' or file is None:
+            file = f"overview_{self.__root.name}_routes.xlsx"
+        elif not file.endswith(".xlsx"):
+            file += ".xlsx"
+        if not isinstance(path, Path):
+            path = Path(path)
+        path.mkdir(parents = True, exist_ok = True)
+        if (path / Path(file)).exists():
+            time = datetime.today().strftime("%H%M%S")
+            file = file.replace(".xlsx", f"_{time}.xlsx")
+        pairs, files = {}, {}
+        if shard > 0:
+            for name in headers.keys():
+                pair = frozenset(name.split('-', 1))
+                pairs.setdefault(pair, len(pairs))
+                files[name] = files[f"({name})"] = file.replace(".xlsx", f"_{pairs[pair] // shard + 1}.xlsx")
+        
+        book = self.indexbook(files = files)
+        sheets = {}
+        for sheet, header in (('时刻密度', title_hour), ('时刻竞争', title_hour), ('时刻系数', title_hour), 
+                              ('单日平均折扣', title_date), ('单日标准差', title_date), 
+                              ('提前平均折扣', title_adv["overview"]), ('提前标准差', title_adv["overview"])):
+            ws = sheets[sheet] = book.sheet(sheet, 'L2', {'A': 14})
+            ws.append(header, ['header'] * len(title) + \
+                ['date_header' if header is title_date else 'header'] * (len(header) - len(title)))
         
         for name in headers.keys():
-            wb['时刻密度'].append(headers[name] + route_density[name])
-            wb['时刻竞争'].append(headers[name] + route_comp[name])
-            wb['时刻系数'].append(headers[name] + route_ratio[name])
-            wb['提前平均折扣'].append(headers[name] + route_adv_mean[name])
-            wb['提前标准差'].append(headers[name] + route_adv_std[name])
-            wb['单日平均折扣'].append(headers[name] + route_date_mean[name])
-            wb['单日标准差'].append(headers[name] + route_date_std[name])
-        for ws in wb:
-            if ws.title == self.index_name:
-                continue
-            ws.freeze_panes = 'L2'
-            ws.column_dimensions['A'].width = 14
-            for idx in range(2, ws.max_row + 1):
-                ws.cell(idx, 1).hyperlink = f"#'{ws.cell(idx, 1).value}'!B1"
-                ws.cell(idx, 1).font = self.set_hyperlink
-                ws.cell(idx, 7).number_format = self.set_percent
-                ws.cell(idx, 8).number_format = self.set_percent
+            for sheet, values in (('时刻密度', route_density), ('时刻竞争', route_comp), ('时刻系数', route_ratio), 
+                                  ('提前平均折扣', route_adv_mean), ('提前标准差', route_adv_std), 
+                                  ('单日平均折扣', route_date_mean), ('单日标准差', route_date_std)):
+                sheets[sheet].append(headers[name] + values[name], {7: 'percent', 8: 'percent'}, {1: f"'{name}'!B1"})
+        for ws in sheets.values():
+            ws.close()
         
         total, idct = len(headers), 0
-        for name in headers.keys():
+        shards, pending = ShardWriter(workers), {}
+        names = sorted(headers.keys(), key = lambda name: pairs.get(frozenset(name.split('-', 1)), 0) // max(shard, 1))
+        for name in names:
             idct += 1
             if percent != int(idct / total * 20 + 80):
                 percent = int(idct / total * 20 + 80)
                 print(f"\rmerging routes >> {percent:03d}", end = '%')
+            dep, arr = name.split('-', 1)
             
             '''Append data by days advanced'''
-            ws = wb.create_sheet(name)
-            ws.append(['日期\提前天', '星期', '折扣平均', '折扣中位'] + title_adv[name])
-            for idx in range(2, 5):
-                cell = ws.cell(1, idx)
-                cell.alignment = self.set_align
-                cell.font = self.set_bold
+            rows = [(['日期\提前天', '星期', '折扣平均', '折扣中位'] + title_adv[name], 
+                     [None, 'header', 'header', 'header'], {1: None})]
+            styles = [None, None] + ['percent'] * (len(title_adv[name]) + 2)
             for ordinal in route_date[name]:
                 day = date.fromordinal(ordinal)
-                ws.append([day, day.isoweekday()] + \
-                    footers[name]['date'][ordinal] + route_date[name][ordinal])
-            ws.cell(1, 1).hyperlink = f"#'{self.index_name}'!A1"
-            ws.cell(1, 1).font = self.set_hyperlink
-            ws.freeze_panes = 'E2'
-            ws.column_dimensions['A'].width = 12
-            ws.column_dimensions["B"].width = 6
-            ws.append(['按收集日排序', '返程', '返回索引', '平均'] + footers[name]['day'])
-            for cols in ws.iter_cols(3, ws.max_column, 2, ws.max_row):
-                for cell in cols:
-                    cell.number_format = self.set_percent
+                rows.append(([day, day.isoweekday()] + \
+                    footers[name]['date'][ordinal] + route_date[name][ordinal], styles))
+            rows.append((['按收集日排序', '返程', '返回索引', '平均'] + footers[name]['day'], 
+                         [None, None, 'link'] + styles[3:], {1: f"'({dep}-{arr})'!A2", 2: f"'{arr}-{dep}'!A2", 3: None}))
             
-            '''Sheets condition format and averages'''
-            med_string = f"D2:D{ws.max_row - 1}"
-            med_rule = self.__diffrule(0, 'aboveAverage')
-            ws.conditional_formatting.add(med_string, med_rule)
-            avg_string = f"C2:C{ws.max_row - 1}"
-            avg_rule = self.__diffrule(0, 'aboveAverage')
-            ws.conditional_formatting.add(avg_string, avg_rule)
-            for idx in range(5, ws.max_column + 1):
-                rstring = f"{ws.cell(2, idx).coordinate}:{ws.cell(ws.max_row - 1, idx).coordinate}"
-                rules = (idx, 'cellIs', '>', [footers[name]['day'][idx - 5]])
-                ws.conditional_formatting.add(rstring, self.__diffrule(*rules))
-            
-            cell, (dep, arr) = ws.cell(ws.max_row, 1), name.split('-', 1)
-            cell.hyperlink = f"#'({dep}-{arr})'!A2"
-            cell.font = self.set_hyperlink
-            cell = ws.cell(ws.max_row, 2)
-            cell.hyperlink = f"#'{arr}-{dep}'!A2"
-            cell.font = self.set_hyperlink
-            cell = ws.cell(ws.max_row, 3)
-            cell.hyperlink = f"#'{self.index_name}'!A1"
-            cell.font = self.set_hyperlink
+            '''Sheets condition format, rates above the average of the day advanced in whole columns'''
+            end = len(rows)
+            formats = [(f"D2:D{end - 1}", [self.__diffrule(0, 'aboveAverage')]), 
+                       (f"C2:C{end - 1}", [self.__diffrule(0, 'aboveAverage')]), 
+                       (f"E2:{get_column_letter(len(title_adv[name]) + 4)}{end - 1}", 
+                        self.__striped('COLUMN', f"E2 > E${end}"))]
+            self.__sheet(shards, book, pending, path, file, files.get(name, file), 
+                         {'title': name, 'rows': rows, 'formats': formats, 'freeze': 'E2', 'widths': {'A': 12, 'B': 6}})
             
             '''Append data by date of collect'''
-            ws = wb.create_sheet(f"({name})")
-            ws.append(['日期\收集日', '星期', '折扣平均', '折扣中位'] + \
-                list(date.fromordinal(ordinal) for ordinal in title_coll[name]))
-            for idx in range(2, 5):
-                cell = ws.cell(1, idx)
-                cell.alignment = self.set_align
-                cell.font = self.set_bold
-            for idx in range(5, ws.max_column + 1):
-                cell = ws.cell(1, idx)
-                cell.number_format = self.set_date
-                cell.alignment = self.set_align
+            rows = [(['日期\收集日', '星期', '折扣平均', '折扣中位'] + \
+                list(date.fromordinal(ordinal) for ordinal in title_coll[name]), 
+                [None, 'header', 'header', 'header'] + ['date_center'] * len(title_coll[name]), {1: None})]
+            styles = [None, None] + ['percent'] * (len(title_coll[name]) + 2)
             for ordinal in route_coll[name]:
                 day = date.fromordinal(ordinal)
-                ws.append([day, day.isoweekday()] + \
-                    footers[name]['date'][ordinal] + route_coll[name][ordinal])
-            ws.cell(1, 1).hyperlink = f"#'{self.index_name}'!A1"
-            ws.cell(1, 1).font = self.set_hyperlink
-            ws.freeze_panes = 'E2'
-            ws.column_dimensions['A'].width = 12
-            ws.column_dimensions["B"].width = 6
-            ws.append(['按提前天排序', '返程', '返回索引', '平均'] + footers[name]['coll'])
-            for cols in ws.iter_cols(3, ws.max_column, 2, ws.max_row):
-                for cell in cols:
-                    cell.number_format = self.set_percent
-            
-            '''Sheets condition format and averages'''
-            med_string = f"D2:D{ws.max_row - 1}"
-            med_rule = self.__diffrule(0, 'aboveAverage')
-            ws.conditional_formatting.add(med_string, med_rule)
-            avg_string = f"C2:C{ws.max_row - 1}"
-            avg_rule = self.__diffrule(0, 'aboveAverage')
-            ws.conditional_formatting.add(avg_string, avg_rule)
-            for idx in range(5, ws.max_column + 1):
-                rstring = f"{ws.cell(2, idx).coordinate}:{ws.cell(ws.max_row - 1, idx).coordinate}"
-                rules = (idx, 'cellIs', '>', [footers[name]['coll'][idx - 5]])
-                ws.conditional_formatting.add(rstring, self.__diffrule(*rules))
+                rows.append(([day, day.isoweekday()] + \
+                    footers[name]['date'][ordinal] + route_coll[name][ordinal], styles))
+            rows.append((['按提前天排序', '返程', '返回索引', '平均'] + footers[name]['coll'], 
+                         [None, None, 'link'] + styles[3:], {1: f"'{dep}-{arr}'!A2", 2: f"'({arr}-{dep})'!A2", 3: None}))
             
-            cell, (dep, arr) = ws.cell(ws.max_row, 1), name.split('-', 1)
-            cell.hyperlink = f"#'{dep}-{arr}'!A2"
-            cell.font = self.set_hyperlink
-            cell = ws.cell(ws.max_row, 2)
-            cell.hyperlink = f"#'({arr}-{dep})'!A2"
-            cell.font = self.set_hyperlink
-            cell = ws.cell(ws.max_row, 3)
-            cell.hyperlink = f"#'{self.index_name}'!A1"
-            cell.font = self.set_hyperlink
+            '''Sheets condition format, rates above the average of the collect date in whole columns'''
+            end = len(rows)
+            formats = [(f"D2:D{end - 1}", [self.__diffrule(0, 'aboveAverage')]), 
+                       (f"C2:C{end - 1}", [self.__diffrule(0, 'aboveAverage')]), 
+                       (f"E2:{get_column_letter(len(title_coll[name]) + 4)}{end - 1}", 
+                        self.__striped('COLUMN', f"E2 > E${end}"))]
+            self.__sheet(shards, book, pending, path, file, files.get(name, file), 
+                         {'title': f"({name})", 'rows': rows, 'formats': formats, 'freeze': 'E2', 
+                          'widths': {'A': 12, 'B': 6}}, name == names[-1])
             
         '''Output merged data'''
-        if file == '' or file is None:
-            file = f"overview_{self.__root.name}_routes.xlsx"
-        elif not file.endswith(".xlsx"):
-            file += ".xlsx"
-        if not isinstance(path, Path):
-            path = Path(path)
-        path.mkdir(parents = True, exist_ok = True)
-        if (path / Path(file)).exists():
-            time = datetime.today().strftime("%H%M%S")
-            file = file.replace(".xlsx", f"_{time}.xlsx")
         print("\r saving")
-        wb.save(path / Path(file))
-        wb.close()
+        book.save(path / Path(file))
+        shards.wait()
     
     
     def airlines(self, path: Path | str = Path(), file: str = ''):
         '''Airline overview'''
         if not len(self.__merge):
             self.__merge = self.merge()
-        data = self.__merge.copy()
-        
-        if 'ratio_daily' not in data.keys():
-            data['ratio_daily'] = data["price_rate"] / data.groupby(["date_coll", \
-                "date_flight", "route"])["price_rate"].transform("mean")
+        data = self.__data('ratio_daily')
         
-        overview, total = data.groupby(["airline"]), len(data)
+        total = len(data)
         title = [
             '航空公司', '总计', '航班日数', '收集日数', 
             '航线数量', '机型数量', '系数平均', '系数中位']
@@ -939,176 +1380,108 @@ class Rebuilder():
         airlines = {}
         hour_density = {}
         hour_ratio = {}
-        route_count = {}
         route_density = {}
         route_ratio = {}
         dep_ap = {}
         
+        '''Aggregate all airlines in a few passes, then split by airline'''
+        print(f"\rmerging airlines >> {0:03d}", end = '%')
+        days = data['date_coll'].astype(int64) * 1000000 + data['date_flight']
+        overview = data.groupby(["airline"], observed = True).agg(
+            rows = ('ratio_daily', 'size'), date_flight = ('date_flight', 'nunique'), 
+            date_coll = ('date_coll', 'nunique'), route = ('route', 'nunique'), 
+            type = ('type', 'nunique'), mean = ('ratio_daily', 'mean'), 
+            median = ('ratio_daily', 'median'))
+        hours = self.airline_hour_profile()
+        hour_count = hours['count'].unstack().reindex(columns = range(5, 25)).fillna(0)
+        hour_mean = hours['mean'].unstack().reindex(columns = range(5, 25))
+        keys = [data['airline'], data['route']]
+        route_days = days.groupby(keys, observed = True).nunique()
+        route_stats = data.groupby(keys, observed = True)['ratio_daily'].agg(['size', 'mean'])
+        keys = [data['airline'], data['dep']]
+        dep_days = days.groupby(keys, observed = True).nunique()
+        dep_count = data.groupby(keys, observed = True).size()
+        grid = data.groupby(["airline", "route", "hour_dep"], observed = True)['ratio_daily'].mean()
+        grid = grid.unstack().reindex(columns = range(5, 25))
+        grid = dict(zip(grid.index, grid.to_numpy()))
+        orders = data[['airline', 'route']].drop_duplicates().groupby(
+            ["airline"], observed = True)['route'].agg(list)
+        index_route = {route: idx for idx, route in enumerate(title_route[len(title):])}
+        index_dep = {dep: idx for idx, dep in enumerate(title_dep[len(title):])}
+        print(f"\rmerging airlines >> {50:03d}", end = '%')
+        
         idct, percent = 0, -1
-        for name, group in overview:
+        for name, stats in zip(overview.index, overview.to_dict('records')):
             headers[name] = [
-                name, len(group), group['date_flight'].nunique(), group['date_coll'].nunique(), 
-                group['route'].nunique(), group['type'].nunique(), group['ratio_daily'].mean(), 
-                group['ratio_daily'].median()]
-            route_count[name] = sorted(group['route'].unique())
-            hour_density[name] = []
-            hour_ratio[name] = []
+                name, stats['rows'], stats['date_flight'], stats['date_coll'], 
+                stats['route'], stats['type'], stats['mean'], stats['median']]
             airlines[name] = {}
-            route_density[name] = list(None for _ in data['route'].unique())
-            route_ratio[name] = list(None for _ in data['route'].unique())
-            dep_ap[name] = list(None for _ in data['dep'].unique())
-            
-            idct += len(group) / 4
-            if percent != int(idct / total * 100):
-                percent = int(idct / total * 100)
-                print(f"\rmerging airlines >> {percent:03d}", end = '%')
-            for hour in range(5, 25):
-                count = group['hour_dep'].value_counts().get(hour, 0)
-                hour_density[name].append(round(count / len(group['hour_dep']), 2) \
-                    if count else None)
-                ratio = group.loc[group['hour_dep'] == hour].get('ratio_daily').mean()
-                hour_ratio[name].append(ratio if ratio else None)
-            
-            idct += len(group) / 4
-            if percent != int(idct / total * 100):
-                percent = int(idct / total * 100)
-                print(f"\rmerging airlines >> {percent:03d}", end = '%')
-            for route in group['route'].unique():
-                airlines[name][route] = []
-                idx = title_route.index(route) - len(title)
-                count = group['route'].value_counts().get(route)
-                days = len(group.loc[group['route'] == route]\
-                    [['date_coll', 'date_flight']].drop_duplicates())
-                route_density[name][idx] = count / days
-                ratio = group.loc[group['route'] == route].get('ratio_daily').mean()
-                route_ratio[name][idx] = ratio
-            
-            idct += len(group) / 4
-            if percent != int(idct / total * 100):
-                percent = int(idct / total * 100)
-                print(f"\rmerging airlines >> {percent:03d}", end = '%')
-            for dep in group['dep'].unique():
-                idx = title_dep.index(dep) - len(title)
-                count = group['dep'].value_counts().get(dep) 
-                dep_ap[name][idx] = count / len(group.loc[group['dep'] == dep]\
-                    [['date_coll', 'date_flight']].drop_duplicates())
+            route_density[name] = list(None for _ in title_route[len(title):])
+            route_ratio[name] = list(None for _ in title_route[len(title):])
+            dep_ap[name] = list(None for _ in title_dep[len(title):])
             
-            idct += len(group) / 4
-            if percent != int(idct / total * 100):
-                percent = int(idct / total * 100)
+            idct += stats['rows']
+            if percent != int(idct / total * 50 + 50):
+                percent = int(idct / total * 50 + 50)
                 print(f"\rmerging airlines >> {percent:03d}", end = '%')
-            for route, _group in group.groupby(['route']):
-                airlines[name][route] = []
-                for hour in range(5, 25):
-                    ratio = _group.loc[_group['hour_dep'] == hour].get('ratio_daily').mean()
-                    airlines[name][route].append(ratio if ratio else None)
-            for route in group['route'].unique():
+            hour_density[name] = list(round(count / stats['rows'], 2) if count else None \
+                for count in hour_count.loc[name].to_numpy())
+            hour_ratio[name] = list(ratio if ratio else None for ratio in hour_mean.loc[name].to_numpy())
+            for route, count, ratio in route_stats.loc[name].itertuples():
+                route_density[name][index_route[route]] = count / route_days[(name, route)]
+                route_ratio[name][index_route[route]] = ratio
+            for dep, count in dep_count.loc[name].items():
+                dep_ap[name][index_dep[dep]] = count / dep_days[(name, dep)]
+            for route in orders[name]:
+                airlines[name][route] = list(ratio if ratio else None for ratio in grid[(name, route)])
                 if routes.get(route):
                     routes[route][name] = airlines[name][route].copy()
                 else:
                     routes[route] = {name: airlines[name][route].copy()}
         
-        wb = self.indexbook(airlines = True)
+        book = self.indexbook(airlines = True)
+        sheets = {}
+        widths = {get_column_letter(idx): 10 for idx in range(len(title) + 1, len(title_route) + 1)}
         for sheet in ('航线密度', '航线系数'):
-            ws = wb.create_sheet(sheet)
-            ws.append(title_route)
-            for idx in range(1, len(title) + 1):
-                ws.cell(1, idx).font = self.set_bold
-                ws.cell(1, idx).alignment = self.set_align
-            for idx in range(len(title) + 1, len(title_route) + 1):
-                cell = ws.cell(1, idx)
-                cell.hyperlink = f"#'{cell.value}'!A1"
-                cell.font = self.set_hyperlink
-                cell.alignment = self.set_align
-                ws.column_dimensions[cell.coordinate[:1]].width = 10
-        
+            ws = sheets[sheet] = book.sheet(sheet, 'I2', dict(widths, A = 13))
+            ws.append(title_route, ['header'] * len(title) + ['link_center'] * (len(title_route) - len(title)), 
+                      {idx: f"'{route}'!A1" for idx, route in enumerate(title_route[len(title):], len(title) + 1)})
         for sheet in ('时刻密度', '时刻系数'):
-            ws = wb.create_sheet(sheet)
-            ws.append(title_hour)
-            for idx in range(1, len(title_hour) + 1):
-                ws.cell(1, idx).font = self.set_bold
-                ws.cell(1, idx).alignment = self.set_align
-        
-        ws = wb.create_sheet('机场计数')
-        ws.append(title_dep)
-        for idx in range(1, len(title_dep) + 1):
-            ws.cell(1, idx).font = self.set_bold
-            ws.cell(1, idx).alignment = self.set_align
+            ws = sheets[sheet] = book.sheet(sheet, 'I2', {'A': 13})
+            ws.append(title_hour, 'header')
+        ws = sheets['机场计数'] = book.sheet('机场计数', 'I2', {'A': 13})
+        ws.append(title_dep, 'header')
         
         for name in headers.keys():
-            wb['航线密度'].append(headers[name] + route_density[name])
-            wb['航线系数'].append(headers[name] + route_ratio[name])
-            wb['时刻密度'].append(headers[name] + hour_density[name])
-            wb['时刻系数'].append(headers[name] + hour_ratio[name])
-            wb['机场计数'].append(headers[name] + dep_ap[name])
-        for sheet in ('时刻系数', '航线系数'):
-            ws = wb[sheet]
-            for cols in ws.iter_cols(len(title) + 1, ws.max_column, 2, ws.max_row):
-                for cell in cols:
-                    cell.number_format = self.set_percent
-        
-        for ws in wb:
-            if ws.title == self.index_name:
-                continue
-            ws.freeze_panes = 'I2'
-            ws.column_dimensions['A'].width = 13
-            for idx in range(2, ws.max_row + 1):
-                ws.cell(idx, 1).hyperlink = f"#'{ws.cell(idx, 1).value}'!A1"
-                ws.cell(idx, 1).font = self.set_hyperlink
-                ws.cell(idx, len(title)).number_format = self.set_percent
-                ws.cell(idx, len(title) - 1).number_format = self.set_percent
+            link = {1: f"'{name}'!A1"}
+            for sheet, values in (('航线密度', route_density), ('航线系数', route_ratio), 
+                                  ('时刻密度', hour_density), ('时刻系数', hour_ratio), ('机场计数', dep_ap)):
+                styles = [None] * (len(title) - 2) + ['percent'] * \
+                    (len(values[name]) + 2 if sheet in ('时刻系数', '航线系数') else 2)
+                sheets[sheet].append(headers[name] + values[name], styles, link)
+        for ws in sheets.values():
+            ws.close()
         
         '''Airline details'''
+        styles = [None] + ['percent'] * 20
         for airline in airlines.keys():
-            ws = wb.create_sheet(airline)
-            ws.append(['航线'] + list(range(5, 25)))
-            ws.freeze_panes = 'B2'
-            ws.column_dimensions['A'].width = 14
+            ws = book.sheet(airline, 'B2', {'A': 14})
+            ws.append(['航线'] + list(range(5, 25)), ['link_header'] + ['header'] * 20, {1: None})
             for route in airlines[airline].keys():
-                ws.append([route] + airlines[airline][route])
-            for idx in range(2, ws.max_row + 1):
-                ws.cell(idx, 1).font = self.set_hyperlink
-                ws.cell(idx, 1).hyperlink = f"#'{ws.cell(idx, 1).value}'!A1"
-            for idx in range(2, 22):
-                ws.cell(1, idx).alignment = self.set_align
-                ws.cell(1, idx).font = self.set_bold
-            for cols in ws.iter_cols(2, ws.max_column, 2, ws.max_row):
-                for cell in cols:
-                    cell.number_format = self.set_percent
-            cell = ws.cell(ws.max_row + 1, 1, '返回索引')
-            cell.hyperlink = f"#'{self.index_name}'!A1"
-            cell.font = self.set_hyperlink
-            ws.cell(1, 1).hyperlink = f"#'{self.index_name}'!A1"
-            ws.cell(1, 1).font = Font(u = "single", color = "0070C0", bold = "b")
-            ws.cell(1, 1).alignment = self.set_align
+                ws.append([route] + airlines[airline][route], styles, {1: f"'{route}'!A1"})
+            ws.append(['返回索引'], links = {1: None})
+            ws.close()
         
         '''Route details'''
         for route in routes.keys():
-            ws = wb.create_sheet(route)
-            ws.append(['航司'] + list(range(5, 25)))
-            ws.freeze_panes = 'B2'
-            ws.column_dimensions['A'].width = 13
+            ws = book.sheet(route, 'B2', {'A': 13})
+            ws.append(['航司'] + list(range(5, 25)), ['link_header'] + ['header'] * 20, {1: None})
             for airline in routes[route].keys():
-                ws.append([airline] + routes[route][airline])
-            for idx in range(2, ws.max_row + 1):
-                ws.cell(idx, 1).font = self.set_hyperlink
-                ws.cell(idx, 1).hyperlink = f"#'{ws.cell(idx, 1).value}'!A1"
-            for idx in range(2, 22):
-                ws.cell(1, idx).alignment = self.set_align
-                ws.cell(1, idx).font = self.set_bold
-            for cols in ws.iter_cols(2, ws.max_column, 2, ws.max_row):
-                for cell in cols:
-                    cell.number_format = self.set_percent
-            cell = ws.cell(ws.max_row + 1, 1, '返回索引')
-            cell.hyperlink = f"#'{self.index_name}'!A1"
-            cell.font = self.set_hyperlink
-            cell = ws.cell(ws.max_row + 1, 1, '返程')
-            route = route.split('-', 1)
-            cell.hyperlink = f"#'{route[1]}-{route[0]}'!A2"
-            cell.font = self.set_hyperlink
-            ws.cell(1, 1).hyperlink = f"#'{self.index_name}'!A1"
-            ws.cell(1, 1).font = Font(u = "single", color = "0070C0", bold = "b")
-            ws.cell(1, 1).alignment = self.set_align
+                ws.append([airline] + routes[route][airline], styles, {1: f"'{airline}'!A1"})
+            ws.append(['返回索引'], links = {1: None})
+            dep, arr = route.split('-', 1)
+            ws.append(['返程'], links = {1: f"'{arr}-{dep}'!A2"})
+            ws.close()
         
         '''Output merged data'''
         if file == '' or file is None:
@@ -1122,12 +1495,12 @@ class Rebuilder():
             time = datetime.today().strftime("%H%M%S")
             file = file.replace(".xlsx", f"_{time}.xlsx")
         print("\r saving")
-        wb.save(path / Path(file))
-        wb.close()
+        book.save(path / Path(file))
 
     def month(self, year: int = 0, month: int = 0, limit: int = 5, 
-              path: Path | str = Path(), file: str = ''):
-        '''Calculate pearson correlation coefficient of tickets rate before `year`.`month`'''
+              path: Path | str = Path(), file: str = '', workers: int = 0):
+        '''Calculate pearson correlation coefficient of tickets rate before `year`.`month`, 
+        rows of sheets are computed by airlines and routes in `workers` processes'''
         filterwarnings("ignore")
         if not len(self.__merge):
             self.__merge = self.merge()
@@ -1135,11 +1508,11 @@ class Rebuilder():
         month = month if month else max_coll.month
         year = year if year else max_coll.year
         max_coll = (datetime(year, month, 1) - timedelta(1)).date()
-        data = self.__merge.drop(
-            self.__merge[self.__merge['date_coll'] >= max_coll.toordinal()].index).reset_index()
+        data = self.__data('date_flight', 'date_coll')
+        data = data.loc[self.__merge['date_coll'] < max_coll.toordinal()].reset_index()
         data.drop(data[data['day_adv'] <= limit].index, inplace = True)
         
-        wb = self.indexbook(airlines = True)
+        book = self.indexbook(airlines = True)
         rules = (
             self.__diffrule('red', 'cellIs', '>', [0.9]),
             self.__diffrule('yellow', 'cellIs', '>', [0.8]),
@@ -1149,153 +1522,64 @@ class Rebuilder():
             self.__diffrule('', 'cellIs', '<', [-0.5]))
         percent, idct = -1, 0
         total = len(data) * 2
-        data['date_flight'] = data['date_flight'].map(date.fromordinal)
-        data['date_coll'] = data['date_coll'].map(date.fromordinal)
-        data['target'] = data['date_flight'].map(lambda x: 1 if x.month == month else 0)
-        
-        overview = wb.create_sheet('总览')
-        ov_title = sorted(data['airline'].unique(), reverse = True, 
-            key = lambda x: len(self.__merge.loc[self.__merge['airline'] == x]))
-        ov_index = sorted(data['route'].unique(), reverse = True, 
-            key = lambda x: len(self.__merge.loc[self.__merge['route'] == x]))
-        overview.cell(1, 1, '航线').font = self.set_bold
-        overview.column_dimensions['A'].width = 13
-        overview.freeze_panes = 'B2'
-        for idx in range(len(ov_title)):
-            cell = overview.cell(1, idx + 2, ov_title[idx])
-            cell.font = self.set_hyperlink
-            cell.hyperlink = f"#'{ov_title[idx]}'!A1"
-        for idx in range(len(ov_index)):
-            cell = overview.cell(idx + 2, 1, ov_index[idx])
-            cell.font = self.set_hyperlink
-            cell.hyperlink = f"#'{ov_index[idx]}'!A1"
-        
-        for airline, airlines in data.groupby(['airline']):
-            col = 2 + ov_title.index(airline)
-            ws = wb.create_sheet(airline)
-            routes = sorted(airlines['route'].unique(), reverse = True, 
-                key = lambda x: len(airlines.loc[airlines['route'] == x]))
-            ws.append(['采集日期', '相关平均', '强正相关', '正相关', '负相关', '强负相关'] + routes)
-            ws.auto_filter.ref = 'A1:F1'
-            for idx in range(ws.max_column):
-                cell = ws.cell(1, idx + 1)
-                cell.alignment = self.set_align
-                if idx >= 6:
-                    cell.hyperlink = f"#'{cell.value}'!A1"
-                    cell.font = self.set_hyperlink
-                else:
-                    cell.font = self.set_bold
-            ws.freeze_panes = 'G2'
-            for coll, colls in airlines.groupby(['date_coll']):
-                idct += len(colls)
+        
+        '''Correlations of all groups from sufficient statistics of cells'''
+        stats, values = self.__cells('date_coll')
+        rows = ((values['date_coll'] < max_coll) & (values['day_adv'] > limit)).to_numpy()
+        cells = rollup(stats[rows], [values.loc[rows, key] for key in ('airline', 'date_coll', 'route')], 
+                       values.loc[rows, 'month'], [month])
+        ranks = {'airline': self.__ranked(data, 'airline', 'route'), 'route': self.__ranked(data, 'route', 'airline')}
+        sheets = {key: self.__sharded(_corr_rows, cells if key == 'airline' else \
+            cells.reorder_levels([2, 1, 0]).sort_index(), workers, month, ranks[key], 0.8, 
+            max_coll - timedelta(limit)) for key in ('airline', 'route')}
+        
+        overview = book.sheet('总览', 'B2', {'A': 13})
+        counts = {key: self.__merge[key].value_counts() for key in ('airline', 'route')}
+        ov_title = sorted(data['airline'].unique(), reverse = True, key = lambda x: counts['airline'][x])
+        ov_index = sorted(data['route'].unique(), reverse = True, key = lambda x: counts['route'][x])
+        grid = {route: list(None for _ in ov_title) for route in ov_index}
+        
+        for key in ('airline', 'route'):
+            for name, (size, rows) in sorted(sheets[key].items()):
+                idct += size
                 if percent != int(idct / total * 100):
                     percent = int(idct / total * 100)
                     print(f"\rmonth corr >> {percent:03d}", end = '%')
-                if len(colls) <= 1 or coll >= max_coll - timedelta(limit):
-                    continue
-                corr = colls['price_rate'].corr(colls['target'])
-                output = [coll, corr, 0, 0, 0, 0] + list(None for _ in range(len(routes)))
-                for route, group in colls.groupby(['route']):
-                    corr = group['price_rate'].corr(group['target'], 'pearson')
-                    output[routes.index(route) + 6] = round(corr, 4)
-                    if corr > 0.8:
-                        output[2] += 1
-                    elif corr > 0:
-                        output[3] += 1
-                    elif corr < -0.8:
-                        output[5] += 1
-                    elif corr < 0:
-                        output[4] += 1
-                ws.append(output)
-                ws.cell(ws.max_row, 1).number_format = self.set_date
-            
-            rstring = f"G2:{ws.cell(ws.max_row, ws.max_column).coordinate}"
-            for rule in rules:
-                ws.conditional_formatting.add(rstring, rule)
-            ws.conditional_formatting.add(
-                f"C2:C{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
-            ws.conditional_formatting.add(
-                f"F2:F{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
-            
-            cell = ws.cell(1, 1)
-            cell.hyperlink = f"#'{self.index_name}'!A1"
-            cell.font = self.set_hyperlink
-            cell = ws.cell(ws.max_row + 1, 1, '返回索引')
-            cell.hyperlink = f"#'{self.index_name}'!A1"
-            cell.font = self.set_hyperlink
-            for idx in range(7, ws.max_column + 1):
-                cell = ws.cell(ws.max_row, idx)
-                coord = cell.coordinate
-                _col = coord.strip(str(ws.max_row))
-                cell.value = f'=AVERAGE({_col}2:{_col}{ws.max_row - 1})'
-                overview.cell(2 + ov_index.index(ws.cell(1, idx).value), col).value = \
-                    f'={airline}!{coord}'
-        
-        rstring = f"B2:{overview.cell(overview.max_row, overview.max_column).coordinate}"
-        for rule in rules:
-            overview.conditional_formatting.add(rstring, rule)
-        
-        for route, routes in data.groupby(['route']):
-            idct += len(routes)
-            if percent != int(idct / total * 100):
-                percent = int(idct / total * 100)
-                print(f"\rmonth corr >> {percent:03d}", end = '%')
-            ws = wb.create_sheet(route)
-            airlines = sorted(routes['airline'].unique(), reverse = True, 
-                key = lambda x: len(routes.loc[routes['airline'] == x]))
-            ws.append(['采集日期', '相关平均', '强正相关', '正相关', '负相关', '强负相关'] + airlines)
-            ws.auto_filter.ref = 'A1:F1'
-            for idx in range(ws.max_column):
-                cell = ws.cell(1, idx + 1)
-                cell.alignment = self.set_align
-                if idx >= 6:
-                    cell.hyperlink = f"#'{cell.value}'!A1"
-                    cell.font = self.set_hyperlink
-                else:
-                    cell.font = self.set_bold
-            ws.freeze_panes = 'G2'
-            for coll, colls in routes.groupby(['date_coll']):
-                if len(colls) <= 1 or coll >= max_coll - timedelta(limit):
-                    continue
-                corr = colls['price_rate'].corr(colls['target'])
-                output = [coll, corr, 0, 0, 0, 0] + list(None for _ in range(len(airlines)))
-                for airline, group in colls.groupby(['airline']):
-                    corr = group['price_rate'].corr(group['target'], 'pearson')
-                    output[airlines.index(airline) + 6] = round(corr, 4)
-                    if corr > 0.8:
-                        output[2] += 1
-                    elif corr > 0:
-                        output[3] += 1
-                    elif corr < -0.8:
-                        output[5] += 1
-                    elif corr < 0:
-                        output[4] += 1
-                ws.append(output)
-                ws.cell(ws.max_row, 1).number_format = self.set_date
-            rstring = f"G2:{ws.cell(ws.max_row, ws.max_column).coordinate}"
-            for rule in rules:
-                ws.conditional_formatting.add(rstring, rule)
-            ws.conditional_formatting.add(
-                f"C2:C{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
-            ws.conditional_formatting.add(
-                f"F2:F{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
-            
-            cell = ws.cell(1, 1)
-            cell.hyperlink = f"#'{self.index_name}'!A1"
-            cell.font = self.set_hyperlink
-            cell = ws.cell(ws.max_row + 1, 1, '返回索引')
-            cell.hyperlink = f"#'{self.index_name}'!A1"
-            cell.font = self.set_hyperlink
-            cell = ws.cell(ws.max_row, 2, '返程')
-            route = route.split('-', 1)
-            cell.hyperlink = f"#'{route[1]}-{route[0]}'!A1"
-            cell.font = self.set_hyperlink
-            for idx in range(7, ws.max_column + 1):
-                cell = ws.cell(ws.max_row, idx)
-                coord = cell.coordinate
-                col = coord.strip(str(ws.max_row))
-                cell.value = f'=AVERAGE({col}2:{col}{ws.max_row - 1})'
+                ws = book.sheet(name, 'G2', filter = 'A1:F1')
+                items = ranks[key][name]
+                ws.append(['采集日期', '相关平均', '强正相关', '正相关', '负相关', '强负相关'] + items, 
+                          ['link_center'] + ['header'] * 5 + ['link_center'] * len(items), 
+                          {idx: f"'{item}'!A1" for idx, item in enumerate(items, 7)} | {1: None})
+                for output in rows:
+                    ws.append(output, {1: 'date'})
+                last = get_column_letter(ws.max_column)
+                ws.format(f"G2:{last}{ws.max_row}", *rules)
+                ws.format(f"C2:C{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
+                ws.format(f"F2:F{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
+                
+                '''Averages of columns, of airlines linked in the overview'''
+                links = {1: None}
+                if key == 'route':
+                    dep, arr = name.split('-', 1)
+                    links[2] = f"'{arr}-{dep}'!A1"
+                averages = list(f'=AVERAGE({col}2:{col}{ws.max_row})' \
+                    for col in map(get_column_letter, range(7, ws.max_column + 1)))
+                ws.append(['返回索引', '返程' if key == 'route' else None, None, None, None, None] + averages, 
+                          links = links)
+                if key == 'airline':
+                    col = ov_title.index(name)
+                    for idx, item in enumerate(items, 7):
+                        grid[item][col] = f'={name}!{get_column_letter(idx)}{ws.max_row}'
+                ws.close()
             
+            if key == 'airline':
+                overview.append(['航线'] + ov_title, {1: 'bold'}, 
+                                {idx: f"'{airline}'!A1" for idx, airline in enumerate(ov_title, 2)})
+                for route in ov_index:
+                    overview.append([route] + grid[route], links = {1: f"'{route}'!A1"})
+                overview.format(f"B2:{get_column_letter(overview.max_column)}{overview.max_row}", *rules)
+                overview.close()
+        
         print("\rsaving    ")
         filterwarnings("default")
         if file == '' or file is None:
@@ -1308,22 +1592,23 @@ class Rebuilder():
         if (path / Path(file)).exists():
             time = datetime.today().strftime("%H%M%S")
             file = file.replace(".xlsx", f"_{time}.xlsx")
-        wb.save(path / Path(file))
-        wb.close()
+        book.save(path / Path(file))
     
     
-    def adv(self, start: int = 0, end: int = 0, path: Path | str = Path(), file: str = ''):
+    def adv(self, start: int = 0, end: int = 0, path: Path | str = Path(), file: str = '', 
+            workers: int = 0):
         '''Calculate pearson correlation coefficient of tickets rate 
-        in `start` ~ `end` days before departure date'''
+        in `start` ~ `end` days before departure date, 
+        rows of sheets are computed by airlines and routes in `workers` processes'''
         
         filterwarnings("ignore")
         if not len(self.__merge):
             self.__merge = self.merge()
-        data = self.__merge[self.__merge['day_adv'].isin(
-            tuple(range(start if start > 0 else 1, end + 1 if end > 0 else self.__merge['day_adv'].max() + 1))
-        )].reset_index()
+        days = tuple(range(start if start > 0 else 1, end + 1 if end > 0 else self.__merge['day_adv'].max() + 1))
+        data = self.__data('date_flight', 'date_coll')
+        data = data[self.__merge['day_adv'].isin(days)].reset_index()
         
-        wb = self.indexbook(airlines = True)
+        book = self.indexbook(airlines = True)
         rules = (
             self.__diffrule('red', 'cellIs', '>', [0.9]), 
             self.__diffrule('yellow', 'cellIs', '>', [0.8]), 
@@ -1333,150 +1618,63 @@ class Rebuilder():
             self.__diffrule('', 'cellIs', '<', [-0.5]))
         percent, idct = -1, 0
         total = len(data) * 2
-        data['date_flight'] = data['date_flight'].map(date.fromordinal)
-        data['date_coll'] = data['date_coll'].map(date.fromordinal)
-        
-        overview = wb.create_sheet('总览')
-        ov_title = sorted(data['airline'].unique(), reverse = True, 
-            key = lambda x: len(self.__merge.loc[self.__merge['airline'] == x]))
-        ov_index = sorted(data['route'].unique(), reverse = True, 
-            key = lambda x: len(self.__merge.loc[self.__merge['route'] == x]))
-        overview.cell(1, 1, '航线').font = self.set_bold
-        overview.column_dimensions['A'].width = 13
-        overview.freeze_panes = 'B2'
-        for idx in range(len(ov_title)):
-            cell = overview.cell(1, idx + 2, ov_title[idx])
-            cell.font = self.set_hyperlink
-            cell.hyperlink = f"#'{ov_title[idx]}'!A1"
-        for idx in range(len(ov_index)):
-            cell = overview.cell(idx + 2, 1, ov_index[idx])
-            cell.font = self.set_hyperlink
-            cell.hyperlink = f"#'{ov_index[idx]}'!A1"
-        
-        for airline, airlines in data.groupby(['airline']):
-            idct += len(airlines)
-            if percent != int(idct / total * 100):
-                percent = int(idct / total * 100)
-                print(f"\radv corr >> {percent:03d}", end = '%')
-            col = 2 + ov_title.index(airline)
-            ws = wb.create_sheet(airline)
-            routes = sorted(airlines['route'].unique(), reverse = True, 
-                key = lambda x: len(airlines.loc[airlines['route'] == x]))
-            ws.append(['航班日期', '相关平均', '强正相关', '正相关', '负相关', '强负相关'] + routes)
-            ws.auto_filter.ref = 'A1:F1'
-            for idx in range(ws.max_column):
-                cell = ws.cell(1, idx + 1)
-                cell.alignment = self.set_align
-                if idx >= 6:
-                    cell.hyperlink = f"#'{cell.value}'!A1"
-                    cell.font = self.set_hyperlink
-                else:
-                    cell.font = self.set_bold
-            ws.freeze_panes = 'G2'
-            for flt, flts in airlines.groupby(['date_flight']):
-                if len(flts) <= 1:
-                    continue
-                corr = flts['price_rate'].corr(flts['day_adv'], 'pearson')
-                output = [flt, corr, 0, 0, 0, 0] + list(None for _ in range(len(routes)))
-                for route, group in flts.groupby(['route']):
-                    corr = group['price_rate'].corr(group['day_adv'], 'pearson')
-                    output[routes.index(route) + 6] = round(corr, 4)
-                    if corr > 0.8:
-                        output[2] += 1
-                    elif corr > 0:
-                        output[3] += 1
-                    elif corr < -0.8:
-                        output[5] += 1
-                    elif corr < 0:
-                        output[4] += 1
-                ws.append(output)
-                ws.cell(ws.max_row, 1).number_format = self.set_date
-            rstring = f"G2:{ws.cell(ws.max_row, ws.max_column).coordinate}"
-            for rule in rules:
-                ws.conditional_formatting.add(rstring, rule)
-            ws.conditional_formatting.add(
-                f"C2:C{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
-            ws.conditional_formatting.add(
-                f"F2:F{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
-            
-            cell = ws.cell(1, 1)
-            cell.hyperlink = f"#'{self.index_name}'!A1"
-            cell.font = self.set_hyperlink
-            cell = ws.cell(ws.max_row + 1, 1, '返回索引')
-            cell.hyperlink = f"#'{self.index_name}'!A1"
-            cell.font = self.set_hyperlink
-            for idx in range(7, ws.max_column + 1):
-                cell = ws.cell(ws.max_row, idx)
-                coord = cell.coordinate
-                _col = coord.strip(str(ws.max_row))
-                cell.value = f'=AVERAGE({_col}2:{_col}{ws.max_row - 1})'
-                overview.cell(2 + ov_index.index(ws.cell(1, idx).value), col).value = \
-                    f'={airline}!{coord}'
-        
-        rstring = f"B2:{overview.cell(overview.max_row, overview.max_column).coordinate}"
-        for rule in rules:
-            overview.conditional_formatting.add(rstring, rule)
-        
-        for route, routes in data.groupby(['route']):
-            idct += len(routes)
-            if percent != int(idct / total * 100):
-                percent = int(idct / total * 100)
-                print(f"\radv corr >> {percent:03d}", end = '%')
-            ws = wb.create_sheet(route)
-            airlines = sorted(routes['airline'].unique(), reverse = True, 
-                key = lambda x: len(routes.loc[routes['airline'] == x]))
-            ws.append(['航班日期', '相关平均', '强正相关', '正相关', '负相关', '强负相关'] + airlines)
-            ws.auto_filter.ref = 'A1:F1'
-            for idx in range(ws.max_column):
-                cell = ws.cell(1, idx + 1)
-                cell.alignment = self.set_align
-                if idx >= 6:
-                    cell.hyperlink = f"#'{cell.value}'!A1"
-                    cell.font = self.set_hyperlink
-                else:
-                    cell.font = self.set_bold
-            ws.freeze_panes = 'G2'
-            for flt, flts in routes.groupby(['date_flight']):
-                if len(flts) <= 1:
-                    continue
-                corr = flts['price_rate'].corr(flts['day_adv'], 'pearson')
-                output = [flt, corr, 0, 0, 0, 0] + list(None for _ in range(len(airlines)))
-                for airline, group in flts.groupby(['airline']):
-                    corr = group['price_rate'].corr(group['day_adv'], 'pearson')
-                    output[airlines.index(airline) + 6] = round(corr, 4)
-                    if corr > 0.8:
-                        output[2] += 1
-                    elif corr > 0:
-                        output[3] += 1
-                    elif corr < -0.8:
-                        output[5] += 1
-                    elif corr < 0:
-                        output[4] += 1
-                ws.append(output)
-                ws.cell(ws.max_row, 1).number_format = self.set_date
-            rstring = f"{ws.cell(2, 7).coordinate}:{ws.cell(ws.max_row, ws.max_column).coordinate}"
-            for rule in rules:
-                ws.conditional_formatting.add(rstring, rule)
-            ws.conditional_formatting.add(
-                f"C2:C{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
-            ws.conditional_formatting.add(
-                f"F2:F{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
+        
+        '''Correlations of all groups from sufficient statistics of cells'''
+        stats, values = self.__cells('date_flight')
+        rows = values['day_adv'].isin(days).to_numpy()
+        cells = rollup(stats[rows], [values.loc[rows, key] for key in ('airline', 'date_flight', 'route')], 
+                       values.loc[rows, 'day_adv'])
+        ranks = {'airline': self.__ranked(data, 'airline', 'route'), 'route': self.__ranked(data, 'route', 'airline')}
+        sheets = {key: self.__sharded(_corr_rows, cells if key == 'airline' else \
+            cells.reorder_levels([2, 1, 0]).sort_index(), workers, 'day_adv', ranks[key], 0.8) \
+                for key in ('airline', 'route')}
+        
+        overview = book.sheet('总览', 'B2', {'A': 13})
+        counts = {key: self.__merge[key].value_counts() for key in ('airline', 'route')}
+        ov_title = sorted(data['airline'].unique(), reverse = True, key = lambda x: counts['airline'][x])
+        ov_index = sorted(data['route'].unique(), reverse = True, key = lambda x: counts['route'][x])
+        grid = {route: list(None for _ in ov_title) for route in ov_index}
+        
+        for key in ('airline', 'route'):
+            for name, (size, rows) in sorted(sheets[key].items()):
+                idct += size
+                if percent != int(idct / total * 100):
+                    percent = int(idct / total * 100)
+                    print(f"\radv corr >> {percent:03d}", end = '%')
+                ws = book.sheet(name, 'G2', filter = 'A1:F1')
+                items = ranks[key][name]
+                ws.append(['航班日期', '相关平均', '强正相关', '正相关', '负相关', '强负相关'] + items, 
+                          ['link_center'] + ['header'] * 5 + ['link_center'] * len(items), 
+                          {idx: f"'{item}'!A1" for idx, item in enumerate(items, 7)} | {1: None})
+                for output in rows:
+                    ws.append(output, {1: 'date'})
+                last = get_column_letter(ws.max_column)
+                ws.format(f"G2:{last}{ws.max_row}", *rules)
+                ws.format(f"C2:C{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
+                ws.format(f"F2:F{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
+                
+                '''Averages of columns, of airlines linked in the overview'''
+                links = {1: None}
+                if key == 'route':
+                    dep, arr = name.split('-', 1)
+                    links[2] = f"'{arr}-{dep}'!A1"
+                averages = list(f'=AVERAGE({col}2:{col}{ws.max_row})' \
+                    for col in map(get_column_letter, range(7, ws.max_column + 1)))
+                ws.append(['返回索引', '返程' if key == 'route' else None, None, None, None, None] + averages, 
+                          links = links)
+                if key == 'airline':
+                    col = ov_title.index(name)
+                    for idx, item in enumerate(items, 7):
+                        grid[item][col] = f'={name}!{get_column_letter(idx)}{ws.max_row}'
+                ws.close()
             
-            cell = ws.cell(1, 1)
-            cell.hyperlink = f"#'{self.index_name}'!A1"
-            cell.font = self.set_hyperlink
-            cell = ws.cell(ws.max_row + 1, 1, '返回索引')
-            cell.hyperlink = f"#'{self.index_name}'!A1"
-            cell.font = self.set_hyperlink
-            cell = ws.cell(ws.max_row, 2, '返程')
-            route = route.split('-', 1)
-            cell.hyperlink = f"#'{route[1]}-{route[0]}'!A1"
-            cell.font = self.set_hyperlink
-            for idx in range(7, ws.max_column + 1):
-                cell = ws.cell(ws.max_row, idx)
-                coord = cell.coordinate
-                col = coord.strip(str(ws.max_row))
-                cell.value = f'=AVERAGE({col}2:{col}{ws.max_row - 1})'
+            if key == 'airline':
+                overview.append(['航线'] + ov_title, {1: 'bold'}, 
+                                {idx: f"'{airline}'!A1" for idx, airline in enumerate(ov_title, 2)})
+                for route in ov_index:
+                    overview.append([route] + grid[route], links = {1: f"'{route}'!A1"})
+                overview.format(f"B2:{get_column_letter(overview.max_column)}{overview.max_row}", *rules)
+                overview.close()
         
         print("\rsaving   ")
         filterwarnings("default")
@@ -1490,29 +1688,26 @@ class Rebuilder():
         if (path / Path(file)).exists():
             time = datetime.today().strftime("%H%M%S")
             file = file.replace(".xlsx", f"_{time}.xlsx")
-        wb.save(path / Path(file))
-        wb.close()
+        book.save(path / Path(file))
     
     
     def week(self, *days: int, limit: int = 5, \
-        path: Path | str = Path(), file: str = ''):
-        '''Calculate pearson correlation coefficient of `days` of week'''
+        path: Path | str = Path(), file: str = '', workers: int = 0):
+        '''Calculate pearson correlation coefficient of `days` of week, 
+        rows of sheets are computed by routes in `workers` processes'''
         filterwarnings("ignore")
         if not len(self.__merge):
             self.__merge = self.merge()
-        data = self.__merge.drop(self.__merge[self.__merge['day_adv'] < limit].index)
-        data['month'] = data['date_flight'].map(lambda x: date.fromordinal(x).month)
+        data = self.__data('month')
+        data = data.drop(data[data['day_adv'] < limit].index)
         for month in data['month'].unique():
             months = data.loc[data['month'] == month]
             if months['date_flight'].nunique() < 7:
                 data.drop(months.index, inplace = True)
-        data['day_week'] = data['day_week'].map({
-            '星期一': 1, '星期二': 2, '星期三': 3, '星期四': 4, 
-            '星期五': 5, '星期六': 6, '星期日': 7})
         
         if not len(days):
             days = [1, 2, 3, 4, 5, 6, 7]
-        wb = Workbook()
+        book = ReportBook()
         rules = (
             self.__diffrule('red', 'cellIs', '>', [0.5]), 
             self.__diffrule('yellow', 'cellIs', '>', [0.3]), 
@@ -1520,55 +1715,39 @@ class Rebuilder():
             self.__diffrule('green', 'cellIs', '<', [-0.3]))
         percent, idct = -1, 0
         total = len(data) * len(days)
-        airlines = sorted(data['airline'].unique(), reverse = True, 
-            key = lambda x: len(data.loc[data['airline'] == x]))
+        counts = data['airline'].value_counts()
+        airlines = sorted(data['airline'].unique(), reverse = True, key = lambda x: counts[x])
+        
+        '''Correlations of all days at once from sufficient statistics of cells by month'''
+        stats, values = self.__cells()
+        rows = ((values['day_adv'] >= limit) & values['month'].isin(data['month'].unique())).to_numpy()
+        cells = rollup(stats[rows], [values.loc[rows, key] for key in ('route', 'airline', 'month')], 
+                       values.loc[rows, 'day_week'], days)
+        sizes = data.groupby(['route'], observed = True).agg(
+            date_coll = ('date_coll', 'nunique'), date_flight = ('date_flight', 'nunique'))
+        weeks = data.groupby(['route', 'day_week'], observed = True).size()
+        weeks_cell = data.groupby(['route', 'airline', 'day_week'], observed = True).size()
+        shown = set((route, day) for (route, day), count in weeks.items() \
+            if count >= sizes.at[route, 'date_coll'] * sizes.at[route, 'date_flight'] / 2)
+        columns = {airline: idx for idx, airline in enumerate(airlines)}
+        sheets = self.__sharded(_target_rows, cells, workers, days, {day: columns for day in days}, 
+                                0.3, shown, set(weeks_cell[weeks_cell > limit].index))
         
         for day in days:
-            ws = wb.create_sheet(str(day))
-            ws.append(['出发', '到达', '相关平均', '强正相关', '正相关', '负相关', '强负相关'] + airlines)
-            ws.auto_filter.ref = 'A1:G1'
-            for idx in range(ws.max_column):
-                ws.cell(1, idx + 1).font = self.set_bold
-                ws.cell(1, idx + 1).alignment = self.set_align
-            ws.freeze_panes = 'H2'
-            data['target'] = data['day_week'].map(lambda x: 1 if x == day else 0)
-            for route, routes in data.groupby(['route']):
-                idct += len(routes)
-                if percent != int(idct / total * 100):
-                    percent = int(idct / total * 100)
-                    print(f"\rweek corr >> {percent:03d}", end = '%')
-                corr = mean(list(months['price_rate'].corr(months['target'], 'pearson') \
-                    for _, months in routes.groupby(['month'])))
-                if corr == nan or len(routes.loc[routes['day_week'] == day]) < \
-                    routes['date_coll'].nunique() * routes['date_flight'].nunique() / 2:
-                    continue
-                output = route.split('-', 1) + [corr, 0, 0, 0, 0] + \
-                    list(None for _ in range(len(airlines)))
-                for airline, group in routes.groupby(['airline']):
-                    if len(group.loc[group['day_week'] == day]) <= limit:
-                        continue
-                    corr = mean(list(months['price_rate'].corr(months['target'], 'pearson') \
-                        for _, months in group.groupby(['month'])))
-                    output[airlines.index(airline) + 7] = round(corr, 4)
-                    if corr > 0.3:
-                        output[3] += 1
-                    elif corr > 0:
-                        output[4] += 1
-                    elif corr < -0.3:
-                        output[6] += 1
-                    elif corr < 0:
-                        output[5] += 1
-                ws.append(output)
-            for idx in range(1, ws.max_row):
-                if -0.1 <= ws.cell(idx + 1, 3).value <= 0.1:
-                    ws.row_dimensions[idx + 1].hidden = 1
-            rstring = f"H2:{ws.cell(ws.max_row, ws.max_column).coordinate}"
-            for rule in rules:
-                ws.conditional_formatting.add(rstring, rule)
-            ws.conditional_formatting.add(
-                f"D2:D{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
-            ws.conditional_formatting.add(
-                f"G2:G{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
+            idct += len(data)
+            if percent != int(idct / total * 100):
+                percent = int(idct / total * 100)
+                print(f"\rweek corr >> {percent:03d}", end = '%')
+            ws = book.sheet(str(day), 'H2', filter = 'A1:G1')
+            ws.append(['出发', '到达', '相关平均', '强正相关', '正相关', '负相关', '强负相关'] + airlines, 'header')
+            for route in sorted(sheets.keys()):
+                if day in sheets[route]:
+                    row = sheets[route][day]
+                    ws.append(row, hidden = -0.1 <= row[2] <= 0.1)
+            ws.format(f"H2:{get_column_letter(ws.max_column)}{ws.max_row}", *rules)
+            ws.format(f"D2:D{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
+            ws.format(f"G2:G{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
+            ws.close()
         
         print("\rsaving   ")
         filterwarnings("default")
@@ -1582,22 +1761,21 @@ class Rebuilder():
         if (path / Path(file)).exists():
             time = datetime.today().strftime("%H%M%S")
             file = file.replace(".xlsx", f"_{time}.xlsx")
-        wb.remove(wb.active)
-        wb.save(path / Path(file))
-        wb.close()
+        book.save(path / Path(file))
     
     
     def hour(self, key: Literal['day_week', 'airline'], start: int = 6, end: int = 24,
-             limit: int = 5, path: Path | str = Path(), file: str = ''):
+             limit: int = 5, path: Path | str = Path(), file: str = '', workers: int = 0):
         '''Calculate pearson correlation coefficient of hours 
-        from `start` to `end` in group of `key`'''
+        from `start` to `end` in group of `key`, 
+        rows of sheets are computed by routes in `workers` processes'''
         filterwarnings("ignore")
         if not len(self.__merge):
             self.__merge = self.merge()
-        data = self.__merge.drop(self.__merge[self.__merge['day_adv'] < limit].index)
-        data['date_flight'] = data['date_flight'].map(date.fromordinal)
+        data = self.__data('date_flight')
+        data = data.drop(data[data['day_adv'] < limit].index)
         
-        wb = Workbook()
+        book = ReportBook()
         rules = (
             self.__diffrule('red', 'cellIs', '>', [0.7]), 
             self.__diffrule('yellow', 'cellIs', '>', [0.5]), 
@@ -1608,60 +1786,46 @@ class Rebuilder():
         percent, idct = -1, 0
         hours = tuple(range(start, end))
         total = len(data) * len(hours)
-        for hour in hours:
-            ws = wb.create_sheet(str(hour))
-            targets = sorted(
+        
+        '''Correlations of all hours at once from sufficient statistics of cells by collect date'''
+        stats, values = self.__cells()
+        rows = (values['day_adv'] >= limit).to_numpy()
+        cells = rollup(stats[rows], [values.loc[rows, name] for name in ('route', key, 'date_coll')], 
+                       values.loc[rows, 'hour_dep'], hours)
+        sizes = data.groupby(['route'], observed = True).agg(
+            date_coll = ('date_coll', 'nunique'), date_flight = ('date_flight', 'nunique'))
+        counts = data[key].value_counts()
+        deps = data.groupby(['route', 'hour_dep'], observed = True).size()
+        deps_cell = data.groupby(['route', key, 'hour_dep'], observed = True).size()
+        shown = set((route, hour) for (route, hour), count in deps.items() \
+            if count >= sizes.at[route, 'date_coll'] * sizes.at[route, 'date_flight'] / 2)
+        headers = {hour: sorted(
                 data.loc[data['hour_dep'] == hour][key].unique(), \
-                    key = lambda x: len(data.loc[data[key] == x]), reverse = True) \
+                    key = lambda x: counts[x], reverse = True) \
                 if key == 'airline' else \
-                    ['星期一', '星期二', '星期三', '星期四', '星期五', '星期六', '星期日'] \
+                    list(weekdays) \
                 if key == 'day_week' else \
-                    sorted(data.loc[data['hour_dep'] == hour][key].unique())
-            ws.append(['出发', '到达', '相关平均', '强正相关', '正相关', '负相关', '强负相关'] + targets)
-            ws.auto_filter.ref = 'A1:G1'
-            for idx in range(ws.max_column):
-                ws.cell(1, idx + 1).font = self.set_bold
-                ws.cell(1, idx + 1).alignment = self.set_align
-            ws.freeze_panes = 'H2'
-            data['target'] = data['hour_dep'].map(lambda x: 1 if x == hour else 0)
-            for route, routes in data.groupby(['route']):
-                idct += len(routes)
-                if percent != int(idct / total * 100):
-                    percent = int(idct / total * 100)
-                    print(f"\rhour corr >> {percent:03d}", end = '%')
-                corr = mean(list(colls['price_rate'].corr(colls['target'], 'pearson') \
-                    for _, colls in routes.groupby(['date_coll'])))
-                if corr == nan or len(routes.loc[routes['hour_dep'] == hour]) < \
-                    routes['date_coll'].nunique() * routes['date_flight'].nunique() / 2:
-                    continue
-                output = route.split('-', 1) + [corr, 0, 0, 0, 0] + \
-                    list(None for _ in range(len(targets)))
-                for item, group in routes.groupby([key]):
-                    if len(group.loc[group['hour_dep'] == hour]) <= limit:
-                        continue
-                    corr = mean(list(colls['price_rate'].corr(colls['target'], 'pearson') \
-                        for _, colls in group.groupby(['date_coll'])))
-                    output[targets.index(item) + 7] = round(corr, 4)
-                    if corr > 0.5:
-                        output[3] += 1
-                    elif corr > 0:
-                        output[4] += 1
-                    elif corr < -0.5:
-                        output[6] += 1
-                    elif corr < 0:
-                        output[5] += 1
-                ws.append(output)
-            for idx in range(1, ws.max_row):
-                value = ws.cell(idx + 1, 3).value
-                if -0.1 <= value <= 0.1:
-                    ws.row_dimensions[idx + 1].hidden = 1
-            rstring = f"H2:{ws.cell(ws.max_row, ws.max_column).coordinate}"
-            for rule in rules:
-                ws.conditional_formatting.add(rstring, rule)
-            ws.conditional_formatting.add(
-                f"D2:D{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
-            ws.conditional_formatting.add(
-                f"G2:G{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
+                    sorted(data.loc[data['hour_dep'] == hour][key].unique()) for hour in hours}
+        columns = {hour: {item: idx for idx, item in enumerate(range(1, 8) if key == 'day_week' else headers[hour])} \
+            for hour in hours}
+        sheets = self.__sharded(_target_rows, cells, workers, hours, columns, 
+                                0.5, shown, set(deps_cell[deps_cell > limit].index))
+        
+        for hour in hours:
+            idct += len(data)
+            if percent != int(idct / total * 100):
+                percent = int(idct / total * 100)
+                print(f"\rhour corr >> {percent:03d}", end = '%')
+            ws = book.sheet(str(hour), 'H2', filter = 'A1:G1')
+            ws.append(['出发', '到达', '相关平均', '强正相关', '正相关', '负相关', '强负相关'] + headers[hour], 'header')
+            for route in sorted(sheets.keys()):
+                if hour in sheets[route]:
+                    row = sheets[route][hour]
+                    ws.append(row, hidden = -0.1 <= row[2] <= 0.1)
+            ws.format(f"H2:{get_column_letter(ws.max_column)}{ws.max_row}", *rules)
+            ws.format(f"D2:D{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
+            ws.format(f"G2:G{ws.max_row}", self.__diffrule(0, 'cellIs', '>=', [1]))
+            ws.close()
         
         print("\rsaving   ")
         filterwarnings("default")
@@ -1675,6 +1839,258 @@ class Rebuilder():
         if (path / Path(file)).exists():
             time = datetime.today().strftime("%H%M%S")
             file = file.replace(".xlsx", f"_{time}.xlsx")
-        wb.remove(wb.active)
-        wb.save(path / Path(file))
-        wb.close()
+        book.save(path / Path(file))
+
+
+class ArchivedFile():
+    '''
+    An excel inside a zip file, read into memory without extraction.
+    
+    Behaves as the `Path` of an extracted excel for `Rebuilder` and `ColumnStore`: 
+    `name` and `parent` (the folder of the zip file, named by collect date), 
+    `match`, `stat` and `read_bytes`. Picklable for process pools.
+    '''
+    def __init__(self, archive: Path, member: str) -> None:
+        self.archive, self.member = Path(archive), member
+        self.name = PurePosixPath(member).name
+        self.parent = self.archive.parent
+    
+    def __repr__(self) -> str:
+        return f'ArchivedFile({str(self.archive)!r}, {self.member!r})'
+    
+    def match(self, pattern: str) -> bool:
+        return PurePosixPath(self.member).match(pattern)
+    
+    def stat(self) -> SimpleNamespace:
+        '''Size and modified time of the member as `st_size` and `st_mtime`'''
+        with ZipFile(self.archive) as zip:
+            info = zip.getinfo(self.member)
+        return SimpleNamespace(st_size = info.file_size, st_mtime = datetime(*info.date_time).timestamp())
+    
+    def read_bytes(self) -> bytes:
+        with ZipFile(self.archive) as zip:
+            return zip.read(self.member)
+
+
+def _corr_rows(cells: DataFrame, target: int | str, items: dict[str, list], strong: float, 
+               until: date | None = None) -> dict[str, tuple[float, list[list]]]:
+    '''
+    Rows of correlation sheets of `Rebuilder.month` and `Rebuilder.adv` by group, 
+    a top-level function for process pools
+    -----
+    - cells: moments by group, key (date of rows) and item, see `correlation.rollup`
+    - target: target of moments to correlate
+    - items: items of each group in the order of columns
+    - strong: threshold of strong correlations counted
+    - until: rows of keys from `until` on are skipped
+    
+    Return rows of data and sheet rows in the order of keys of each group
+    '''
+    sums = cells.groupby(level = [0, 1]).sum()
+    corrs, values = pearson(sums)[target].to_numpy(), pearson(cells)[target].to_numpy()
+    names = cells.index.get_level_values(2)
+    ends = cells.groupby(level = [0, 1]).size().to_numpy().cumsum()
+    sheets = {}
+    for (group, key), size, corr, end, start in zip(sums.index, sums[('n', '')].to_numpy(), corrs, ends, [0, *ends[:-1]]):
+        if group not in sheets:
+            sheets[group] = [0, [], {name: idx for idx, name in enumerate(items[group], 6)}]
+        sheet = sheets[group]
+        sheet[0] += size
+        if size <= 1 or until is not None and key >= until:
+            continue
+        output = [key, corr, 0, 0, 0, 0] + list(None for _ in range(len(sheet[2])))
+        for name, corr in zip(names[start:end], values[start:end]):
+            output[sheet[2][name]] = round(corr, 4)
+            if corr > strong:
+                output[2] += 1
+            elif corr > 0:
+                output[3] += 1
+            elif corr < -strong:
+                output[5] += 1
+            elif corr < 0:
+                output[4] += 1
+        sheet[1].append(output)
+    return {group: (sheet[0], sheet[1]) for group, sheet in sheets.items()}
+
+def _target_rows(cells: DataFrame, targets: Iterable[int], columns: dict[int, dict], strong: float, 
+                 shown: set[tuple], items: set[tuple]) -> dict[str, dict[int, list]]:
+    '''
+    Rows of correlation sheets of `Rebuilder.week` and `Rebuilder.hour` by route, 
+    a top-level function for process pools
+    -----
+    - cells: moments by route, item and period, see `correlation.rollup`; 
+    correlations of a route or an item are the means of its periods
+    - targets: targets of moments, one sheet for each
+    - columns: column of each item in the sheet of each target
+    - strong: threshold of strong correlations counted
+    - shown: `(route, target)` of rows shown
+    - items: `(route, item, target)` of items shown
+    
+    Return sheet rows of each target of each route
+    '''
+    corrs = mean_of(pearson(cells.groupby(level = [0, 2]).sum()), 0)
+    corrs_cell = mean_of(pearson(cells), [0, 1])
+    names = corrs_cell.index.get_level_values(1)
+    ends = corrs_cell.groupby(level = 0).size().to_numpy().cumsum()
+    sheets = {route: {} for route in corrs.index}
+    for target in targets:
+        values = corrs_cell[target].to_numpy()
+        for route, corr, end, start in zip(corrs.index, corrs[target].to_numpy(), ends, [0, *ends[:-1]]):
+            if (route, target) not in shown:
+                continue
+            output = route.split('-', 1) + [corr, 0, 0, 0, 0] + \
+                list(None for _ in range(len(columns[target])))
+            for item, corr in zip(names[start:end], values[start:end]):
+                if (route, item, target) not in items:
+                    continue
+                output[columns[target][item] + 7] = round(corr, 4)
+                if corr > strong:
+                    output[3] += 1
+                elif corr > 0:
+                    output[4] += 1
+                elif corr < -strong:
+                    output[6] += 1
+                elif corr < 0:
+                    output[5] += 1
+            sheets[route][target] = output
+    return sheets
+
+def _build_report(folder: Path, root: Path, name: str, kwargs: dict) -> tuple[str, float]:
+    '''Build report `name` of `Rebuilder` on merged data mapped in `folder` (see `save_mapped`), 
+    a top-level function for process pools, output of the report is discarded
+    
+    Return `name` and seconds'''
+    start = perf_counter()
+    rebuilder = Rebuilder(root)
+    with redirect_stdout(StringIO()):
+        rebuilder.append_frame(load_mapped(folder))
+        getattr(rebuilder, name)(**kwargs)
+    return name, perf_counter() - start
+
+
+def _merge_file(file: Path | ArchivedFile, starting_date: int = 0, day_limit: int = 0) -> DataFrame:
+    '''Read an excel of `Rebuilder` with derived columns, a top-level function for process pools'''
+    header = (
+        'date_flight', 'day_week', 'airline', 'type', 'dep',                                #04
+        'arr', 'time_dep', 'time_arr', 'price', 'price_rate')                               #09
+    date_coll = date.fromisoformat(file.parent.name).toordinal()
+    source = BytesIO(file.read_bytes()) if isinstance(file, ArchivedFile) else file
+    try:
+        data = DataFrame(read_xlsx(source, header)).assign(date_coll = date_coll)          #10
+    except ValueError:
+        if isinstance(source, BytesIO):
+            source.seek(0)
+        data = read_excel(source, names = header).assign(date_coll = date_coll)
+        data['date_flight'] = data['date_flight'].map(lambda x: x.toordinal())
+    
+    if starting_date:
+        data.drop(data[data['date_flight'] < starting_date].index, inplace = True)
+    data['day_adv'] = data['date_flight'] - date_coll                                       #11
+    if day_limit:
+        data.drop(data[data['day_adv'] > day_limit].index, inplace = True)
+    data['hour_dep'] = data['time_dep'].map(lambda x: x.hour if x.hour else 24)             #12
+    data['route'] = data['dep'].map(Airport) + data['arr'].map(Airport)                     #13
+    return compact(data)
+
+
+_xlsx_cell = re_compile(rb'<c r="([A-Z]+)\d+"(?: s="(\d+)")?(?: t="(\w+)")?[^>]*?'
+                        rb'(?:/>|>(?:<v>([^<]*)</v>|<is><t(?: [^>]*)?>([^<]*)</t></is>|(.*?))</c>)', S)
+_xlsx_text = re_compile(rb'<(?:v|t)(?: [^>]*)?>(.*?)</(?:v|t)>', S)
+_xlsx_date_ids = {14, 15, 16, 17, 18, 19, 20, 21, 22, 45, 46, 47}
+
+def read_xlsx(file: Path | str | IO[bytes], header: tuple[str] = (
+    'date_flight', 'day_week', 'airline', 'type', 'dep', 
+    'arr', 'time_dep', 'time_arr', 'price', 'price_rate')) -> dict[str, ndarray]:
+    '''
+    Read the first sheet of a crawler excel (see `CtripCrawler.output_excel`) 
+    by parsing its XML directly, much faster than `read_excel`.
+    
+    The first row is the title, each row after has exactly `len(header)` cells.
+    - Numbers with date formats: `date_flight` as ordinal in `int64`, otherwise 
+    `date` / `time` / `datetime` in `object` as `read_excel` does.
+    - Other numbers (including percentage): `int64` if all integral, else `float64`.
+    - Texts (inline or shared): `str` in `object`.
+    
+    Raise `ValueError` if the file does not fit the schema, read by `read_excel` instead.
+    '''
+    with ZipFile(file) as book:
+        names = set(book.namelist())
+        workbook = book.read('xl/workbook.xml')
+        rels = book.read('xl/_rels/workbook.xml.rels')
+        rid = re_search(rb'<sheet [^>]*?r:id="([^"]+)"', workbook)
+        target = re_search(rb'<Relationship [^>]*?Id="' + rid.group(1) + rb'"[^>]*?Target="([^"]+)"', rels) \
+            or re_search(rb'<Relationship [^>]*?Target="([^"]+)"[^>]*?Id="' + rid.group(1) + rb'"', rels) \
+            if rid else None
+        sheet = target.group(1).decode().lstrip('/') if target else 'xl/worksheets/sheet1.xml'
+        sheet = sheet if sheet.startswith('xl/') else 'xl/' + sheet
+        shared, dates = [], set()
+        if 'xl/sharedStrings.xml' in names:
+            for item in re_findall(rb'<si>(.*?)</si>', book.read('xl/sharedStrings.xml'), S):
+                shared.append(unescape(b''.join(re_findall(rb'<t(?: [^>]*)?>(.*?)</t>', item, S)).decode()))
+        if 'xl/styles.xml' in names:
+            styles = book.read('xl/styles.xml')
+            formats = {int(id): code for id, code in re_findall(
+                rb'<numFmt numFmtId="(\d+)" formatCode="([^"]*)"', styles)}
+            xfs = re_search(rb'<cellXfs[^>]*>(.*?)</cellXfs>', styles, S)
+            for idx, id in enumerate(re_findall(rb'<xf [^>]*?numFmtId="(\d+)"', xfs.group(1) if xfs else b'')):
+                id = int(id)
+                code = re_sub(rb'"[^"]*"|\[[^\]]*\]', b'', formats.get(id, b'')).lower()
+                if id in _xlsx_date_ids or any(char in code for char in (b'y', b'd', b'h', b's')):
+                    dates.add(idx)
+        epoch = date(1904, 1, 1) if re_search(rb'date1904="(1|true)"', workbook) else date(1899, 12, 30)
+        cells = _xlsx_cell.findall(book.read(sheet))
+    
+    width = len(header)
+    if len(cells) < width or len(cells) % width:
+        raise ValueError(f"{file} does not fit the schema")
+    rows, frame, texts = len(cells) // width - 1, {}, {}
+    for idx, name in enumerate(header):
+        column = cells[width + idx :: width]
+        if {cell[0] for cell in column} - {chr(65 + idx).encode()}:
+            raise ValueError(f"{file} does not fit the schema in {name}")
+        types = {cell[2] for cell in column}
+        if types <= {b'', b'n'}:
+            values = [cell[3] or _xlsx_value(cell[5]) for cell in column]
+            if b'' in values:
+                raise ValueError(f"{file} has empty cells in {name}")
+            values = array(values).astype(float64) if rows else zeros(0, dtype = float64)
+            styles = {int(cell[1] or 0) in dates for cell in column}
+            if len(styles) > 1:
+                raise ValueError(f"{file} has mixed formats in {name}")
+            elif not styles or styles == {False}:
+                frame[name] = values.astype(int64) if (values == values.round()).all() else values
+            elif name == 'date_flight':
+                if (values != values.round()).any():
+                    raise ValueError(f"{file} has datetimes in {name}")
+                frame[name] = values.astype(int64) + epoch.toordinal()
+            else:
+                frame[name] = array([_xlsx_datetime(value, epoch) for value in values.tolist()], dtype = object)
+        elif types <= {b's', b'inlineStr', b'str'}:
+            values = []
+            for cell in column:
+                raw = cell[3] if cell[2] != b'inlineStr' else cell[4] or _xlsx_value(cell[5])
+                if (cell[2], raw) not in texts:
+                    text = shared[int(raw)] if cell[2] == b's' else raw.decode()
+                    texts[cell[2], raw] = unescape(text) if '&' in text else text
+                values.append(texts[cell[2], raw])
+            if '' in values:
+                raise ValueError(f"{file} has empty cells in {name}")
+            frame[name] = array(values, dtype = object)
+        else:
+            raise ValueError(f"{file} has unsupported or mixed types in {name}")
+    return frame
+
+def _xlsx_value(content: bytes) -> bytes:
+    '''Value of a cell not in plain `<v>` or `<is><t>`, e.g. formulas or rich texts'''
+    return b''.join(_xlsx_text.findall(content)) if content else b''
+
+@lru_cache(maxsize = 4096)
+def _xlsx_datetime(value: float, epoch: date) -> date | time | datetime:
+    '''Convert an excel serial in the same way as openpyxl'''
+    if 0 <= value < 1:
+        value = timedelta(days = value)
+        minutes, seconds = divmod(value.seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        return time(hours, minutes, seconds, value.microseconds)
+    moment = datetime.combine(epoch, time()) + timedelta(days = value)
+    return moment.date() if value == int(value) else moment
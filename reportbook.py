@@ -0,0 +1,226 @@
+__all__ = ('ReportBook', 'ReportSheet', 'ShardWriter', 'styles', 'write_book')
+
+from concurrent.futures import Future, ProcessPoolExecutor
+from copy import copy
+from os import cpu_count
+from typing import Iterable
+from openpyxl import Workbook
+from openpyxl.cell import Cell
+from openpyxl.formatting.rule import Rule
+from openpyxl.styles import Font, Alignment, NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import range_boundaries
+from openpyxl.worksheet.hyperlink import Hyperlink
+from pathlib import Path
+
+def _style(name: str, link: bool = False, bold: bool = False,
+           center: bool = False, number_format: str = 'General') -> NamedStyle:
+    font = Font(u = "single", color = "0070C0", bold = bold) if link else \
+        Font(bold = True) if bold else copy(DEFAULT_FONT)
+    return NamedStyle(name, font = font, number_format = number_format,
+                      alignment = Alignment("center", "center") if center else Alignment())
+
+'''Named styles registered in each workbook (a `NamedStyle` is bound to one), 
+cells refer to them by name'''
+styles = {
+    'bold': {'bold': True}, 
+    'header': {'bold': True, 'center': True}, 
+    'center': {'center': True}, 
+    'link': {'link': True}, 
+    'link_center': {'link': True, 'center': True}, 
+    'link_header': {'link': True, 'bold': True, 'center': True}, 
+    'date': {'number_format': "mm\"-\"dd"}, 
+    'date_center': {'center': True, 'number_format': "mm\"-\"dd"}, 
+    'date_header': {'bold': True, 'center': True, 'number_format': "mm\"-\"dd"}, 
+    'date_link': {'link': True, 'center': True, 'number_format': "mm\"-\"dd"}, 
+    'percent': {'number_format': "0.00%"}}
+
+class ReportBook():
+    '''
+    Report workbook
+    =====
+    Workbook in write-only mode: rows of each sheet are streamed to a temporary file
+    as they are appended, instead of kept as cells until saved.
+
+    - Styles of `styles` are registered once, cells are created in their style arrays by name.
+    - Sheets are in the order of creation, whenever their rows are appended,
+    e.g. an index sheet created first and appended last.
+
+    Parameters
+    -----
+    - index: `str`, title of the index sheet linked back from sheets (see `ReportSheet.append`),
+    not created by the book.
+    - files: `dict`, file names of sheets in other excels by title (e.g. shards of a report
+    and their index), links to them are written to the files.
+    '''
+    def __init__(self, index: str = '', files: dict[str, str] = {}) -> None:
+        self.workbook = Workbook(write_only = True)
+        self.index = index
+        self.files = files
+        self.styles = {}
+        for name, style in styles.items():
+            style = _style(name, **style)
+            self.workbook.add_named_style(style)
+            self.styles[name] = style.as_tuple()
+
+    def sheet(self, title: str, freeze: str = None, widths: dict[str, float] = {},
+              filter: str = None) -> 'ReportSheet':
+        '''Create a sheet at the end of the book, see `ReportSheet`'''
+        return ReportSheet(self, title, freeze, widths, filter)
+
+    def write(self, title: str, rows: Iterable[tuple] = (), formats: Iterable[tuple[str, Iterable[Rule]]] = (),
+              freeze: str = None, widths: dict[str, float] = {}, filter: str = None) -> 'ReportSheet':
+        '''Write a whole sheet and close it: `rows` of arguments of `ReportSheet.append`
+        and `formats` of arguments of `ReportSheet.format`, e.g. a sheet built in another process'''
+        ws = self.sheet(title, freeze, widths, filter)
+        for row in rows:
+            ws.append(*row)
+        for ref, rules in formats:
+            ws.format(ref, *rules)
+        ws.close()
+        return ws
+
+    def save(self, path: Path | str) -> Path:
+        '''Close all sheets and write the excel, the book cannot be saved again'''
+        self.workbook.save(path)
+        self.workbook.close()
+        return Path(path)
+
+class ReportSheet():
+    '''
+    Report sheet
+    =====
+    Sheet of a `ReportBook` written row by row.
+    Panes, widths and the filter are set on creation, before any row is written.
+
+    Parameters
+    -----
+    - book: `ReportBook`
+    - title: `str`, title of the sheet, renamed by `openpyxl` if used (see `title`)
+    - freeze: `str`, top left cell of the unfrozen pane, e.g. `B2`
+    - widths: `dict`, widths of columns by letter
+    - filter: `str`, range of the auto filter, e.g. `A1:F1`
+    '''
+    def __init__(self, book: ReportBook, title: str, freeze: str = None,
+                 widths: dict[str, float] = {}, filter: str = None) -> None:
+        self.book = book
+        self.ws = book.workbook.create_sheet(title)
+        self.ws.freeze_panes = freeze
+        for column, width in widths.items():
+            self.ws.column_dimensions[column].width = width
+        if filter:
+            self.ws.auto_filter.ref = filter
+        self.max_row, self.max_column = 0, 0
+
+    @property
+    def title(self) -> str:
+        return self.ws.title
+
+    def append(self, values: Iterable, styles: str | Iterable[str | None] | dict[int, str] | None = None,
+               links: dict[int, str] = {}, hidden: bool = False) -> int:
+        '''
+        Append a row of `values`
+        -----
+        - styles: name of a style for all cells, or names by column (`dict` or sequence from column 1)
+        - links: locations by column (from 1), `'sheet'!A1` in the book (or in the file of
+        the sheet in `ReportBook.files`), `file.xlsx#'sheet'!A1` in another excel, or `None` 
+        for the index sheet; linked cells are in style `link` unless styled
+        - hidden: hide the row
+
+        Return the number of the row.
+        '''
+        values = list(values)
+        self.max_row += 1
+        self.max_column = max(self.max_column, len(values))
+        if isinstance(styles, str) or styles is None:
+            styles = {} if styles is None else dict.fromkeys(range(1, len(values) + 1), styles)
+        elif not isinstance(styles, dict):
+            styles = {idx: style for idx, style in enumerate(styles, 1) if style}
+        if hidden:
+            self.ws.row_dimensions[self.max_row].hidden = True
+        if not styles and not links:
+            self.ws.append(values)
+            return self.max_row
+
+        for idx in range(len(values), max((*styles.keys(), *links.keys()))):
+            values.append(None)
+        row = []
+        for idx, value in enumerate(values, 1):
+            style, link = styles.get(idx), links.get(idx, False)
+            if style is None and link is False:
+                row.append(value)
+                continue
+            cell = Cell(self.ws, self.max_row, idx, value, self.book.styles[style or 'link'])
+            if link is not False:
+                link = f"'{self.book.index}'!A1" if link is None else link
+                file, _, location = link.rpartition('#')
+                if not file:
+                    file = self.book.files.get(location.rpartition('!')[0].strip("'"), '')
+                cell.hyperlink = Hyperlink(cell.coordinate, location = location) if not file else \
+                    Hyperlink(cell.coordinate, target = f"{file}#{location}")
+            row.append(cell)
+        self.ws.append(row)
+        return self.max_row
+
+    def format(self, ref: str, *rules: Rule) -> None:
+        '''Add conditional formatting `rules` to the range `ref`, 
+        nothing if the range is empty (e.g. rows from 2 of a sheet of only the title row)'''
+        min_col, min_row, max_col, max_row = range_boundaries(ref)
+        if min_col > max_col or min_row > max_row:
+            return
+        for rule in rules:
+            self.ws.conditional_formatting.add(ref, rule)
+
+    def close(self) -> None:
+        '''Finish the sheet and release its temporary file, no rows can be appended'''
+        if not self.ws.closed:
+            self.ws.close()
+
+def write_book(path: Path | str, index: str, files: dict[str, str], sheets: Iterable[dict]) -> Path:
+    '''Write an excel of `sheets` (keyword arguments of `ReportBook.write`) at once,
+    e.g. a shard of a report written in a process.
+
+    Return the path of the excel.'''
+    book = ReportBook(index, files)
+    for sheet in sheets:
+        book.write(**sheet)
+    return book.save(path)
+
+class ShardWriter():
+    '''
+    Shard writer
+    =====
+    Excels of a sharded report (see `write_book`), each submitted as soon as its sheets are built
+    and written in one of `workers` processes while the next is being built, 
+    or at once in this process if `workers` <= 1.
+
+    Parameters
+    -----
+    - workers: `int`, number of processes, `-1` for all cores.
+    '''
+    def __init__(self, workers: int = 0) -> None:
+        if workers < 0:
+            workers = cpu_count() or 1
+        self.executor = ProcessPoolExecutor(workers) if workers > 1 else None
+        self.futures: list[Future] = []
+        self.paths: list[Path] = []
+
+    def submit(self, path: Path | str, index: str, files: dict[str, str], sheets: list[dict]) -> None:
+        '''Write an excel of `sheets`, see `write_book`'''
+        if self.executor is None:
+            self.paths.append(write_book(path, index, files, sheets))
+        else:
+            self.futures.append(self.executor.submit(write_book, path, index, files, sheets))
+
+    def wait(self) -> list[Path]:
+        '''Wait for all excels submitted and shut the processes down.
+
+        Return paths of the excels in the order submitted.'''
+        try:
+            for future in self.futures:
+                self.paths.append(future.result())
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(cancel_futures = True)
+            self.futures = []
+        return self.paths
@@ -0,0 +1,88 @@
+from datetime import date
+from json import loads
+from socket import create_connection
+from types import SimpleNamespace
+from pandas import read_csv
+import pytest
+from coordinator import Coordinator, LeaseQueue, QueueClient, QueueServer
+
+KEYS = ['CAN-PEK 2022-03-29', 'PEK-CAN 2022-03-29', 'CAN-PEK 2022-03-30']
+ROW = ['2022-03-29', '星期二', '南方航空', '中', '广州', '北京首都', '08:00:00', '11:15:00', 1020, 0.4]
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = LeaseQueue(tmp_path / 'queue.db', attempts = 2)
+    yield queue
+    queue.close()
+
+@pytest.fixture
+def served(queue):
+    '''The queue served on localhost and a client of it'''
+    server = QueueServer(queue, '127.0.0.1', 0)
+    server.start()
+    client = QueueClient(*server.server_address, timeout = 5)
+    yield client
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture(params = ['local', 'served'])
+def client(request, queue):
+    return queue if request.param == 'local' else request.getfixturevalue('served')
+
+def test_claim_renew_complete_release(client):
+    assert client.put(KEYS) == 3
+    assert client.put(KEYS[:1]) == 0
+    keys = client.claim('a', 2, 60)
+    assert keys == KEYS[:2]
+    assert client.claim('b', 5, 60) == KEYS[2:]
+    assert client.claim('b', 5, 60) == []
+    assert client.status() == {'leased': 3}
+
+    assert client.renew('a', keys, 60) == 2
+    assert client.renew('b', keys, 60) == 0     # Not held by `b`
+    assert client.complete('a', keys[0], [ROW + [keys[0]]])
+    assert not client.complete('b', keys[1], [])
+    assert client.release('a', [keys[1]]) == 1
+    assert client.status() == {'done': 1, 'queued': 1, 'leased': 1}
+
+    assert client.claim('b', 5, 60) == keys[1:2]
+    assert client.release('b', [keys[1]]) == 1  # The second release of 2 attempts
+    assert client.status() == {'done': 1, 'failed': 1, 'leased': 1}
+
+    results = client.fetch(0, 10)
+    assert [(key, rows) for _, key, rows in results] == [(keys[0], [ROW + [keys[0]]])]
+    assert client.ack(results[-1][0]) == 1
+    assert client.fetch(0, 10) == []
+
+def test_expired_lease_requeued(client):
+    client.put(KEYS[:1])
+    assert client.claim('a', 1, -1) == KEYS[:1]  # Expired at once
+    assert client.claim('b', 1, -1) == KEYS[:1]
+    assert not client.complete('a', KEYS[0], [])
+    assert client.status() == {'leased': 1}
+    assert client.claim('c', 1, 60) == []       # Expired twice of 2 attempts
+    assert client.status() == {'failed': 1}
+
+def test_server_errors(queue, served):
+    with create_connection(served.address, 5) as sock, sock.makefile('rwb') as file:
+        file.write(b'{"method": "close"}\n{"method": "claim", "args": []}\n')
+        file.flush()
+        assert 'Unknown method' in loads(file.readline())['error']
+        assert loads(file.readline())['error'].startswith('TypeError')
+    assert served.status() == {}
+
+def test_drain(tmp_path, queue, served):
+    route = SimpleNamespace(format = lambda: 'CAN-PEK')
+    collector = SimpleNamespace(itineraries = [(date(2022, 3, 29), route), (date(2022, 3, 30), route)])
+    coordinator = Coordinator(collector, queue)
+    keys = served.claim('a', 5, 60)
+    assert sorted(keys) == ['CAN-PEK 2022-03-29', 'CAN-PEK 2022-03-30']
+    assert served.complete('a', keys[0], [ROW + [keys[0]], ROW + [keys[0]]])
+    assert served.complete('a', keys[1], [])
+
+    assert coordinator.drain(tmp_path / 'temp.csv', interval = 0.1) == 2
+    data = read_csv(tmp_path / 'temp.csv')
+    assert list(data.columns) == Coordinator.header
+    assert len(data) == 2 and set(data['itinerary']) == {keys[0]}
+    assert queue.fetch() == []